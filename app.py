@@ -9,6 +9,10 @@ app = Flask(__name__,
 # Chave secreta para sessoes
 app.secret_key = 'etiqueta-sistema-2025-chave-secreta'
 
+# JSON mais rapido nas respostas da API (orjson, se instalado)
+from lib.backend.json_rapido import configurar_json
+configurar_json(app)
+
 # Registrar blueprints
 from lib.backend.industria.routes import etiqueta_bp
 from lib.backend.recebimento.routes import recebimento_bp
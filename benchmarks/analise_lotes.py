@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Tempo das analises do painel de lotes (estoque por item, vencimento por
+semana, recebimento por dia) sobre lotes sinteticos.
+
+Mede separadamente a carga dos lotes nos arrays NumPy (feita uma vez por
+versao dos dados) e as agregacoes.
+
+Uso:
+    python benchmarks/analise_lotes.py [quantidade]
+"""
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.backend.recebimento.analise import (  # noqa: E402
+    ArraysLotes,
+    estoque_por_item,
+    recebimento_por_dia,
+    vencimento_por_semana
+)
+
+
+def sinteticos(quantidade):
+    """Lotes no formato do lotes.json: ~8 mil itens, validades em ~3 anos"""
+    aleatorio = random.Random(42)
+    inicio = date(2025, 1, 1)
+    datas = [(inicio + timedelta(days=d)).isoformat() for d in range(1100)]
+    return [
+        {
+            'id': i + 1,
+            'numero_lote': str(i),
+            'id_item': str(aleatorio.randint(1000, 9000)),
+            'data_recebimento': aleatorio.choice(datas[:400]),
+            'data_fabricacao': None,
+            'data_validade': aleatorio.choice(datas),
+            'quantidade': float(aleatorio.randint(1, 5000)),
+            'numero_nota_fiscal': str(aleatorio.randint(1, 50000)),
+            'dt_cadastro': '2025-01-01 08:00:00'
+        }
+        for i in range(quantidade)
+    ]
+
+
+def medir(funcao, repeticoes):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        resultado = funcao()
+    return (time.perf_counter() - inicio) / repeticoes * 1000, resultado
+
+
+def main(quantidade=1000000):
+    lotes = sinteticos(quantidade)
+    carga, arrays = medir(lambda: ArraysLotes(lotes), 1)
+    print(f"{quantidade} lotes; carga nos arrays: {carga:.0f} ms")
+    print(f"{'agregacao':<24}{'ms':>8}{'grupos':>9}")
+    total = 0
+    for nome, funcao in (('estoque_por_item', estoque_por_item),
+                         ('vencimento_por_semana', vencimento_por_semana),
+                         ('recebimento_por_dia', recebimento_por_dia)):
+        tempo, resultado = medir(lambda: funcao(arrays), 5)
+        total += tempo
+        print(f"{nome:<24}{tempo:>8.1f}{len(resultado):>9}")
+    print(f"{'total':<24}{total:>8.1f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
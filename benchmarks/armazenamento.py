@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Compara os backends de armazenamento (json x journal x sqlite) com uma copia
+do catalogo de itens em um diretorio temporario.
+
+Uso:
+    python benchmarks/armazenamento.py [repeticoes]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.backend.armazenamento.json_backend import ArmazenamentoJson  # noqa: E402
+from lib.backend.armazenamento.journal import Journal  # noqa: E402
+from lib.backend.armazenamento.sqlite_backend import ArmazenamentoSqlite  # noqa: E402
+from lib.backend.itens.service import ITENS_FILE  # noqa: E402
+
+
+def cronometrar(funcao, repeticoes):
+    inicio = time.perf_counter()
+    for i in range(repeticoes):
+        funcao(i)
+    return (time.perf_counter() - inicio) / repeticoes * 1000
+
+
+def main(repeticoes=200):
+    diretorio = tempfile.mkdtemp(prefix='bench_armazenamento_')
+    try:
+        caminho_json = os.path.join(diretorio, 'itens.json')
+        shutil.copy(ITENS_FILE, caminho_json)
+
+        sqlite = ArmazenamentoSqlite(os.path.join(diretorio, 'itens.db'), 'itens', 'proximo_id')
+        sqlite.substituir(ArmazenamentoJson(caminho_json, 'itens', 'proximo_id').carregar())
+
+        backends = {
+            'json': ArmazenamentoJson(caminho_json, 'itens', 'proximo_id'),
+            'journal': Journal(caminho_json, os.path.join(diretorio, 'itens.journal'), 'itens', 'proximo_id'),
+            'sqlite': sqlite,
+        }
+
+        numeros = [item['numero_item'] for item in backends['json'].listar()[:repeticoes]]
+        print(f"{'backend':<10}{'carregar':>12}{'buscar_por':>14}{'inserir':>12}{'salvar':>12}   (ms/op)")
+        for nome, backend in backends.items():
+            carregar = cronometrar(lambda i: backend.carregar(), 1)
+            buscar = cronometrar(lambda i: backend.buscar_por('numero_item', numeros[i % len(numeros)]), repeticoes)
+            novos = []
+            inserir = cronometrar(lambda i: novos.append(backend.inserir(
+                {'id': None, 'numero_item': f'BENCH{i}', 'descricao': 'BENCH', 'unidade_medida': 'UN'})), repeticoes)
+            salvar = cronometrar(lambda i: backend.salvar(dict(novos[i], descricao='BENCH ALTERADO')), repeticoes)
+            print(f"{nome:<10}{carregar:>12.3f}{buscar:>14.3f}{inserir:>12.3f}{salvar:>12.3f}")
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
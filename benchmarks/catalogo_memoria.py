@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Memoria do catalogo de itens por item: um dict por item (formato lido do
+JSON, como o catalogo guardava antes) contra as colunas compactas
+(ColunasItens) mais o indice por numero.
+
+Mede com tracemalloc a partir dos registros ja lidos do JSON. Alem do
+catalogo real, repete com um catalogo sintetico do tamanho informado
+(descricoes sorteadas entre as reais).
+
+Uso:
+    python benchmarks/catalogo_memoria.py [quantidade_sintetica]
+"""
+import json
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.backend.itens.colunar import ColunasItens  # noqa: E402
+from lib.backend.itens.service import ITENS_FILE  # noqa: E402
+
+
+def medir(montar):
+    """Bytes alocados (e mantidos) por montar()"""
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    estrutura = montar()
+    depois = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del estrutura
+    return depois - antes
+
+
+def como_dicts(texto_json):
+    """Formato antigo: dicts do JSON + indices por id e por numero"""
+    itens = json.loads(texto_json)['itens']
+    por_id = {item['id']: item for item in itens}
+    por_numero = {}
+    for item in itens:
+        por_numero.setdefault(item['numero_item'], item)
+    return itens, por_id, por_numero
+
+
+def como_colunas(texto_json):
+    """Formato novo: colunas + indice numero -> posicao (os dicts lidos sao descartados)"""
+    colunas = ColunasItens(json.loads(texto_json)['itens'])
+    por_numero = {}
+    for pos in colunas.posicoes():
+        por_numero.setdefault(colunas.numeros[pos], pos)
+    return colunas, por_numero
+
+
+def sintetico(itens, quantidade):
+    """Catalogo com `quantidade` itens no formato do itens.json"""
+    aleatorio = random.Random(42)
+    return json.dumps({'itens': [
+        {
+            'id': i + 1,
+            'numero_item': str(100000 + i),
+            'descricao': aleatorio.choice(itens)['descricao'],
+            'unidade_medida': aleatorio.choice(itens)['unidade_medida']
+        }
+        for i in range(quantidade)
+    ]}, ensure_ascii=False)
+
+
+def main(quantidade=200000):
+    with open(ITENS_FILE, encoding='utf-8') as f:
+        texto_real = f.read()
+    itens = json.loads(texto_real)['itens']
+
+    print(f"{'catalogo':<12}{'itens':>9}{'dicts B/item':>15}{'colunas B/item':>17}{'reducao':>10}")
+    for nome, texto in (('itens.json', texto_real), ('sintetico', sintetico(itens, quantidade))):
+        total = len(json.loads(texto)['itens'])
+        antes = medir(lambda: como_dicts(texto)) / total
+        depois = medir(lambda: como_colunas(texto)) / total
+        print(f"{nome:<12}{total:>9}{antes:>15.0f}{depois:>17.0f}{antes / depois:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
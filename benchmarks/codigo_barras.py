@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Codigos de barras por segundo: ImageWriter do python-barcode contra o
+codificador e a rasterizacao de 1 bit proprios, sem cache, com as opcoes da
+etiqueta (sem texto) e da API (com texto).
+
+Uso:
+    python benchmarks/codigo_barras.py [quantidade]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.backend.industria.codigo_barras import (  # noqa: E402
+    OPCOES_API,
+    OPCOES_ETIQUETA,
+    renderizar_png,
+    renderizar_png_python_barcode,
+    renderizar_svg
+)
+
+
+def codigos(quantidade):
+    """DUN-14 e numeros de lote sinteticos"""
+    aleatorio = random.Random(42)
+    return [
+        ''.join(aleatorio.choice('0123456789') for _ in range(14)) if i % 2 == 0
+        else f'L{aleatorio.randint(2024, 2027)}-{aleatorio.randint(1, 9999):04d}'
+        for i in range(quantidade)
+    ]
+
+
+def medir(funcao, lista):
+    inicio = time.perf_counter()
+    tamanho = sum(len(funcao(codigo)) for codigo in lista)
+    tempo = time.perf_counter() - inicio
+    return len(lista) / tempo, tamanho / len(lista)
+
+
+def main(quantidade=500):
+    lista = codigos(quantidade)
+    print(f"{quantidade} codigos (metade DUN-14, metade lote)")
+    print(f"{'opcoes':<10}{'renderizador':<16}{'codigos/s':>11}{'bytes':>8}{'ganho':>8}")
+    for nome, opcoes in (('etiqueta', OPCOES_ETIQUETA), ('api', OPCOES_API)):
+        base, tamanho = medir(lambda codigo: renderizar_png_python_barcode('code128', codigo, opcoes), lista)
+        print(f"{nome:<10}{'python-barcode':<16}{base:>11.0f}{tamanho:>8.0f}{'':>8}")
+        proprio, tamanho = medir(lambda codigo: renderizar_png('code128', codigo, opcoes), lista)
+        print(f"{nome:<10}{'png 1 bit':<16}{proprio:>11.0f}{tamanho:>8.0f}{proprio / base:>7.1f}x")
+        if nome == 'etiqueta':
+            svg, tamanho = medir(lambda codigo: renderizar_svg('code128', codigo, opcoes), lista)
+            print(f"{nome:<10}{'svg':<16}{svg:>11.0f}{tamanho:>8.0f}{svg / base:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
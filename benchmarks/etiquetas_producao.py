@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Tempo e tamanho do PDF de uma producao: N produtos sinteticos (cada um com
+DUN-14 e lote proprios) com C copias cada, pelo mesmo caminho de
+/etiqueta/api/producao/pdf (sem buscar os produtos no cadastro).
+
+Uso:
+    python benchmarks/etiquetas_producao.py [produtos] [copias]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.backend.industria.etiqueta_pdf import gerar_pdf  # noqa: E402
+from lib.backend.industria.service import dados_etiqueta_produto  # noqa: E402
+
+
+def produtos(quantidade):
+    """Produtos sinteticos no formato do produtos.json"""
+    aleatorio = random.Random(42)
+    return [{
+        'numero': 1000 + i,
+        'descricao': f'PRODUTO DE LIMPEZA {i} FRAGRANCIA {aleatorio.randint(1, 99)} 3X5 LT',
+        'peso': f'{aleatorio.uniform(5, 20):.3f}',
+        'validade_meses': aleatorio.choice((6, 12, 24, 36)),
+        'cnpj': '60.881.229/0004-05',
+        'dun': ''.join(aleatorio.choice('0123456789') for _ in range(14))
+    } for i in range(quantidade)]
+
+
+def main(quantidade=30, copias=100):
+    configuracoes = {'largura': '100', 'altura': '75', 'tamanho_fonte': '8'}
+    inicio = time.perf_counter()
+    etiquetas = [(dados_etiqueta_produto(produto, f'L2026-{i:04d}', '2026-10-18'), copias)
+                 for i, produto in enumerate(produtos(quantidade))]
+    pdf = gerar_pdf(etiquetas, configuracoes)
+    tempo = time.perf_counter() - inicio
+    total = quantidade * copias
+    print(f"{quantidade} produtos x {copias} copias = {total} etiquetas")
+    print(f"{tempo:.2f}s ({total / tempo:.0f} etiquetas/s), {len(pdf) / 1024:.0f} KB "
+          f"({len(pdf) / total:.0f} bytes por etiqueta)")
+
+
+if __name__ == '__main__':
+    main(*(int(valor) for valor in sys.argv[1:3]))
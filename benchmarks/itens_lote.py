@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Compara a criacao de itens um a um (como o POST /itens/api/itens) com o lote
+(POST /itens/api/itens/batch) em cada backend, sobre uma copia do catalogo.
+
+Uso:
+    python benchmarks/itens_lote.py [quantidade]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.backend.armazenamento.json_backend import ArmazenamentoJson  # noqa: E402
+from lib.backend.armazenamento.journal import Journal  # noqa: E402
+from lib.backend.armazenamento.sqlite_backend import ArmazenamentoSqlite  # noqa: E402
+from lib.backend.itens.catalogo import CatalogoItens  # noqa: E402
+from lib.backend.itens.service import ITENS_FILE  # noqa: E402
+
+
+def main(quantidade=1000):
+    diretorio = tempfile.mkdtemp(prefix='bench_itens_lote_')
+    try:
+        caminho_json = os.path.join(diretorio, 'itens.json')
+        shutil.copy(ITENS_FILE, caminho_json)
+        dados = ArmazenamentoJson(caminho_json, 'itens', 'proximo_id').carregar()
+
+        print(f"{'backend':<10}{'um a um':>12}{'lote':>12}{'ganho':>10}   ({quantidade} itens, segundos)")
+        for nome in ('json', 'journal', 'sqlite'):
+            tempos = []
+            for modo in ('um a um', 'lote'):
+                prefixo = os.path.join(diretorio, f'{nome}_{modo.replace(" ", "_")}')
+                if nome == 'json':
+                    backend = ArmazenamentoJson(prefixo + '.json', 'itens', 'proximo_id')
+                elif nome == 'journal':
+                    backend = Journal(prefixo + '.json', prefixo + '.journal', 'itens', 'proximo_id')
+                else:
+                    backend = ArmazenamentoSqlite(prefixo + '.db', 'itens', 'proximo_id')
+                backend.substituir(dados)
+                catalogo = CatalogoItens(backend)
+
+                inicio = time.perf_counter()
+                if modo == 'um a um':
+                    for i in range(quantidade):
+                        catalogo.criar(f'LOTE{i}', 'ITEM DE TESTE', 'UN')
+                else:
+                    catalogo.executar_operacoes([
+                        {'op': 'create', 'numero_item': f'LOTE{i}', 'descricao': 'ITEM DE TESTE',
+                         'unidade_medida': 'UN'}
+                        for i in range(quantidade)
+                    ])
+                tempos.append(time.perf_counter() - inicio)
+            print(f"{nome:<10}{tempos[0]:>12.3f}{tempos[1]:>12.3f}{tempos[0] / tempos[1]:>9.0f}x")
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
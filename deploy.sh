@@ -7,19 +7,23 @@ echo "========================================"
 cd /var/www/lempay.online
 
 echo ""
-echo "[1/4] Atualizando codigo do Git..."
+echo "[1/5] Atualizando codigo do Git..."
 git pull origin main
 
 echo ""
-echo "[2/4] Instalando dependencias..."
+echo "[2/5] Instalando dependencias..."
 /var/www/lempay.online/venv/bin/pip install -r requirements.txt --quiet
 
 echo ""
-echo "[3/4] Ajustando permissoes..."
+echo "[3/5] Gerando snapshot do catalogo de itens..."
+/var/www/lempay.online/venv/bin/python -m lib.backend.itens.snapshot
+
+echo ""
+echo "[4/5] Ajustando permissoes..."
 chown -R www-data:www-data /var/www/lempay.online
 
 echo ""
-echo "[4/4] Reiniciando servicos..."
+echo "[5/5] Reiniciando servicos..."
 systemctl restart lempay
 systemctl reload nginx
 
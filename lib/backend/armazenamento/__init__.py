@@ -0,0 +1,34 @@
+# Modulo Armazenamento
+"""
+Backends de armazenamento usados pelos services de itens, produtos e lotes.
+
+O backend e escolhido pela variavel de ambiente ETIQUETA_ARMAZENAMENTO:
+'json' (padrao, arquivos em data/), 'sqlite' ou 'journal'.
+"""
+import os
+
+from lib.backend.armazenamento.base import Armazenamento, ConflitoVersao, versao_de
+from lib.backend.armazenamento.json_backend import ArmazenamentoJson
+from lib.backend.armazenamento.journal import Journal
+from lib.backend.armazenamento.sqlite_backend import ArmazenamentoSqlite
+
+ARMAZENAMENTO = os.environ.get('ETIQUETA_ARMAZENAMENTO', 'json')
+SQLITE_PATH = os.environ.get(
+    'ETIQUETA_SQLITE_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'etiqueta.db')
+)
+
+
+def criar_armazenamento(colecao, caminho_json, contador, tipo=None, limite_compactacao=1000):
+    """Cria o backend configurado para uma colecao"""
+    tipo = tipo or ARMAZENAMENTO
+
+    if tipo == 'sqlite':
+        os.makedirs(os.path.dirname(SQLITE_PATH), exist_ok=True)
+        return ArmazenamentoSqlite(SQLITE_PATH, colecao, contador)
+
+    if tipo == 'journal':
+        caminho_journal = os.path.splitext(caminho_json)[0] + '.journal'
+        return Journal(caminho_json, caminho_journal, colecao, contador, limite_compactacao)
+
+    return ArmazenamentoJson(caminho_json, colecao, contador)
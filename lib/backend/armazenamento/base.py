@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: so a trava entre threads de cada backend
+    fcntl = None
+
+
+class ConflitoVersao(Exception):
+    """O registro foi alterado por outra requisicao desde a versao informada"""
+
+    def __init__(self, registro):
+        super().__init__(f"Registro {registro['id']} esta na versao {versao_de(registro)}")
+        self.registro = registro
+
+
+class Armazenamento:
+    """
+    Interface comum dos backends de armazenamento.
+
+    Cada instancia guarda uma colecao (itens, produtos, lotes) cujos registros
+    sao dicts com um campo `id` inteiro. Os registros devolvidos sao
+    compartilhados com o cache do backend: para alterar, monte um dict novo
+    (ex: `dict(registro, campo=valor)`) e passe para `salvar`.
+
+    As gravacoes sao serializadas entre processos (varios workers do gunicorn)
+    e cada registro tem um campo `versao`, incrementado a cada `salvar`.
+    Depois de cada gravacao, `assinatura_antes`/`assinatura_depois` guardam a
+    assinatura vista dentro da trava antes e depois da escrita; quem mantem um
+    cache proprio usa isso para saber se outro processo gravou no meio.
+    """
+
+    def __init__(self, colecao, contador):
+        self.colecao = colecao
+        # Nome do contador no formato JSON ('proximo_id' ou 'ultimo_id')
+        self.contador = contador
+        self.assinatura_antes = None
+        self.assinatura_depois = None
+
+    def assinatura(self):
+        """Valor que muda sempre que os dados mudam (para invalidar caches)"""
+        raise NotImplementedError
+
+    def carregar(self):
+        """Retorna a colecao completa no formato do arquivo JSON"""
+        raise NotImplementedError
+
+    def substituir(self, dados):
+        """Substitui a colecao inteira (formato do arquivo JSON)"""
+        raise NotImplementedError
+
+    def listar(self):
+        """Lista todos os registros"""
+        return self.carregar()[self.colecao]
+
+    def buscar(self, registro_id):
+        """Busca um registro pelo ID"""
+        for registro in self.listar():
+            if registro['id'] == registro_id:
+                return registro
+        return None
+
+    def buscar_por(self, campo, valor):
+        """Busca o primeiro registro com campo == valor"""
+        for registro in self.listar():
+            if registro.get(campo) == valor:
+                return registro
+        return None
+
+    def inserir(self, registro):
+        """Atribui o proximo ID ao registro, grava e retorna o registro"""
+        raise NotImplementedError
+
+    def salvar(self, registro, versao_esperada=None):
+        """
+        Grava o registro completo de um ID ja existente e incrementa a versao.
+        Retorna None se o ID nao existir; levanta ConflitoVersao se
+        `versao_esperada` nao for a versao atual.
+        """
+        raise NotImplementedError
+
+    def remover(self, registro_id):
+        """Remove pelo ID; retorna o registro removido ou None"""
+        raise NotImplementedError
+
+    def liberar_cache(self):
+        """
+        Descarta a copia dos registros guardada para leitura (quem mantem os
+        dados em outro formato, como o catalogo de itens, chama depois de ler).
+        A proxima leitura ou gravacao volta a buscar os dados.
+        """
+
+    def aplicar(self, inserir=(), salvar=(), remover=()):
+        """
+        Varias alteracoes em uma unica gravacao.
+
+        `inserir` e uma lista de registros novos, `salvar` de pares
+        (registro, versao_esperada) e `remover` de IDs. Todas as versoes sao
+        conferidas antes de gravar: com ConflitoVersao nada e gravado.
+        Retorna (inseridos, salvos, removidos) na ordem recebida; em `salvos`
+        e `removidos` fica None para ID inexistente.
+        """
+        raise NotImplementedError
+
+
+def versao_de(registro):
+    """Versao do registro (registros anteriores ao versionamento contam como 1)"""
+    return registro.get('versao', 1)
+
+
+def nova_versao(registro, atual, versao_esperada=None):
+    """Confere a versao esperada e retorna o registro com a versao seguinte"""
+    if versao_esperada is not None and versao_de(atual) != versao_esperada:
+        raise ConflitoVersao(atual)
+    return dict(registro, versao=versao_de(atual) + 1)
+
+
+def preparar_lote(atuais, ultimo_id, inserir, salvar, remover):
+    """
+    Resolve um lote de alteracoes contra o estado atual (`atuais`: id ->
+    registro) sem gravar nada. Levanta ConflitoVersao antes de qualquer efeito.
+    Retorna (inseridos, salvos, removidos, ultimo_id).
+    """
+    salvos = []
+    for registro, versao_esperada in salvar:
+        atual = atuais.get(registro['id'])
+        salvos.append(None if atual is None else nova_versao(registro, atual, versao_esperada))
+
+    removidos = []
+    vistos = set()
+    for registro_id in remover:
+        atual = None if registro_id in vistos else atuais.get(registro_id)
+        vistos.add(registro_id)
+        removidos.append(atual)
+
+    inseridos = []
+    for registro in inserir:
+        ultimo_id += 1
+        registro['id'] = ultimo_id
+        registro['versao'] = 1
+        inseridos.append(registro)
+
+    return inseridos, salvos, removidos, ultimo_id
+
+
+def ler_ultimo_id(dados, contador):
+    """Le o contador do formato JSON como 'ultimo ID usado'"""
+    if contador == 'proximo_id':
+        return dados.get('proximo_id', 1) - 1
+    return dados.get(contador, 0)
+
+
+def montar_dados(colecao, registros, contador, ultimo_id):
+    """Monta a colecao no formato do arquivo JSON"""
+    if contador == 'proximo_id':
+        return {colecao: registros, 'proximo_id': ultimo_id + 1}
+    return {colecao: registros, contador: ultimo_id}
+
+
+def assinatura_arquivo(caminho):
+    """Retorna (inode, mtime, tamanho) do arquivo ou None se nao existir"""
+    try:
+        st = os.stat(caminho)
+    except FileNotFoundError:
+        return None
+    # O inode muda a cada gravacao atomica (arquivo novo + rename)
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def gravar_atomico(caminho, conteudo):
+    """Grava em um arquivo temporario e troca pelo original (rename atomico)"""
+    fd, temporario = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(caminho)),
+                                      prefix=os.path.basename(caminho) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(conteudo)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temporario, 0o644)
+        os.replace(temporario, caminho)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+
+
+@contextmanager
+def trava_arquivo(caminho, bloquear=True):
+    """
+    Trava exclusiva entre processos usando um arquivo auxiliar (flock).
+    Com bloquear=False, entrega False se outro processo ja tiver a trava.
+    """
+    if fcntl is None:
+        yield True
+        return
+
+    fd = os.open(caminho, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if bloquear else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+Armazenamento em journal (append-only).
+
+Cada criacao/alteracao e gravada como uma linha JSON no final do arquivo de
+journal, com fsync, em vez de reescrever o arquivo JSON inteiro. O estado em
+memoria e reconstruido lendo o snapshot (o proprio arquivo JSON, mesmo formato
+de sempre) e reaplicando o journal por cima.
+
+Os registros sao idempotentes (gravam o lote inteiro ou removem pelo id), entao
+reaplicar um trecho do journal mais de uma vez nao altera o resultado. Isso
+permite compactar em segundo plano sem parar as gravacoes: o snapshot novo e
+escrito com o estado ate um certo offset e depois o journal e reescrito so com
+o que veio depois dele. Uma linha truncada no final (queda no meio da gravacao)
+e ignorada na leitura e so e cortada do arquivo por quem grava, sob a trava.
+
+As gravacoes rodam sob uma trava de arquivo (<journal>.lock), entao varios
+processos podem anexar ao mesmo journal sem repetir IDs. So um processo
+compacta por vez (<journal>.compactacao.lock).
+"""
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+from lib.backend.armazenamento.base import (
+    Armazenamento,
+    assinatura_arquivo,
+    gravar_atomico,
+    ler_ultimo_id,
+    montar_dados,
+    nova_versao,
+    preparar_lote,
+    trava_arquivo
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Journal(Armazenamento):
+    """Colecao de registros persistida em snapshot + journal"""
+
+    def __init__(self, caminho_snapshot, caminho_journal, colecao, contador, limite_compactacao=1000):
+        super().__init__(colecao, contador)
+        self.caminho_snapshot = caminho_snapshot
+        self.caminho_journal = caminho_journal
+        self.caminho_trava = caminho_journal + '.lock'
+        self.limite_compactacao = limite_compactacao
+
+        self.lock = threading.RLock()
+        self._registros = {}
+        self._ultimo_id = 0
+        self._assinatura_snapshot = False
+        self._offset = 0
+        self._linhas_journal = 0
+        # Inode do journal lido e (inode, mtime, tamanho) visto antes da ultima leitura
+        self._inode_journal = None
+        self._assinatura_journal = False
+        self._compactando = False
+
+    # ========== LEITURA ==========
+
+    def _tamanho_journal(self):
+        try:
+            return os.stat(self.caminho_journal).st_size
+        except FileNotFoundError:
+            return 0
+
+    def _aplicar(self, registro):
+        """Aplica um registro do journal no estado em memoria"""
+        if registro['op'] == 'salvar':
+            dados = registro['dados']
+            self._registros[dados['id']] = dados
+            self._ultimo_id = max(self._ultimo_id, dados['id'])
+        elif registro['op'] == 'remover':
+            self._registros.pop(registro['id'], None)
+
+    def _reaplicar_journal(self):
+        """Reaplica o journal a partir do ultimo offset lido"""
+        try:
+            with open(self.caminho_journal, 'rb') as f:
+                self._inode_journal = os.fstat(f.fileno()).st_ino
+                f.seek(self._offset)
+                conteudo = f.read()
+        except FileNotFoundError:
+            self._inode_journal = None
+            return
+
+        for linha in conteudo.splitlines(keepends=True):
+            if not linha.endswith(b'\n'):
+                # Linha incompleta (gravacao em andamento ou interrompida)
+                break
+            try:
+                registro = json.loads(linha)
+            except ValueError:
+                break
+            self._aplicar(registro)
+            self._offset += len(linha)
+            self._linhas_journal += 1
+
+    def _recarregar(self, assinatura_snapshot):
+        """Reconstroi o estado a partir do snapshot + journal"""
+        if assinatura_snapshot is None:
+            dados = montar_dados(self.colecao, [], self.contador, 0)
+        else:
+            with open(self.caminho_snapshot, 'r', encoding='utf-8') as f:
+                dados = json.load(f)
+
+        self._registros = {r['id']: r for r in dados.get(self.colecao, [])}
+        self._ultimo_id = ler_ultimo_id(dados, self.contador)
+        self._assinatura_snapshot = assinatura_snapshot
+        self._offset = 0
+        self._linhas_journal = 0
+        self._assinatura_journal = False
+        self._reaplicar_journal()
+
+    def _descartar_final_incompleto(self):
+        """
+        Corta o resto de uma gravacao interrompida para que os proximos
+        registros nao sejam anexados depois de uma linha corrompida. So dentro
+        de _escrita: com a trava de arquivo ninguem esta anexando, entao o que
+        passa do offset ja lido nao e uma linha em andamento.
+        """
+        if self._tamanho_journal() > self._offset:
+            with open(self.caminho_journal, 'r+b') as f:
+                f.truncate(self._offset)
+                os.fsync(f.fileno())
+
+    def _garantir_atualizado(self):
+        """Sincroniza o estado em memoria com os arquivos"""
+        assinatura = assinatura_arquivo(self.caminho_snapshot)
+        journal = assinatura_arquivo(self.caminho_journal)
+        if assinatura == self._assinatura_snapshot and journal == self._assinatura_journal:
+            return
+
+        with self.lock:
+            # Journal trocado (compactacao grava um arquivo novo, mesmo que do
+            # mesmo tamanho) ou menor que o ja lido: le tudo de novo
+            inode, tamanho = (journal[0], journal[2]) if journal is not None else (None, 0)
+            trocado = self._inode_journal is not None and inode != self._inode_journal
+            if assinatura != self._assinatura_snapshot or trocado or tamanho < self._offset:
+                self._recarregar(assinatura)
+            else:
+                self._reaplicar_journal()
+            # Visto antes da leitura: se algo foi anexado no meio, a proxima confere de novo
+            self._assinatura_journal = journal
+
+    # ========== CONSULTAS ==========
+
+    def assinatura(self):
+        return (assinatura_arquivo(self.caminho_snapshot), assinatura_arquivo(self.caminho_journal))
+
+    def carregar(self):
+        with self.lock:
+            self._garantir_atualizado()
+            return montar_dados(self.colecao, list(self._registros.values()), self.contador, self._ultimo_id)
+
+    def listar(self):
+        # Sob o lock: a compactacao e a releitura trocam/alteram o dict
+        with self.lock:
+            self._garantir_atualizado()
+            return list(self._registros.values())
+
+    def buscar(self, registro_id):
+        with self.lock:
+            self._garantir_atualizado()
+            return self._registros.get(registro_id)
+
+    # ========== GRAVACAO ==========
+
+    @contextmanager
+    def _escrita(self):
+        """Secao de escrita: trava entre threads e processos + estado atualizado"""
+        with self.lock, trava_arquivo(self.caminho_trava):
+            self._garantir_atualizado()
+            self._descartar_final_incompleto()
+            # Com as duas travas e a memoria em dia, os arquivos sao o estado em memoria
+            self.assinatura_antes = self.assinatura()
+            yield
+            self.assinatura_depois = self.assinatura()
+
+    def _anexar(self, *registros):
+        """Anexa registros ao journal com um unico fsync (chamar dentro de _escrita)"""
+        linhas = [(json.dumps(registro, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+                  for registro in registros]
+        conteudo = b''.join(linhas)
+        fd = os.open(self.caminho_journal, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            escrito = 0
+            while escrito < len(conteudo):
+                escrito += os.write(fd, conteudo[escrito:])
+            os.fsync(fd)
+            self._inode_journal = os.fstat(fd).st_ino
+        finally:
+            os.close(fd)
+
+        # Com a trava, ninguem mais anexou desde a ultima leitura: os registros
+        # terminam exatamente em offset + len(conteudo)
+        for registro in registros:
+            self._aplicar(registro)
+        self._offset += len(conteudo)
+        self._linhas_journal += len(linhas)
+        self._assinatura_journal = assinatura_arquivo(self.caminho_journal)
+
+        if self._linhas_journal >= self.limite_compactacao and not self._compactando:
+            self._compactando = True
+            threading.Thread(target=self._compactar, daemon=True).start()
+
+    def inserir(self, registro):
+        """Atribui o proximo ID ao registro e grava no journal"""
+        with self._escrita():
+            registro['id'] = self._ultimo_id + 1
+            registro['versao'] = 1
+            self._anexar({'op': 'salvar', 'dados': registro})
+            return registro
+
+    def salvar(self, registro, versao_esperada=None):
+        """Grava o registro inteiro de um ID ja existente no journal"""
+        with self._escrita():
+            atual = self._registros.get(registro['id'])
+            if atual is None:
+                return None
+            registro = nova_versao(registro, atual, versao_esperada)
+            self._anexar({'op': 'salvar', 'dados': registro})
+            return registro
+
+    def remover(self, registro_id):
+        """Remove um registro pelo ID"""
+        with self._escrita():
+            registro = self._registros.get(registro_id)
+            if registro is not None:
+                self._anexar({'op': 'remover', 'id': registro_id})
+            return registro
+
+    def aplicar(self, inserir=(), salvar=(), remover=()):
+        """Anexa todas as alteracoes ao journal de uma vez (um fsync so)"""
+        with self._escrita():
+            inseridos, salvos, removidos, _ = preparar_lote(
+                self._registros, self._ultimo_id, inserir, salvar, remover)
+            registros = [{'op': 'salvar', 'dados': registro} for registro in salvos if registro is not None]
+            registros += [{'op': 'remover', 'id': registro['id']} for registro in removidos if registro is not None]
+            registros += [{'op': 'salvar', 'dados': registro} for registro in inseridos]
+            if registros:
+                self._anexar(*registros)
+            return inseridos, salvos, removidos
+
+    def substituir(self, dados):
+        """Grava a colecao inteira como snapshot e zera o journal"""
+        with self._escrita():
+            conteudo = json.dumps(dados, ensure_ascii=False, indent=2).encode('utf-8')
+            gravar_atomico(self.caminho_snapshot, conteudo)
+            gravar_atomico(self.caminho_journal, b'')
+            self._recarregar(assinatura_arquivo(self.caminho_snapshot))
+
+    # ========== COMPACTACAO ==========
+
+    def _compactar(self):
+        """Grava um snapshot novo e descarta o trecho ja incorporado do journal"""
+        try:
+            with trava_arquivo(self.caminho_journal + '.compactacao.lock', bloquear=False) as travado:
+                if travado:
+                    self._compactar_travado()
+        except Exception:
+            # O journal continua valendo; a proxima gravacao tenta de novo
+            logger.exception('Erro ao compactar o journal %s', self.caminho_journal)
+        finally:
+            self._compactando = False
+
+    def _compactar_travado(self):
+        """Compactacao propriamente dita (somente um processo por vez)"""
+        with self._escrita():
+            if self._linhas_journal < self.limite_compactacao:
+                # Outro processo acabou de compactar
+                return
+            offset = self._offset
+            dados = montar_dados(self.colecao, list(self._registros.values()),
+                                 self.contador, self._ultimo_id)
+
+        # Snapshot fora da trava de escrita: gravacoes continuam indo para o
+        # journal. Os registros nunca sao alterados no lugar (salvar recebe um
+        # dict novo), entao a lista capturada acima continua consistente.
+        conteudo = json.dumps(dados, ensure_ascii=False, indent=2).encode('utf-8')
+        gravar_atomico(self.caminho_snapshot, conteudo)
+
+        with self._escrita():
+            with open(self.caminho_journal, 'rb') as f:
+                f.seek(offset)
+                resto = f.read()
+            gravar_atomico(self.caminho_journal, resto)
+
+            self._assinatura_snapshot = assinatura_arquivo(self.caminho_snapshot)
+            self._offset = 0
+            self._linhas_journal = 0
+            self._reaplicar_journal()
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+from contextlib import contextmanager
+
+from lib.backend.armazenamento.base import (
+    Armazenamento,
+    assinatura_arquivo,
+    gravar_atomico,
+    ler_ultimo_id,
+    montar_dados,
+    nova_versao,
+    preparar_lote,
+    trava_arquivo
+)
+
+
+class ArmazenamentoJson(Armazenamento):
+    """
+    Colecao guardada em um unico arquivo JSON, reescrito a cada alteracao.
+
+    Toda alteracao roda dentro de uma trava de arquivo (<arquivo>.lock), rele o
+    arquivo se outro processo o trocou e grava em arquivo temporario + rename,
+    entao varios workers podem gravar sem perder alteracoes nem repetir IDs.
+    """
+
+    def __init__(self, caminho, colecao, contador):
+        super().__init__(colecao, contador)
+        self.caminho = caminho
+        self.caminho_trava = caminho + '.lock'
+        self.lock = threading.RLock()
+        self._assinatura = False
+        self._registros = []
+        self._ultimo_id = 0
+
+    def assinatura(self):
+        return assinatura_arquivo(self.caminho)
+
+    def _garantir_atualizado(self):
+        """Rele o arquivo somente se ele mudou desde a ultima leitura"""
+        assinatura = self.assinatura()
+        if assinatura == self._assinatura:
+            return
+
+        with self.lock:
+            if assinatura is None:
+                dados = montar_dados(self.colecao, [], self.contador, 0)
+            else:
+                with open(self.caminho, 'r', encoding='utf-8') as f:
+                    dados = json.load(f)
+            self._registros = dados.get(self.colecao, [])
+            self._ultimo_id = ler_ultimo_id(dados, self.contador)
+            self._assinatura = assinatura
+
+    @contextmanager
+    def _escrita(self):
+        """Secao de escrita: trava entre threads e processos + dados atualizados"""
+        with self.lock, trava_arquivo(self.caminho_trava):
+            self._garantir_atualizado()
+            self.assinatura_antes = self._assinatura
+            yield
+            self.assinatura_depois = self._assinatura
+
+    def _gravar(self, registros, ultimo_id):
+        """Grava o novo estado; a memoria so muda se a gravacao der certo"""
+        dados = montar_dados(self.colecao, registros, self.contador, ultimo_id)
+        conteudo = json.dumps(dados, ensure_ascii=False, indent=2).encode('utf-8')
+        gravar_atomico(self.caminho, conteudo)
+        # Lista nova a cada gravacao: quem ja recebeu a anterior nao ve a alteracao
+        self._registros = registros
+        self._ultimo_id = ultimo_id
+        self._assinatura = self.assinatura()
+
+    def _posicao(self, registro_id):
+        for i, atual in enumerate(self._registros):
+            if atual['id'] == registro_id:
+                return i
+        return None
+
+    def liberar_cache(self):
+        with self.lock:
+            self._registros = []
+            self._assinatura = False
+
+    def carregar(self):
+        self._garantir_atualizado()
+        return montar_dados(self.colecao, self._registros, self.contador, self._ultimo_id)
+
+    def listar(self):
+        self._garantir_atualizado()
+        return self._registros
+
+    def substituir(self, dados):
+        with self._escrita():
+            self._gravar(list(dados.get(self.colecao, [])), ler_ultimo_id(dados, self.contador))
+
+    def inserir(self, registro):
+        with self._escrita():
+            registro['id'] = self._ultimo_id + 1
+            registro['versao'] = 1
+            self._gravar(self._registros + [registro], registro['id'])
+            return registro
+
+    def salvar(self, registro, versao_esperada=None):
+        with self._escrita():
+            i = self._posicao(registro['id'])
+            if i is None:
+                return None
+            registro = nova_versao(registro, self._registros[i], versao_esperada)
+            registros = list(self._registros)
+            registros[i] = registro
+            self._gravar(registros, self._ultimo_id)
+            return registro
+
+    def remover(self, registro_id):
+        with self._escrita():
+            i = self._posicao(registro_id)
+            if i is None:
+                return None
+            registros = list(self._registros)
+            removido = registros.pop(i)
+            self._gravar(registros, self._ultimo_id)
+            return removido
+
+    def aplicar(self, inserir=(), salvar=(), remover=()):
+        with self._escrita():
+            atuais = {registro['id']: registro for registro in self._registros}
+            inseridos, salvos, removidos, ultimo_id = preparar_lote(
+                atuais, self._ultimo_id, inserir, salvar, remover)
+            if not (inseridos or any(salvos) or any(removidos)):
+                return inseridos, salvos, removidos
+
+            trocados = {registro['id']: registro for registro in salvos if registro is not None}
+            excluidos = {registro['id'] for registro in removidos if registro is not None}
+            registros = [trocados.get(registro['id'], registro) for registro in self._registros
+                         if registro['id'] not in excluidos]
+            self._gravar(registros + inseridos, ultimo_id)
+            return inseridos, salvos, removidos
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Migracao unica dos arquivos JSON para o banco SQLite.
+
+Uso:
+    python -m lib.backend.armazenamento.migrar [caminho_do_banco]
+
+Le itens.json, produtos.json e lotes.json (incluindo um lotes.journal
+pendente, se houver) e grava as tres colecoes no banco, substituindo o que
+ja existir nele. Os arquivos JSON nao sao alterados.
+"""
+import os
+import sys
+
+from lib.backend.armazenamento import SQLITE_PATH
+from lib.backend.armazenamento.journal import Journal
+from lib.backend.armazenamento.sqlite_backend import ArmazenamentoSqlite
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(__file__))
+
+COLECOES = [
+    ('itens', os.path.join(BACKEND_DIR, 'itens', 'data', 'itens.json'), 'proximo_id'),
+    ('produtos', os.path.join(BACKEND_DIR, 'industria', 'data', 'produtos.json'), 'ultimo_id'),
+    ('lotes', os.path.join(BACKEND_DIR, 'recebimento', 'data', 'lotes.json'), 'ultimo_id'),
+]
+
+
+def migrar(caminho_sqlite=SQLITE_PATH):
+    """Copia todas as colecoes JSON para o SQLite; retorna {colecao: total}"""
+    os.makedirs(os.path.dirname(os.path.abspath(caminho_sqlite)), exist_ok=True)
+
+    totais = {}
+    for colecao, caminho_json, contador in COLECOES:
+        # O Journal le o snapshot JSON e reaplica um .journal pendente
+        origem = Journal(caminho_json, os.path.splitext(caminho_json)[0] + '.journal', colecao, contador)
+        dados = origem.carregar()
+
+        destino = ArmazenamentoSqlite(caminho_sqlite, colecao, contador)
+        destino.substituir(dados)
+        totais[colecao] = len(dados[colecao])
+
+    return totais
+
+
+if __name__ == '__main__':
+    caminho = sys.argv[1] if len(sys.argv) > 1 else SQLITE_PATH
+    for colecao, total in migrar(caminho).items():
+        print(f"{colecao}: {total} registros migrados")
+    print(f"Banco: {caminho}")
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Backend SQLite (modo WAL).
+
+Cada colecao vira uma tabela com o registro completo em JSON na coluna `dados`
+e copias dos campos de busca em colunas indexadas. Assim os registros mantem
+exatamente o formato dos arquivos JSON e as consultas por numero/dun/lote/
+validade usam indice.
+"""
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from lib.backend.armazenamento.base import (
+    Armazenamento,
+    ler_ultimo_id,
+    montar_dados,
+    nova_versao,
+    preparar_lote
+)
+
+# Colunas indexadas de cada colecao
+COLUNAS_INDEXADAS = {
+    'itens': ('numero_item',),
+    'produtos': ('numero', 'dun'),
+    'lotes': ('numero_lote', 'id_item', 'data_validade', 'dt_cadastro'),
+}
+
+_conexoes = threading.local()
+
+
+def obter_conexao(caminho):
+    """Retorna a conexao da thread atual para o banco (uma por thread)"""
+    por_caminho = getattr(_conexoes, 'por_caminho', None)
+    if por_caminho is None:
+        por_caminho = _conexoes.por_caminho = {}
+
+    conexao = por_caminho.get(caminho)
+    if conexao is None:
+        conexao = sqlite3.connect(caminho, timeout=10, isolation_level=None, cached_statements=256)
+        conexao.execute('PRAGMA journal_mode=WAL')
+        conexao.execute('PRAGMA synchronous=NORMAL')
+        conexao.execute('PRAGMA foreign_keys=ON')
+        por_caminho[caminho] = conexao
+    return conexao
+
+
+class ArmazenamentoSqlite(Armazenamento):
+    """Colecao guardada em uma tabela SQLite"""
+
+    def __init__(self, caminho, colecao, contador):
+        super().__init__(colecao, contador)
+        self.caminho = caminho
+        self.colunas = COLUNAS_INDEXADAS.get(colecao, ())
+        self._cache = (None, [])
+
+        # SQL montado uma unica vez; a execucao usa o cache de statements da conexao
+        nomes = ', '.join(('id',) + self.colunas + ('dados',))
+        marcadores = ', '.join('?' * (len(self.colunas) + 2))
+        self._sql_inserir = f'INSERT INTO {colecao} ({nomes}) VALUES ({marcadores})'
+        self._sql_salvar = f'INSERT OR REPLACE INTO {colecao} ({nomes}) VALUES ({marcadores})'
+        self._sql_listar = f'SELECT dados FROM {colecao} ORDER BY id'
+        self._sql_buscar = f'SELECT dados FROM {colecao} WHERE id = ?'
+        self._sql_remover = f'DELETE FROM {colecao} WHERE id = ?'
+
+        self._criar_tabela()
+
+    def _conexao(self):
+        return obter_conexao(self.caminho)
+
+    def _criar_tabela(self):
+        colunas = ''.join(f', {coluna}' for coluna in self.colunas)
+        # Comandos idempotentes, executados em modo autocommit
+        c = self._conexao()
+        c.execute(f'CREATE TABLE IF NOT EXISTS {self.colecao} (id INTEGER PRIMARY KEY{colunas}, dados TEXT NOT NULL)')
+        for coluna in self.colunas:
+            c.execute(f'CREATE INDEX IF NOT EXISTS idx_{self.colecao}_{coluna} ON {self.colecao} ({coluna})')
+        c.execute('CREATE TABLE IF NOT EXISTS contadores '
+                  '(colecao TEXT PRIMARY KEY, ultimo_id INTEGER NOT NULL, versao INTEGER NOT NULL)')
+        c.execute('INSERT OR IGNORE INTO contadores (colecao, ultimo_id, versao) VALUES (?, 0, 0)',
+                  (self.colecao,))
+
+    @contextmanager
+    def _transacao(self):
+        """Transacao de escrita (BEGIN IMMEDIATE serializa os escritores entre processos)"""
+        conexao = self._conexao()
+        conexao.execute('BEGIN IMMEDIATE')
+        try:
+            self.assinatura_antes = self.assinatura()
+            yield conexao
+            self.assinatura_depois = self.assinatura()
+        except BaseException:
+            conexao.execute('ROLLBACK')
+            raise
+        conexao.execute('COMMIT')
+
+    def _valores(self, registro):
+        return (registro['id'],) + tuple(registro.get(c) for c in self.colunas) + \
+            (json.dumps(registro, ensure_ascii=False),)
+
+    def _incrementar_versao(self, conexao):
+        conexao.execute('UPDATE contadores SET versao = versao + 1 WHERE colecao = ?', (self.colecao,))
+
+    # ========== CONSULTAS ==========
+
+    def assinatura(self):
+        linha = self._conexao().execute(
+            'SELECT versao FROM contadores WHERE colecao = ?', (self.colecao,)).fetchone()
+        return linha[0] if linha else None
+
+    def listar(self):
+        versao = self.assinatura()
+        if self._cache[0] != versao:
+            linhas = self._conexao().execute(self._sql_listar).fetchall()
+            self._cache = (versao, [json.loads(dados) for (dados,) in linhas])
+        return self._cache[1]
+
+    def liberar_cache(self):
+        self._cache = (None, [])
+
+    def carregar(self):
+        linha = self._conexao().execute(
+            'SELECT ultimo_id FROM contadores WHERE colecao = ?', (self.colecao,)).fetchone()
+        return montar_dados(self.colecao, self.listar(), self.contador, linha[0] if linha else 0)
+
+    def buscar(self, registro_id):
+        linha = self._conexao().execute(self._sql_buscar, (registro_id,)).fetchone()
+        return json.loads(linha[0]) if linha else None
+
+    def buscar_por(self, campo, valor):
+        if campo not in self.colunas:
+            return super().buscar_por(campo, valor)
+        linha = self._conexao().execute(
+            f'SELECT dados FROM {self.colecao} WHERE {campo} = ? ORDER BY id LIMIT 1', (valor,)).fetchone()
+        return json.loads(linha[0]) if linha else None
+
+    # ========== GRAVACAO ==========
+
+    def substituir(self, dados):
+        registros = dados.get(self.colecao, [])
+        with self._transacao() as c:
+            c.execute(f'DELETE FROM {self.colecao}')
+            c.executemany(self._sql_inserir, [self._valores(r) for r in registros])
+            c.execute('UPDATE contadores SET ultimo_id = ?, versao = versao + 1 WHERE colecao = ?',
+                      (ler_ultimo_id(dados, self.contador), self.colecao))
+
+    def inserir(self, registro):
+        with self._transacao() as c:
+            c.execute('UPDATE contadores SET ultimo_id = ultimo_id + 1, versao = versao + 1 WHERE colecao = ?',
+                      (self.colecao,))
+            registro['id'] = c.execute(
+                'SELECT ultimo_id FROM contadores WHERE colecao = ?', (self.colecao,)).fetchone()[0]
+            registro['versao'] = 1
+            c.execute(self._sql_inserir, self._valores(registro))
+        return registro
+
+    def salvar(self, registro, versao_esperada=None):
+        with self._transacao() as c:
+            linha = c.execute(self._sql_buscar, (registro['id'],)).fetchone()
+            if linha is None:
+                return None
+            registro = nova_versao(registro, json.loads(linha[0]), versao_esperada)
+            c.execute(self._sql_salvar, self._valores(registro))
+            self._incrementar_versao(c)
+        return registro
+
+    def remover(self, registro_id):
+        with self._transacao() as c:
+            linha = c.execute(self._sql_buscar, (registro_id,)).fetchone()
+            if linha is None:
+                return None
+            c.execute(self._sql_remover, (registro_id,))
+            self._incrementar_versao(c)
+        return json.loads(linha[0])
+
+    def aplicar(self, inserir=(), salvar=(), remover=()):
+        with self._transacao() as c:
+            ids = {registro['id'] for registro, _ in salvar} | set(remover)
+            atuais = {}
+            for registro_id in ids:
+                linha = c.execute(self._sql_buscar, (registro_id,)).fetchone()
+                if linha is not None:
+                    atuais[registro_id] = json.loads(linha[0])
+            ultimo_id = c.execute(
+                'SELECT ultimo_id FROM contadores WHERE colecao = ?', (self.colecao,)).fetchone()[0]
+
+            inseridos, salvos, removidos, ultimo_id = preparar_lote(
+                atuais, ultimo_id, inserir, salvar, remover)
+
+            c.executemany(self._sql_salvar, [self._valores(r) for r in salvos if r is not None])
+            c.executemany(self._sql_remover, [(r['id'],) for r in removidos if r is not None])
+            c.executemany(self._sql_inserir, [self._valores(r) for r in inseridos])
+            c.execute('UPDATE contadores SET ultimo_id = ?, versao = versao + 1 WHERE colecao = ?',
+                      (ultimo_id, self.colecao))
+        return inseridos, salvos, removidos
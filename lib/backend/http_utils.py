@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""Funcoes auxiliares de HTTP compartilhadas pelos blueprints"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask import Response, current_app, request
+from werkzeug.http import is_resource_modified
+
+from lib.backend.armazenamento import versao_de
+
+try:
+    import brotli
+except ImportError:  # opcional: sem ele as respostas usam so gzip
+    brotli = None
+
+# Corpos menores que isso nao compensam comprimir
+TAMANHO_MINIMO_COMPRESSAO = 1024
+LIMITE_RESPOSTAS_CACHE = 128
+
+
+def com_etag(response, registro):
+    """Adiciona o ETag da versao do registro na resposta"""
+    response.set_etag(str(versao_de(registro)))
+    return response
+
+
+def versao_if_match():
+    """
+    Le a versao esperada do cabecalho If-Match.
+
+    Retorna None se o cabecalho nao veio (ou veio como '*'): nesse caso a
+    gravacao nao confere versao. Um ETag que nao e uma versao valida vira -1,
+    que nunca confere e resulta em conflito.
+    """
+    if_match = request.if_match
+    if not if_match or if_match.star_tag:
+        return None
+    for etag in if_match.as_set():
+        return int(etag) if etag.isdigit() else -1
+    return None
+
+
+def escolher_codificacao(tamanho):
+    """Codificacao aceita pelo cliente para um corpo desse tamanho (ou None)"""
+    if tamanho < TAMANHO_MINIMO_COMPRESSAO:
+        return None
+    aceitas = request.accept_encodings
+    if brotli is not None and aceitas['br']:
+        return 'br'
+    if aceitas['gzip']:
+        return 'gzip'
+    return None
+
+
+def comprimir(corpo, codificacao):
+    if codificacao == 'br':
+        return brotli.compress(corpo, quality=5)
+    return gzip.compress(corpo, compresslevel=6)
+
+
+class CacheRespostas:
+    """
+    Respostas GET guardadas pela versao dos dados de origem.
+
+    A versao e a assinatura do armazenamento (muda a cada gravacao). Com ela
+    o ETag e montado sem gerar o corpo: se o cliente ja tem a versao atual a
+    resposta e 304 vazia. Senao o corpo (e cada versao comprimida dele, gerada
+    uma vez) sai do cache ate a proxima gravacao.
+    """
+
+    def __init__(self, limite=LIMITE_RESPOSTAS_CACHE):
+        self.limite = limite
+        self._lock = threading.Lock()
+        # url -> (versao, mimetype, corpo, {codificacao: corpo comprimido})
+        self._respostas = OrderedDict()
+        # fonte -> (versao, momento em que este processo viu a versao)
+        self._modificacoes = {}
+
+    def _modificado_em(self, fonte, versao):
+        with self._lock:
+            atual = self._modificacoes.get(fonte)
+            if atual is None or atual[0] != versao:
+                atual = (versao, datetime.now(timezone.utc).replace(microsecond=0))
+                self._modificacoes[fonte] = atual
+            return atual[1]
+
+    def responder(self, fonte, versao, gerar):
+        """
+        Resposta da URL atual para a `versao` dos dados de `fonte`.
+        `gerar()` monta a resposta normal da rota e so e chamada quando nao ha
+        corpo guardado para essa versao; respostas de erro nao sao guardadas.
+        """
+        url = request.full_path
+        etag = hashlib.blake2b(repr((fonte, versao, url)).encode('utf-8'), digest_size=12).hexdigest()
+        modificado_em = self._modificado_em(fonte, versao)
+
+        if not is_resource_modified(request.environ, etag=etag, last_modified=modificado_em):
+            return self._cabecalhos(Response(status=304), etag, modificado_em)
+
+        with self._lock:
+            entrada = self._respostas.get(url)
+            if entrada is not None and entrada[0] == versao:
+                self._respostas.move_to_end(url)
+            else:
+                entrada = None
+
+        if entrada is None:
+            resposta = current_app.make_response(gerar())
+            if resposta.status_code != 200:
+                return resposta
+            entrada = (versao, resposta.mimetype, resposta.get_data(), {})
+            with self._lock:
+                self._respostas[url] = entrada
+                self._respostas.move_to_end(url)
+                while len(self._respostas) > self.limite:
+                    self._respostas.popitem(last=False)
+
+        _, mimetype, corpo, comprimidos = entrada
+        codificacao = escolher_codificacao(len(corpo))
+        if codificacao is not None:
+            comprimido = comprimidos.get(codificacao)
+            if comprimido is None:
+                comprimido = comprimidos[codificacao] = comprimir(corpo, codificacao)
+            corpo = comprimido
+
+        resposta = Response(corpo, mimetype=mimetype)
+        if codificacao is not None:
+            resposta.headers['Content-Encoding'] = codificacao
+        return self._cabecalhos(resposta, etag, modificado_em)
+
+    @staticmethod
+    def _cabecalhos(resposta, etag, modificado_em):
+        resposta.set_etag(etag)
+        resposta.last_modified = modificado_em
+        resposta.vary.add('Accept-Encoding')
+        # O navegador guarda a resposta, mas sempre confere o ETag antes de usar
+        resposta.cache_control.no_cache = True
+        return resposta
+
+
+respostas = CacheRespostas()
@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+"""
+Geracao dos codigos de barras das etiquetas com cache em dois niveis.
+
+O padrao de modulos vem dos codificadores de simbologias.py (Code 128 e
+ITF-14) e vira:
+- PNG de 1 bit com paleta (fundo/barra): uma linha de pixels calculada com
+  NumPy e repetida na altura das barras, gravada direto com zlib (o texto
+  embaixo, quando pedido, e montado com os glifos da fonte, desenhados pelo
+  Pillow uma vez por caractere);
+- SVG vetorial: um unico <path> com as barras, poucas centenas de bytes,
+  nitido em qualquer resolucao de impressora.
+As opcoes sao as do ImageWriter do python-barcode (module_width, quiet_zone,
+dpi... em mm) e o tamanho da imagem e o mesmo; o python-barcode fica para as
+outras simbologias.
+
+A mesma imagem (simbologia, codigo, opcoes, formato) e pedida milhares de
+vezes por turno. A chave do cache e o sha256 desses valores:
+- memoria: LRU limitado por quantidade de imagens (uma consulta no dict);
+- disco: um arquivo por chave em data/codigos_barras/ (compartilhado pelos
+  workers e mantido entre reinicios), limitado em bytes; ao passar do limite
+  saem os arquivos usados ha mais tempo.
+"""
+import hashlib
+import io
+import json
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+
+import barcode
+import numpy as np
+from barcode.writer import ImageWriter
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+from lib.backend.armazenamento.base import gravar_atomico, trava_arquivo
+from lib.backend.industria.simbologias import CODIFICADORES, modulos
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), 'data', 'codigos_barras')
+LIMITE_MEMORIA = int(os.environ.get('CODIGO_BARRAS_CACHE_ITENS', '2048'))
+LIMITE_DISCO = int(os.environ.get('CODIGO_BARRAS_CACHE_MB', '64')) * 1024 * 1024
+# Depois de passar do limite o disco e reduzido ate esta fracao dele
+FRACAO_APOS_LIMPEZA = 0.8
+
+# Opcoes da etiqueta (gerar_etiqueta): sem texto, 300 dpi
+OPCOES_ETIQUETA = {
+    'module_width': 0.22,
+    'module_height': 7.0,
+    'quiet_zone': 2.5,
+    'font_size': 0,
+    'text_distance': 0,
+    'background': 'white',
+    'foreground': 'black',
+    'dpi': 300
+}
+
+# Opcoes da API /etiqueta/api/codigo-barras: com o texto embaixo
+OPCOES_API = {
+    'module_width': 0.2,
+    'module_height': 15.0,
+    'quiet_zone': 6.5,
+    'font_size': 10,
+    'text_distance': 5.0,
+    'background': 'white',
+    'foreground': 'black'
+}
+
+# Opcoes que podem ir na URL imutavel (/etiqueta/api/codigo-barras/<chave>.<formato>)
+PERFIS = {
+    'etiqueta': OPCOES_ETIQUETA,
+    'api': OPCOES_API
+}
+FORMATOS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml'
+}
+
+# Padroes do ImageWriter do python-barcode para as opcoes nao informadas
+OPCOES_PADRAO = {
+    'module_width': 0.2,
+    'module_height': 15.0,
+    'quiet_zone': 6.5,
+    'font_size': 10,
+    'text_distance': 5.0,
+    'background': 'white',
+    'foreground': 'black',
+    'dpi': 300,
+    'margin_top': 1,
+    'margin_bottom': 1
+}
+FONTE_TEXTO = os.path.join(os.path.dirname(barcode.__file__), 'fonts', 'DejaVuSansMono.ttf')
+# Nome no python-barcode das simbologias daqui
+SIMBOLOGIAS_PYTHON_BARCODE = {'itf14': 'itf'}
+# Entra na chave do cache: mudar quando a imagem gerada para as mesmas opcoes mudar
+VERSAO_RENDERIZACAO = 2
+
+
+def _px(mm, dpi):
+    return mm * dpi / 25.4
+
+
+def _pt_para_mm(pt):
+    return pt * 0.352777778
+
+
+def _bloco_png(tipo, dados):
+    return struct.pack('>I', len(dados)) + tipo + dados + struct.pack('>I', zlib.crc32(tipo + dados))
+
+
+@lru_cache(maxsize=8)
+def _fonte(pixels):
+    return ImageFont.truetype(FONTE_TEXTO, pixels)
+
+
+def _png_1bit(pixels, largura, altura, paleta, dpi):
+    """PNG com paleta de 2 cores e 1 bit por pixel (pixels: linhas ja filtradas e empacotadas)"""
+    dados = zlib.compress(pixels, 6)
+    pixels_por_metro = int(round(dpi / 0.0254))
+    return b''.join((
+        b'\x89PNG\r\n\x1a\n',
+        _bloco_png(b'IHDR', struct.pack('>IIBBBBB', largura, altura, 1, 3, 0, 0, 0)),
+        _bloco_png(b'PLTE', bytes(paleta[0]) + bytes(paleta[1])),
+        _bloco_png(b'pHYs', struct.pack('>IIB', pixels_por_metro, pixels_por_metro, 1)),
+        _bloco_png(b'IDAT', dados),
+        _bloco_png(b'IEND', b'')
+    ))
+
+
+def rasterizar_png(padrao, opcoes, texto=''):
+    """
+    PNG de 1 bit do padrao de modulos, com as dimensoes do ImageWriter.
+
+    Cada coluna de pixels recebe o modulo que cobre o centro dela, entao a
+    largura fisica e a mesma mesmo quando o modulo nao tem um numero inteiro
+    de pixels. A linha das barras e calculada uma vez e repetida.
+    """
+    opcoes = dict(OPCOES_PADRAO, **opcoes)
+    dpi = opcoes['dpi']
+    largura_modulo = opcoes['module_width']
+    margem = opcoes['quiet_zone']
+    tamanho_fonte = opcoes['font_size'] if texto else 0
+
+    altura_mm = opcoes['margin_top'] + opcoes['margin_bottom'] + opcoes['module_height']
+    if tamanho_fonte:
+        altura_mm += _pt_para_mm(tamanho_fonte) / 2 + opcoes['text_distance']
+    largura = int(_px(2 * margem + len(padrao) * largura_modulo, dpi))
+    altura = int(_px(altura_mm, dpi))
+    topo = int(_px(opcoes['margin_top'], dpi))
+    base = min(altura, int(_px(opcoes['margin_top'] + opcoes['module_height'], dpi)))
+
+    barras = np.frombuffer(padrao.encode('ascii'), np.uint8) == ord('1')
+    centros = (np.arange(largura) + 0.5) * 25.4 / dpi
+    modulo = np.floor((centros - margem) / largura_modulo).astype(np.int64)
+    dentro = (modulo >= 0) & (modulo < len(barras))
+    linha = np.zeros(largura, bool)
+    linha[dentro] = barras[modulo[dentro]]
+
+    paleta = (ImageColor.getrgb(opcoes['background'])[:3], ImageColor.getrgb(opcoes['foreground'])[:3])
+
+    if not tamanho_fonte:
+        # Cada linha do PNG: filtro 0 + pixels empacotados (8 por byte)
+        linha_barras = b'\x00' + np.packbits(linha).tobytes()
+        linha_vazia = bytes(len(linha_barras))
+        pixels = linha_vazia * topo + linha_barras * (base - topo) + linha_vazia * (altura - base)
+        return _png_1bit(pixels, largura, altura, paleta, dpi)
+
+    # Com texto: imagem inteira em memoria, com o texto montado dos glifos guardados
+    pixels = np.zeros((altura, largura), bool)
+    pixels[topo:base] = linha
+    pixels_fonte = int(_px(_pt_para_mm(tamanho_fonte), dpi))
+    if pixels_fonte > 0:
+        faixa = _texto_bitmap(texto, pixels_fonte)
+        # Mesmo posicionamento do ImageWriter: centralizado, parte de baixo em y
+        centro = _px(margem + len(padrao) * largura_modulo / 2, dpi)
+        y = _px(opcoes['margin_top'] + opcoes['module_height'] + opcoes['text_distance'], dpi)
+        _colar(pixels, faixa, int(round(centro - faixa.shape[1] / 2)), int(round(y)) - faixa.shape[0])
+    linhas = np.packbits(pixels, axis=1)
+    filtradas = np.hstack((np.zeros((altura, 1), np.uint8), linhas))
+    return _png_1bit(filtradas.tobytes(), largura, altura, paleta, dpi)
+
+
+def _colar(pixels, faixa, x, y):
+    """Marca em pixels os pontos de faixa com o canto em (x, y), cortando o que sair da imagem"""
+    altura, largura = pixels.shape
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + faixa.shape[1], largura), min(y + faixa.shape[0], altura)
+    if x0 < x1 and y0 < y1:
+        pixels[y0:y1, x0:x1] |= faixa[y0 - y:y1 - y, x0 - x:x1 - x]
+
+
+@lru_cache(maxsize=1024)
+def _glifo(caractere, pixels_fonte):
+    """Bitmap de 1 bit de um caractere (largura do avanco x altura da linha)"""
+    fonte = _fonte(pixels_fonte)
+    subida, descida = fonte.getmetrics()
+    imagem = Image.new('1', (max(1, int(round(fonte.getlength(caractere)))), subida + descida), 0)
+    ImageDraw.Draw(imagem).text((0, 0), caractere, font=fonte, fill=1, anchor='la')
+    return np.array(imagem, bool)
+
+
+def _texto_bitmap(texto, pixels_fonte):
+    """Faixa com o texto (fonte monoespacada: os glifos lado a lado)"""
+    return np.hstack([_glifo(caractere, pixels_fonte) for caractere in texto])
+
+
+def renderizar_png_python_barcode(simbologia, codigo, opcoes):
+    """Desenha o codigo com o ImageWriter do python-barcode"""
+    classe = barcode.get_barcode_class(SIMBOLOGIAS_PYTHON_BARCODE.get(simbologia, simbologia))
+    buffer = io.BytesIO()
+    classe(str(codigo), writer=ImageWriter()).write(buffer, options=dict(opcoes))
+    return buffer.getvalue()
+
+
+def renderizar_png(simbologia, codigo, opcoes):
+    """
+    PNG do codigo com o codificador e a rasterizacao daqui; as demais
+    simbologias do python-barcode passam pelo ImageWriter. Codigo invalido
+    para a simbologia levanta ValueError.
+    """
+    if simbologia not in CODIFICADORES:
+        return renderizar_png_python_barcode(simbologia, codigo, opcoes)
+    return rasterizar_png(modulos(simbologia, codigo), opcoes, str(codigo))
+
+
+def _numero(valor):
+    """Numero curto para o SVG (sem zeros sobrando)"""
+    return f'{valor:.3f}'.rstrip('0').rstrip('.')
+
+
+def renderizar_svg(simbologia, codigo, opcoes):
+    """
+    SVG do codigo com as barras em um unico path. No viewBox cada modulo tem
+    largura 1 e a barra altura 1 (esticada sem manter a proporcao); o tamanho
+    fisico vem de module_width/module_height/quiet_zone (mm). O texto do
+    codigo fica de fora (a etiqueta ja mostra embaixo).
+    """
+    padrao = modulos(simbologia, codigo)
+    largura_modulo = opcoes['module_width']
+    margem = opcoes['quiet_zone'] / largura_modulo
+    largura = len(padrao) + 2 * margem
+
+    # Cada barra volta ao proprio inicio (z): a proxima e um 'm' relativo inteiro
+    barras = []
+    anterior = None
+    inicio = None
+    for i, modulo in enumerate(padrao + '0'):
+        if modulo == '1' and inicio is None:
+            inicio = i
+        elif modulo != '1' and inicio is not None:
+            movimento = f'M{_numero(margem + inicio)} 0' if anterior is None else f'm{inicio - anterior} 0'
+            barras.append(f'{movimento}h{i - inicio}v1h-{i - inicio}z')
+            anterior = inicio
+            inicio = None
+
+    fundo = opcoes.get('background')
+    svg = (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{_numero(largura * largura_modulo)}mm" '
+        f'height="{_numero(opcoes["module_height"])}mm" viewBox="0 0 {_numero(largura)} 1" '
+        f'preserveAspectRatio="none" shape-rendering="crispEdges">'
+        + (f'<rect width="100%" height="100%" fill="{fundo}"/>' if fundo else '')
+        + f'<path fill="{opcoes.get("foreground", "black")}" d="{"".join(barras)}"/></svg>'
+    )
+    return svg.encode('utf-8')
+
+
+def chave_cache(simbologia, codigo, opcoes, formato='png'):
+    """Hash do conteudo da imagem: mesmos valores, mesma imagem"""
+    bruto = json.dumps([simbologia, str(codigo), opcoes, formato, VERSAO_RENDERIZACAO],
+                       sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(bruto.encode('utf-8')).hexdigest()
+
+
+class CacheCodigosBarras:
+    """Imagens geradas em LRU na memoria e em arquivos enderecados pelo hash"""
+
+    def __init__(self, diretorio=CACHE_DIR, limite_memoria=LIMITE_MEMORIA, limite_disco=LIMITE_DISCO):
+        self.diretorio = diretorio
+        self.limite_memoria = limite_memoria
+        self.limite_disco = limite_disco
+        self._lock = threading.Lock()
+        # chave -> bytes, do usado ha mais tempo para o mais recente
+        self._memoria = OrderedDict()
+        # Bytes em disco (estimativa do processo; None ate a primeira gravacao)
+        self._bytes_disco = None
+        self._contadores = {
+            'hits_memoria': 0,
+            'hits_disco': 0,
+            'misses': 0,
+            'remocoes_memoria': 0,
+            'remocoes_disco': 0
+        }
+
+    def _caminho(self, chave):
+        return os.path.join(self.diretorio, chave[:2], chave)
+
+    def _contar(self, contador, quantidade=1):
+        with self._lock:
+            self._contadores[contador] += quantidade
+
+    # ========== MEMORIA ==========
+
+    def _da_memoria(self, chave):
+        with self._lock:
+            conteudo = self._memoria.get(chave)
+            if conteudo is not None:
+                self._memoria.move_to_end(chave)
+                self._contadores['hits_memoria'] += 1
+            return conteudo
+
+    def _guardar_memoria(self, chave, conteudo):
+        with self._lock:
+            self._memoria[chave] = conteudo
+            self._memoria.move_to_end(chave)
+            while len(self._memoria) > self.limite_memoria:
+                self._memoria.popitem(last=False)
+                self._contadores['remocoes_memoria'] += 1
+
+    # ========== DISCO ==========
+
+    def _do_disco(self, chave):
+        caminho = self._caminho(chave)
+        try:
+            with open(caminho, 'rb') as f:
+                conteudo = f.read()
+            # Data de acesso para a limpeza por uso (atime nem sempre e atualizado)
+            os.utime(caminho)
+        except OSError:
+            return None
+        return conteudo
+
+    def _guardar_disco(self, chave, conteudo):
+        caminho = self._caminho(chave)
+        try:
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            gravar_atomico(caminho, conteudo)
+        except OSError:
+            # Sem disco o cache continua so na memoria
+            return
+        with self._lock:
+            if self._bytes_disco is not None:
+                self._bytes_disco += len(conteudo)
+            limpar = self._bytes_disco is None or self._bytes_disco > self.limite_disco
+        if limpar:
+            self._limpar_disco()
+
+    def _arquivos(self):
+        """(mtime, tamanho, caminho) de cada imagem em disco"""
+        arquivos = []
+        for raiz, _, nomes in os.walk(self.diretorio):
+            for nome in nomes:
+                # Fora: gravacoes em andamento e a trava da limpeza
+                if nome.endswith('.tmp') or nome.startswith('.'):
+                    continue
+                caminho = os.path.join(raiz, nome)
+                try:
+                    st = os.stat(caminho)
+                except OSError:
+                    continue
+                arquivos.append((st.st_mtime_ns, st.st_size, caminho))
+        return arquivos
+
+    def _limpar_disco(self):
+        """Confere o tamanho real em disco e remove as imagens usadas ha mais tempo"""
+        os.makedirs(self.diretorio, exist_ok=True)
+        with trava_arquivo(os.path.join(self.diretorio, '.lock'), bloquear=False) as travado:
+            if not travado:
+                # Outro processo ja esta limpando
+                return
+            arquivos = self._arquivos()
+            total = sum(tamanho for _, tamanho, _ in arquivos)
+            removidos = 0
+            if total > self.limite_disco:
+                alvo = self.limite_disco * FRACAO_APOS_LIMPEZA
+                for _, tamanho, caminho in sorted(arquivos):
+                    if total <= alvo:
+                        break
+                    try:
+                        os.remove(caminho)
+                    except OSError:
+                        continue
+                    total -= tamanho
+                    removidos += 1
+            with self._lock:
+                self._bytes_disco = total
+                self._contadores['remocoes_disco'] += removidos
+
+    # ========== CONSULTA ==========
+
+    def obter(self, chave, gerar):
+        """Imagem da chave: memoria, disco ou `gerar()` (guardada nos dois)"""
+        conteudo = self._da_memoria(chave)
+        if conteudo is not None:
+            return conteudo
+
+        conteudo = self._do_disco(chave)
+        if conteudo is not None:
+            self._contar('hits_disco')
+            self._guardar_memoria(chave, conteudo)
+            return conteudo
+
+        self._contar('misses')
+        conteudo = gerar()
+        self._guardar_memoria(chave, conteudo)
+        self._guardar_disco(chave, conteudo)
+        return conteudo
+
+    def estatisticas(self):
+        """Contadores de acertos/falhas/remocoes e ocupacao de cada nivel"""
+        with self._lock:
+            dados = dict(self._contadores)
+            dados['itens_memoria'] = len(self._memoria)
+            dados['bytes_memoria'] = sum(len(conteudo) for conteudo in self._memoria.values())
+            dados['limite_memoria'] = self.limite_memoria
+            dados['bytes_disco'] = self._bytes_disco
+            dados['limite_disco'] = self.limite_disco
+        return dados
+
+
+cache = CacheCodigosBarras()
+
+
+def codigo_barras(codigo, perfil='etiqueta', simbologia='code128', formato='svg'):
+    """
+    (chave, bytes) da imagem no formato 'png' ou 'svg'. A chave e o hash do
+    conteudo: serve de ETag e de nome na URL imutavel.
+    """
+    opcoes = PERFIS[perfil]
+    chave = chave_cache(simbologia, codigo, opcoes, formato)
+    renderizar = renderizar_svg if formato == 'svg' else renderizar_png
+    return chave, cache.obter(chave, lambda: renderizar(simbologia, codigo, opcoes))
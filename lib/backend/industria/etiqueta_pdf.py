@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Etiqueta da industria em PDF vetorial (reportlab).
+
+A pagina tem o tamanho da etiqueta (largura x altura em mm) e o desenho segue
+a visualizacao (etiqueta/visualizar.html): titulo, codigo, campos e os codigos
+de barras DUN e lote, com as mesmas proporcoes. As barras sao retangulos
+vetoriais (um unico path por codigo, a partir do padrao de modulos de
+simbologias.py) e o texto usa as fontes padrao do PDF, que nao sao embutidas.
+
+Cada etiqueta e desenhada uma vez como Form XObject e cada copia e so uma
+pagina que referencia esse desenho: o arquivo fica com poucos KB mesmo com
+centenas de copias, e imprime igual em qualquer navegador ou leitor.
+"""
+import io
+import logging
+import math
+
+from lib.backend.industria.codigo_barras import OPCOES_ETIQUETA
+from lib.backend.medidas_etiqueta import TAMANHO_FONTE_PADRAO, ler_medidas
+from lib.backend.industria.simbologias import modulos
+
+try:
+    from reportlab.lib.colors import HexColor
+    from reportlab.lib.units import mm
+    from reportlab.lib.utils import simpleSplit
+    from reportlab.pdfgen import canvas
+except ImportError:  # opcional: sem ele so a impressao pelo navegador
+    canvas = None
+
+COPIAS_MAXIMO = 1000
+
+# Margens e espacamentos da visualizacao (mm)
+MARGEM_VERTICAL = 1.0
+MARGEM_HORIZONTAL = 1.2
+ESPACO_CAMPO = 0.3
+# Caixa do codigo de barras, em fracao da etiqueta (como o .barcode-image)
+FRACAO_LARGURA_BARRAS = 0.75
+FRACAO_ALTURA_BARRAS = 0.14
+
+FONTE = 'Helvetica'
+FONTE_NEGRITO = 'Helvetica-Bold'
+FONTE_CODIGO = 'Courier-Bold'
+
+logger = logging.getLogger(__name__)
+
+
+def disponivel():
+    """True se o reportlab esta instalado"""
+    return canvas is not None
+
+
+def _numero(valor, padrao, minimo=None, maximo=None):
+    """Numero do formulario (texto) com padrao e limites"""
+    try:
+        numero = float(str(valor).replace(',', '.'))
+    except (TypeError, ValueError):
+        return padrao
+    if not math.isfinite(numero):
+        return padrao
+    if minimo is not None:
+        numero = max(minimo, numero)
+    if maximo is not None:
+        numero = min(maximo, numero)
+    return numero
+
+
+def ler_dimensoes(configuracoes):
+    """
+    (largura, altura) da etiqueta em pontos; ValueError com a mensagem para o
+    usuario fora das faixas (ver medidas_etiqueta.ler_medidas).
+    """
+    largura, altura = ler_medidas(configuracoes)
+    return largura * mm, altura * mm
+
+
+def ler_copias(valor):
+    """Quantidade de copias do formulario (1 a COPIAS_MAXIMO)"""
+    return int(_numero(valor, 1, 1, COPIAS_MAXIMO))
+
+
+def formatar_cnpj(cnpj):
+    """00.000.000/0000-00 quando tiver 14 digitos"""
+    cnpj = str(cnpj or '')
+    if len(cnpj) == 14:
+        return f'{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:14]}'
+    return cnpj
+
+
+# ========== DESENHO ==========
+
+def desenhar_barras(pdf, padrao, x, y, largura, altura, quiet_zone=OPCOES_ETIQUETA['quiet_zone'],
+                    module_width=OPCOES_ETIQUETA['module_width']):
+    """
+    Barras do padrao de modulos na caixa (x, y, largura, altura), em pontos.
+    As margens (quiet zone) guardam a mesma proporcao do SVG da visualizacao.
+    """
+    margem = quiet_zone / module_width
+    modulo = largura / (len(padrao) + 2 * margem)
+    caminho = pdf.beginPath()
+    inicio = None
+    for i, valor in enumerate(padrao + '0'):
+        if valor == '1' and inicio is None:
+            inicio = i
+        elif valor != '1' and inicio is not None:
+            caminho.rect(x + (margem + inicio) * modulo, y, (i - inicio) * modulo, altura)
+            inicio = None
+    pdf.drawPath(caminho, stroke=0, fill=1)
+
+
+def _texto_centralizado(pdf, texto, fonte, tamanho, centro, y, espacamento=0):
+    """Linha centralizada com espacamento entre letras (letter-spacing)"""
+    largura = pdf.stringWidth(texto, fonte, tamanho) + espacamento * max(len(texto) - 1, 0)
+    objeto = pdf.beginText(centro - largura / 2, y)
+    objeto.setFont(fonte, tamanho)
+    objeto.setCharSpace(espacamento)
+    objeto.textOut(texto)
+    pdf.drawText(objeto)
+
+
+def _campo(pdf, rotulo, valor, tamanho, centro, y):
+    """'ROTULO: valor' centralizado (rotulo em negrito e menor)"""
+    tamanho_rotulo = tamanho * 0.85
+    rotulo = rotulo.upper()
+    largura = (pdf.stringWidth(rotulo, FONTE_NEGRITO, tamanho_rotulo) + tamanho * 0.3
+               + pdf.stringWidth(valor, FONTE, tamanho))
+    x = centro - largura / 2
+    pdf.setFont(FONTE_NEGRITO, tamanho_rotulo)
+    pdf.drawString(x, y, rotulo)
+    x += pdf.stringWidth(rotulo, FONTE_NEGRITO, tamanho_rotulo) + tamanho * 0.3
+    pdf.setFont(FONTE, tamanho)
+    pdf.drawString(x, y, valor)
+
+
+def desenhar_etiqueta(pdf, dados, configuracoes):
+    """
+    Desenha a etiqueta de cima para baixo, como na visualizacao. `dados` e o
+    dicionario de gerar_etiqueta (com data_fabricacao_formatada).
+    """
+    largura, altura = ler_dimensoes(configuracoes)
+    tamanho = _numero(configuracoes.get('tamanho_fonte'), TAMANHO_FONTE_PADRAO, 4, 40)
+    centro = largura / 2
+    util = largura - 2 * MARGEM_HORIZONTAL * mm
+    y = altura - MARGEM_VERTICAL * mm
+
+    pdf.setFillColor(HexColor('#2c3e50'))
+    descricao = str(dados.get('descricao') or '').strip()
+    if descricao:
+        titulo = tamanho * 1.5
+        for linha in simpleSplit(descricao, FONTE_NEGRITO, titulo, util):
+            y -= titulo * 1.15
+            _texto_centralizado(pdf, linha, FONTE_NEGRITO, titulo, centro, y + titulo * 0.2)
+
+    codigo = str(dados.get('codigo_etiqueta') or '').strip()
+    if codigo:
+        grande = tamanho * 1.3
+        texto = f'Cod: {codigo}'
+        caixa_largura = pdf.stringWidth(texto, FONTE_NEGRITO, grande) + 8
+        caixa_altura = grande * 1.4
+        y -= caixa_altura + 2
+        pdf.setStrokeColor(HexColor('#e9ecef'))
+        pdf.setLineWidth(0.75)
+        pdf.roundRect(centro - caixa_largura / 2, y, caixa_largura, caixa_altura, 3, stroke=1, fill=0)
+        pdf.setFillColor(HexColor('#495057'))
+        _texto_centralizado(pdf, texto, FONTE_NEGRITO, grande, centro, y + caixa_altura * 0.28)
+        y -= 2
+
+    campos = []
+    if dados.get('peso'):
+        campos.append(('Peso:', f"{dados['peso']} kg"))
+    if dados.get('data_fabricacao_formatada'):
+        campos.append(('Fab:', dados['data_fabricacao_formatada']))
+    if dados.get('data_validade_formatada'):
+        campos.append(('Val:', dados['data_validade_formatada']))
+    elif dados.get('validade_meses'):
+        campos.append(('Val:', f"{dados['validade_meses']} meses"))
+    if dados.get('cnpj'):
+        campos.append(('CNPJ:', formatar_cnpj(dados['cnpj'])))
+    pdf.setFillColor(HexColor('#212529'))
+    for rotulo, valor in campos:
+        y -= tamanho * 1.4 + ESPACO_CAMPO * mm
+        _campo(pdf, rotulo, str(valor), tamanho, centro, y + tamanho * 0.3)
+
+    barras_largura = largura * FRACAO_LARGURA_BARRAS
+    barras_altura = altura * FRACAO_ALTURA_BARRAS
+    for titulo, chave in (('Codigo de Barras da DUN', 'codigo_barras'),
+                          ('Codigo de Barras do Lote', 'codigo_barras_lote')):
+        valor = str(dados.get(chave) or '').strip()
+        if not valor:
+            continue
+        try:
+            padrao = modulos('code128', valor)
+        except ValueError as e:
+            # Como na visualizacao: codigo que a simbologia nao aceita fica de fora
+            logger.warning('Codigo de barras invalido na etiqueta: %s', e)
+            continue
+        pdf.setFillColor(HexColor('#000000'))
+        y -= tamanho * 0.8 * 1.2 + 0.3 * mm
+        _texto_centralizado(pdf, titulo, FONTE_NEGRITO, tamanho * 0.8, centro, y + tamanho * 0.15)
+        y -= barras_altura + 0.2 * mm
+        desenhar_barras(pdf, padrao, centro - barras_largura / 2, y, barras_largura, barras_altura)
+        texto = tamanho * 0.9
+        y -= texto * 1.2 + 0.1 * mm
+        _texto_centralizado(pdf, valor, FONTE_CODIGO, texto, centro, y + texto * 0.2, espacamento=0.75)
+
+
+# ========== DOCUMENTO ==========
+
+def gerar_pdf(etiquetas, configuracoes, titulo='Etiquetas'):
+    """
+    PDF com uma pagina por copia. `etiquetas` e uma sequencia de
+    (dados, copias); cada etiqueta vira um Form XObject desenhado uma vez.
+    Retorna os bytes do arquivo; ValueError se o tamanho da etiqueta for
+    invalido (ver ler_dimensoes).
+    """
+    if canvas is None:
+        raise RuntimeError('reportlab nao instalado')
+
+    largura, altura = ler_dimensoes(configuracoes)
+    saida = io.BytesIO()
+    pdf = canvas.Canvas(saida, pagesize=(largura, altura), pageCompression=1)
+    pdf.setTitle(titulo)
+    pdf.setCreator('Sistema de Etiquetas')
+
+    for indice, (dados, copias) in enumerate(etiquetas):
+        nome = f'etiqueta{indice}'
+        pdf.beginForm(nome, lowerx=0, lowery=0, upperx=largura, uppery=altura)
+        desenhar_etiqueta(pdf, dados, configuracoes)
+        pdf.endForm()
+        for _ in range(copias):
+            pdf.doForm(nome)
+            pdf.showPage()
+
+    pdf.save()
+    return saida.getvalue()
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Repositorio de produtos em memoria.
+
+Mantem os produtos por id e os indices unicos por `numero` e `dun`, entao as
+buscas e a conferencia de duplicados nao percorrem a colecao. Cada gravacao
+feita pelo proprio processo atualiza os indices; se outro processo gravar, a
+assinatura do armazenamento muda e tudo e reconstruido na proxima leitura.
+
+Os cadastros antigos podem ter o mesmo DUN em mais de um produto: o indice
+guarda todos os ids de cada valor, e so as gravacoes novas sao impedidas de
+repetir um numero ou DUN ja usado por outro produto.
+"""
+import threading
+from contextlib import contextmanager
+
+from lib.backend.armazenamento.base import trava_arquivo
+
+
+def normalizar_dun(dun):
+    """DUN como texto sem espacos ('' quando ausente)"""
+    return str(dun).strip() if dun is not None else ''
+
+
+class IndiceUnico:
+    """Valor -> ids dos produtos com esse valor (normalmente um so)"""
+
+    def __init__(self, chave):
+        # chave(produto) -> valor indexado (None ou '' nao entram no indice)
+        self.chave = chave
+        self._ids = {}
+
+    def reconstruir(self, produtos):
+        self._ids = {}
+        for produto in produtos:
+            self.adicionar(produto)
+
+    def adicionar(self, produto):
+        valor = self.chave(produto)
+        if valor is not None and valor != '':
+            ids = self._ids.setdefault(valor, [])
+            if produto['id'] not in ids:
+                ids.append(produto['id'])
+                ids.sort()
+
+    def remover(self, produto):
+        valor = self.chave(produto)
+        ids = self._ids.get(valor)
+        if ids is not None and produto['id'] in ids:
+            ids.remove(produto['id'])
+            if not ids:
+                del self._ids[valor]
+
+    def ids(self, valor):
+        return list(self._ids.get(valor, ()))
+
+    def usado_por_outro(self, valor, produto_id=None):
+        """True se algum produto alem de produto_id tem esse valor"""
+        return any(outro != produto_id for outro in self._ids.get(valor, ()))
+
+
+class RepositorioProdutos:
+    """Produtos por id com indices unicos de numero e DUN"""
+
+    def __init__(self, armazenamento, caminho_trava=None):
+        self.armazenamento = armazenamento
+        # Trava entre processos para conferir duplicados e gravar juntos
+        self.caminho_trava = caminho_trava
+        self._lock = threading.RLock()
+        self._assinatura = False
+        self._por_id = {}
+        self._por_numero = IndiceUnico(lambda produto: produto.get('numero'))
+        self._por_dun = IndiceUnico(lambda produto: normalizar_dun(produto.get('dun')))
+
+    # ========== CARGA ==========
+
+    def _recarregar(self, assinatura):
+        produtos = self.armazenamento.listar()
+        self._por_id = {produto['id']: produto for produto in produtos}
+        self._por_numero.reconstruir(produtos)
+        self._por_dun.reconstruir(produtos)
+        self._assinatura = assinatura
+
+    def _garantir_atualizado(self):
+        assinatura = self.armazenamento.assinatura()
+        if assinatura != self._assinatura:
+            with self._lock:
+                if assinatura != self._assinatura:
+                    self._recarregar(assinatura)
+
+    def _apos_gravar(self):
+        """True se so esta gravacao mudou os dados (basta ajustar os indices)"""
+        if self.armazenamento.assinatura_antes == self._assinatura:
+            self._assinatura = self.armazenamento.assinatura_depois
+            return True
+        self._recarregar(self.armazenamento.assinatura_depois)
+        return False
+
+    def _indexar(self, produto):
+        self._por_id[produto['id']] = produto
+        self._por_numero.adicionar(produto)
+        self._por_dun.adicionar(produto)
+
+    def _desindexar(self, produto):
+        del self._por_id[produto['id']]
+        self._por_numero.remover(produto)
+        self._por_dun.remover(produto)
+
+    # ========== CONSULTAS ==========
+
+    def listar(self):
+        """Todos os produtos, na ordem do armazenamento"""
+        return self.armazenamento.listar()
+
+    def buscar(self, produto_id):
+        self._garantir_atualizado()
+        return self._por_id.get(produto_id)
+
+    def buscar_por_numero(self, numero):
+        self._garantir_atualizado()
+        with self._lock:
+            ids = self._por_numero.ids(numero)
+            return self._por_id[ids[0]] if ids else None
+
+    def buscar_por_numeros(self, numeros):
+        """numero -> produto dos numeros encontrados, numa unica consulta aos indices"""
+        self._garantir_atualizado()
+        with self._lock:
+            encontrados = {}
+            for numero in numeros:
+                ids = self._por_numero.ids(numero)
+                if ids:
+                    encontrados[numero] = self._por_id[ids[0]]
+            return encontrados
+
+    def buscar_por_dun(self, dun):
+        """Produtos com esse DUN (mais de um so em cadastros antigos repetidos)"""
+        self._garantir_atualizado()
+        with self._lock:
+            return [self._por_id[produto_id] for produto_id in self._por_dun.ids(normalizar_dun(dun))]
+
+    def _conferir_unicos(self, produto, atual=None):
+        """Mensagem de erro se o numero ou o DUN ja for de outro produto"""
+        numero = produto.get('numero')
+        if (atual is None or atual.get('numero') != numero) and \
+                self._por_numero.usado_por_outro(numero, produto.get('id')):
+            return f"Produto com numero {numero} ja existe"
+
+        # DUN repetido de cadastro antigo continua valendo enquanto nao mudar
+        dun = normalizar_dun(produto.get('dun'))
+        if dun and (atual is None or normalizar_dun(atual.get('dun')) != dun) and \
+                self._por_dun.usado_por_outro(dun, produto.get('id')):
+            return f"DUN {dun} ja cadastrado em outro produto"
+        return None
+
+    # ========== GRAVACAO ==========
+
+    @contextmanager
+    def _gravacao(self):
+        with self._lock:
+            if self.caminho_trava is None:
+                self._garantir_atualizado()
+                yield
+            else:
+                with trava_arquivo(self.caminho_trava):
+                    self._garantir_atualizado()
+                    yield
+
+    def inserir(self, produto):
+        """Grava um produto novo; retorna (produto, erro)"""
+        with self._gravacao():
+            erro = self._conferir_unicos(produto)
+            if erro:
+                return None, erro
+            produto = self.armazenamento.inserir(produto)
+            if self._apos_gravar():
+                self._indexar(produto)
+            return produto, None
+
+    def salvar(self, produto, versao_esperada=None):
+        """Grava um produto existente; retorna (produto, erro)"""
+        with self._gravacao():
+            atual = self._por_id.get(produto['id'])
+            if atual is None:
+                return None, "Produto nao encontrado"
+            erro = self._conferir_unicos(produto, atual)
+            if erro:
+                return None, erro
+            salvo = self.armazenamento.salvar(produto, versao_esperada=versao_esperada)
+            if self._apos_gravar() and salvo is not None:
+                self._desindexar(atual)
+                self._indexar(salvo)
+            if salvo is None:
+                return None, "Produto nao encontrado"
+            return salvo, None
+
+    def remover(self, produto_id):
+        """Remove pelo id; retorna o produto removido ou None"""
+        with self._gravacao():
+            removido = self.armazenamento.remover(produto_id)
+            if self._apos_gravar() and removido is not None:
+                self._desindexar(self._por_id[produto_id])
+            return removido
@@ -1,22 +1,39 @@
-from flask import Blueprint, render_template, request, jsonify, make_response, session, redirect, url_for, flash
-import barcode
-from barcode.writer import ImageWriter
-import io
-import base64
-from datetime import datetime
-from dateutil.relativedelta import relativedelta
-
+from flask import Blueprint, render_template, request, jsonify, make_response, session, redirect, url_for, flash, current_app
+from datetime import date
+
+from lib.backend.http_utils import respostas
+from lib.backend.industria.codigo_barras import (
+    FORMATOS,
+    PERFIS,
+    cache as cache_codigos_barras,
+    chave_cache,
+    codigo_barras
+)
+from lib.backend.industria.etiqueta_pdf import (
+    disponivel as etiqueta_pdf_disponivel,
+    gerar_pdf,
+    ler_copias,
+    ler_dimensoes
+)
+from lib.backend.industria.simbologias import CODIFICADORES, modulos
 from lib.backend.industria.service import (
+    versao_produtos,
     listar_produtos,
     buscar_produto_por_id,
     buscar_produto_por_numero,
+    buscar_produtos_por_dun,
     criar_produto,
     atualizar_produto,
-    deletar_produto
+    deletar_produto,
+    formatar_datas,
+    montar_etiquetas_producao
 )
 
 etiqueta_bp = Blueprint('etiqueta', __name__, url_prefix='/etiqueta')
 
+# As URLs de codigo de barras com hash nunca mudam de conteudo
+MAX_AGE_IMUTAVEL = 365 * 24 * 3600
+
 
 # ========== PAGINAS PRINCIPAIS ==========
 
@@ -53,47 +70,35 @@ def gerar_etiqueta():
                 'tamanho_fonte': request.form.get('tamanho_fonte', '8')
             }
 
-            # Gerar codigos de barras
-            codigo_barras_img = None
-            codigo_barras_lote_img = None
+            # Codigos de barras: URL imutavel do SVG (o navegador guarda cada um uma vez)
+            codigo_barras_url = None
+            codigo_barras_lote_url = None
 
             # Codigo de barras DUN
             if dados['codigo_barras'] and dados['codigo_barras'].strip():
-                codigo_barras_img = gerar_codigo_barras(dados['codigo_barras'].strip())
+                codigo_barras_url = url_codigo_barras(dados['codigo_barras'].strip())
 
             # Codigo de barras Lote
             if dados['codigo_barras_lote'] and dados['codigo_barras_lote'].strip():
-                codigo_barras_lote_img = gerar_codigo_barras(dados['codigo_barras_lote'].strip())
-
-            # Formatar data de fabricacao
-            if dados['data_fabricacao']:
-                try:
-                    data_fab = datetime.strptime(dados['data_fabricacao'], '%Y-%m-%d')
-                    dados['data_fabricacao_formatada'] = data_fab.strftime('%d/%m/%Y')
-
-                    # Calcular data de validade
-                    if dados['validade_meses']:
-                        meses = int(dados['validade_meses'])
-                        data_val = data_fab + relativedelta(months=meses)
-                        dados['data_validade_formatada'] = data_val.strftime('%d/%m/%Y')
-                    else:
-                        dados['data_validade_formatada'] = ''
-                except:
-                    dados['data_fabricacao_formatada'] = dados['data_fabricacao']
-                    dados['data_validade_formatada'] = ''
-            else:
-                dados['data_fabricacao_formatada'] = ''
-                dados['data_validade_formatada'] = ''
+                codigo_barras_lote_url = url_codigo_barras(dados['codigo_barras_lote'].strip())
+
+            # Formatar data de fabricacao e calcular a de validade
+            dados['data_fabricacao_formatada'], dados['data_validade_formatada'] = \
+                formatar_datas(dados['data_fabricacao'], dados['validade_meses'])
 
             # Salvar na sessao
             session['etiqueta_dados'] = dados
             session['etiqueta_configuracoes'] = configuracoes
 
+            # PDF vetorial em vez da visualizacao
+            if request.form.get('formato') == 'pdf':
+                return resposta_pdf([(dados, ler_copias(request.form.get('copias')))], configuracoes)
+
             return render_template('etiqueta/visualizar.html',
                                    dados=dados,
                                    configuracoes=configuracoes,
-                                   codigo_barras_img=codigo_barras_img,
-                                   codigo_barras_lote_img=codigo_barras_lote_img)
+                                   codigo_barras_url=codigo_barras_url,
+                                   codigo_barras_lote_url=codigo_barras_lote_url)
 
         except Exception as e:
             print(f"Erro ao processar etiqueta: {e}")
@@ -109,6 +114,25 @@ def gerar_etiqueta():
                            configuracoes_salvas=configuracoes_salvas)
 
 
+@etiqueta_bp.route('/pdf')
+def etiqueta_pdf():
+    """PDF da ultima etiqueta gerada (da sessao), com ?copias=N"""
+    dados = session.get('etiqueta_dados')
+    if not dados:
+        flash('Gere uma etiqueta antes de baixar o PDF', 'error')
+        return redirect(url_for('etiqueta.gerar_etiqueta'))
+    return resposta_pdf([(dados, ler_copias(request.args.get('copias')))],
+                        session.get('etiqueta_configuracoes', {}))
+
+
+@etiqueta_bp.route('/producao')
+def producao():
+    """Etiquetas de uma producao: varios produtos, cada um com lote, data e copias"""
+    return render_template('etiqueta/producao.html',
+                           configuracoes_salvas=session.get('etiqueta_configuracoes', {}),
+                           hoje=date.today().isoformat())
+
+
 @etiqueta_bp.route('/nova')
 def nova_etiqueta():
     """Limpa sessao e redireciona para nova etiqueta"""
@@ -217,7 +241,11 @@ def deletar_produto_view(produto_id):
 
 @etiqueta_bp.route('/api/produto/<int:numero>')
 def api_buscar_produto(numero):
-    """API para buscar produto pelo numero"""
+    """API para buscar produto pelo numero (304 se o cliente ja tem a versao atual)"""
+    return respostas.responder('produtos', versao_produtos(), lambda: _buscar_produto(numero))
+
+
+def _buscar_produto(numero):
     produto = buscar_produto_por_numero(numero)
 
     if not produto:
@@ -232,60 +260,164 @@ def api_buscar_produto(numero):
     })
 
 
+@etiqueta_bp.route('/api/produto/dun/<dun>')
+def api_buscar_produto_por_dun(dun):
+    """
+    API para buscar produto pelo DUN-14 lido da caixa. Responde 409 com a
+    lista em `produtos` se o DUN estiver repetido em cadastros antigos.
+    """
+    return respostas.responder('produtos', versao_produtos(), lambda: _buscar_produto_por_dun(dun))
+
+
+def _buscar_produto_por_dun(dun):
+    produtos = buscar_produtos_por_dun(dun)
+
+    if not produtos:
+        return jsonify({
+            'success': False,
+            'message': f'Produto com DUN {dun} nao encontrado'
+        }), 404
+
+    if len(produtos) > 1:
+        return jsonify({
+            'success': False,
+            'message': f'DUN {dun} cadastrado em {len(produtos)} produtos',
+            'produtos': produtos
+        }), 409
+
+    return jsonify({
+        'success': True,
+        'produto': produtos[0]
+    })
+
+
+@etiqueta_bp.route('/api/producao/pdf', methods=['POST'])
+def api_producao_pdf():
+    """
+    PDF unico com as etiquetas de uma producao. Corpo JSON:
+    {"itens": [{"numero", "lote", "data_fabricacao", "copias"}, ...],
+     "largura", "altura", "tamanho_fonte"}, ou so a lista de itens (medidas
+    padrao). Responde 400 com a lista de erros por linha se algum item for
+    invalido.
+    """
+    corpo = request.get_json(silent=True) or {}
+    if isinstance(corpo, list):
+        corpo = {'itens': corpo}
+    elif not isinstance(corpo, dict):
+        return jsonify({'success': False, 'erros': ['Envie um objeto JSON com os itens']}), 400
+    etiquetas, erros = montar_etiquetas_producao(corpo.get('itens'))
+    if erros:
+        return jsonify({'success': False, 'erros': erros}), 400
+    if not etiqueta_pdf_disponivel():
+        return jsonify({'success': False, 'erros': ['Geracao de PDF indisponivel: instale o reportlab']}), 503
+
+    configuracoes = {
+        'largura': corpo.get('largura', '100'),
+        'altura': corpo.get('altura', '75'),
+        'tamanho_fonte': corpo.get('tamanho_fonte', '8')
+    }
+    try:
+        ler_dimensoes(configuracoes)
+    except ValueError as e:
+        return jsonify({'success': False, 'erros': [str(e)]}), 400
+    return resposta_pdf(etiquetas, configuracoes)
+
+
 @etiqueta_bp.route('/api/codigo-barras')
 def api_codigo_barras():
-    """API para gerar codigo de barras"""
+    """API para gerar codigo de barras (?codigo=...&simbologia=code128 ou itf14)"""
     codigo = request.args.get('codigo')
     if not codigo:
         return jsonify({'erro': 'Codigo nao fornecido'}), 400
 
+    simbologia = request.args.get('simbologia', 'code128')
+    if simbologia not in CODIFICADORES:
+        return jsonify({'erro': f'Simbologia invalida: {simbologia}'}), 400
+
     try:
-        code128 = barcode.get_barcode_class('code128')
-        barcode_instance = code128(codigo, writer=ImageWriter())
-
-        buffer = io.BytesIO()
-        barcode_instance.write(buffer, options={
-            'module_width': 0.2,
-            'module_height': 15.0,
-            'quiet_zone': 6.5,
-            'font_size': 10,
-            'text_distance': 5.0,
-            'background': 'white',
-            'foreground': 'black'
-        })
-        buffer.seek(0)
-
-        response = make_response(buffer.getvalue())
+        chave, png = codigo_barras(codigo, 'api', simbologia, 'png')
+        response = make_response(png)
         response.headers['Content-Type'] = 'image/png'
-        return response
-
+        # Sem hash na URL: o navegador guarda por um dia e depois confere o ETag
+        response.set_etag(chave)
+        response.cache_control.public = True
+        response.cache_control.max_age = 24 * 3600
+        return response.make_conditional(request)
+
+    except ValueError as e:
+        return jsonify({'erro': str(e)}), 400
     except Exception as e:
         return jsonify({'erro': str(e)}), 500
 
 
+@etiqueta_bp.route('/api/codigo-barras/<chave>.<formato>')
+def api_codigo_barras_imutavel(chave, formato):
+    """
+    Imagem em URL enderecada pelo conteudo: a chave e o hash de (simbologia,
+    codigo, opcoes, formato), entao a resposta nunca muda e vai com
+    Cache-Control immutable de um ano (navegador e nginx guardam uma vez).
+    Parametros: ?codigo=...&perfil=etiqueta|api&simbologia=code128|itf14.
+    """
+    codigo = request.args.get('codigo', '')
+    perfil = request.args.get('perfil', 'etiqueta')
+    simbologia = request.args.get('simbologia', 'code128')
+    if (formato not in FORMATOS or perfil not in PERFIS or simbologia not in CODIFICADORES
+            or chave != chave_cache(simbologia, codigo, PERFIS[perfil], formato)):
+        return jsonify({'erro': 'Codigo de barras nao encontrado'}), 404
+
+    if chave in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        try:
+            _, conteudo = codigo_barras(codigo, perfil, simbologia, formato)
+        except ValueError as e:
+            return jsonify({'erro': str(e)}), 400
+        response = make_response(conteudo)
+        response.headers['Content-Type'] = FORMATOS[formato]
+    response.set_etag(chave)
+    response.cache_control.public = True
+    response.cache_control.max_age = MAX_AGE_IMUTAVEL
+    response.cache_control.immutable = True
+    return response
+
+
+@etiqueta_bp.route('/api/codigo-barras/estatisticas')
+def api_estatisticas_codigo_barras():
+    """Contadores do cache de codigos de barras (acertos, falhas e remocoes)"""
+    return jsonify(cache_codigos_barras.estatisticas())
+
+
 # ========== FUNCOES AUXILIARES ==========
 
-def gerar_codigo_barras(codigo):
-    """Gera codigo de barras em base64"""
+def url_codigo_barras(codigo, formato='svg', perfil='etiqueta', simbologia='code128'):
+    """URL imutavel da imagem do codigo (None se o codigo nao e valido para a simbologia)"""
     try:
-        code128 = barcode.get_barcode_class('code128')
-        barcode_instance = code128(str(codigo), writer=ImageWriter())
-
-        buffer = io.BytesIO()
-        barcode_instance.write(buffer, options={
-            'module_width': 0.22,
-            'module_height': 7.0,
-            'quiet_zone': 2.5,
-            'font_size': 0,
-            'text_distance': 0,
-            'background': 'white',
-            'foreground': 'black',
-            'dpi': 300
-        })
-        buffer.seek(0)
-
-        return base64.b64encode(buffer.getvalue()).decode()
-
-    except Exception as e:
-        print(f"Erro ao gerar codigo de barras: {e}")
+        modulos(simbologia, codigo)
+    except ValueError as e:
+        current_app.logger.warning('Codigo de barras invalido (%s): %s', simbologia, e)
         return None
+    chave = chave_cache(simbologia, codigo, PERFIS[perfil], formato)
+    return url_for('etiqueta.api_codigo_barras_imutavel', chave=chave, formato=formato,
+                   codigo=codigo, perfil=perfil, simbologia=simbologia)
+
+
+def resposta_pdf(etiquetas, configuracoes):
+    """Resposta com o PDF das etiquetas (aberto no navegador para imprimir)"""
+    if not etiqueta_pdf_disponivel():
+        flash('Geracao de PDF indisponivel: instale o reportlab', 'error')
+        return redirect(url_for('etiqueta.gerar_etiqueta'))
+
+    try:
+        pdf = gerar_pdf(etiquetas, configuracoes)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('etiqueta.gerar_etiqueta'))
+
+    nome = 'etiquetas.pdf'
+    if len(etiquetas) == 1 and etiquetas[0][0].get('codigo_etiqueta'):
+        nome = f"etiqueta-{etiquetas[0][0]['codigo_etiqueta']}.pdf"
+    response = make_response(pdf)
+    response.headers['Content-Type'] = 'application/pdf'
+    response.headers['Content-Disposition'] = f'inline; filename="{nome}"'
+    response.cache_control.no_store = True
+    return response
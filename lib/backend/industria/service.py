@@ -1,62 +1,62 @@
-import json
 import os
 from datetime import datetime
 
+from dateutil.relativedelta import relativedelta
+
+from lib.backend.armazenamento import criar_armazenamento
+from lib.backend.industria.etiqueta_pdf import COPIAS_MAXIMO
+from lib.backend.industria.repositorio import RepositorioProdutos
+
 DATA_PATH = os.path.join(os.path.dirname(__file__), 'data', 'produtos.json')
+# Trava do cadastro: conferencia de numero/DUN unicos e gravacao juntas
+CADASTRO_TRAVA = os.path.join(os.path.dirname(__file__), 'data', 'produtos.cadastro.lock')
+
+armazenamento = criar_armazenamento('produtos', DATA_PATH, 'ultimo_id')
+repositorio = RepositorioProdutos(armazenamento, CADASTRO_TRAVA)
+
+# Limite de paginas de uma producao (soma das copias)
+LIMITE_ETIQUETAS_PRODUCAO = int(os.environ.get('LIMITE_ETIQUETAS_PRODUCAO', '20000'))
 
 
 def carregar_dados():
-    """Carrega dados do arquivo JSON"""
-    try:
-        with open(DATA_PATH, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {"produtos": [], "ultimo_id": 0}
+    """Carrega dados do armazenamento"""
+    return armazenamento.carregar()
 
 
 def salvar_dados(dados):
-    """Salva dados no arquivo JSON"""
-    with open(DATA_PATH, 'w', encoding='utf-8') as f:
-        json.dump(dados, f, ensure_ascii=False, indent=2)
+    """Salva dados no armazenamento"""
+    armazenamento.substituir(dados)
+
+
+def versao_produtos():
+    """Versao dos dados de produtos (muda a cada gravacao)"""
+    return armazenamento.assinatura()
 
 
 def listar_produtos():
     """Lista todos os produtos"""
-    dados = carregar_dados()
-    return dados.get('produtos', [])
+    return armazenamento.listar()
 
 
 def buscar_produto_por_id(produto_id):
     """Busca produto pelo ID"""
-    dados = carregar_dados()
-    for produto in dados.get('produtos', []):
-        if produto['id'] == produto_id:
-            return produto
-    return None
+    return repositorio.buscar(produto_id)
 
 
 def buscar_produto_por_numero(numero):
     """Busca produto pelo numero"""
-    dados = carregar_dados()
-    for produto in dados.get('produtos', []):
-        if produto['numero'] == numero:
-            return produto
-    return None
+    return repositorio.buscar_por_numero(numero)
 
 
-def criar_produto(descricao, numero, peso, validade_meses, cnpj, dun):
-    """Cria um novo produto"""
-    dados = carregar_dados()
+def buscar_produtos_por_dun(dun):
+    """Produtos com o DUN (um so, exceto cadastros antigos repetidos)"""
+    return repositorio.buscar_por_dun(dun)
 
-    # Verificar se numero ja existe
-    for produto in dados.get('produtos', []):
-        if produto['numero'] == numero:
-            return None, f"Produto com numero {numero} ja existe"
 
-    novo_id = dados.get('ultimo_id', 0) + 1
-
-    novo_produto = {
-        'id': novo_id,
+def criar_produto(descricao, numero, peso, validade_meses, cnpj, dun):
+    """Cria um novo produto (numero e DUN nao podem ser de outro produto)"""
+    return repositorio.inserir({
+        'id': None,
         'numero': numero,
         'descricao': descricao.upper(),
         'peso': peso,
@@ -64,49 +64,127 @@ def criar_produto(descricao, numero, peso, validade_meses, cnpj, dun):
         'cnpj': cnpj,
         'dun': dun,
         'dt_criacao': datetime.now().strftime('%Y-%m-%d')
-    }
-
-    dados['produtos'].append(novo_produto)
-    dados['ultimo_id'] = novo_id
-
-    salvar_dados(dados)
-    return novo_produto, None
+    })
 
 
 def atualizar_produto(produto_id, numero=None, descricao=None, peso=None, validade_meses=None, cnpj=None, dun=None):
     """Atualiza um produto existente"""
-    dados = carregar_dados()
-
-    for i, produto in enumerate(dados.get('produtos', [])):
-        if produto['id'] == produto_id:
-            if numero is not None:
-                dados['produtos'][i]['numero'] = numero
-            if descricao is not None:
-                dados['produtos'][i]['descricao'] = descricao.upper()
-            if peso is not None:
-                dados['produtos'][i]['peso'] = peso
-            if validade_meses is not None:
-                dados['produtos'][i]['validade_meses'] = validade_meses
-            if cnpj is not None:
-                dados['produtos'][i]['cnpj'] = cnpj
-            if dun is not None:
-                dados['produtos'][i]['dun'] = dun
-            dados['produtos'][i]['dt_atualizacao'] = datetime.now().strftime('%Y-%m-%d')
-
-            salvar_dados(dados)
-            return dados['produtos'][i], None
-
-    return None, "Produto nao encontrado"
+    produto = repositorio.buscar(produto_id)
+    if produto is None:
+        return None, "Produto nao encontrado"
+
+    produto = dict(produto)
+    if numero is not None:
+        produto['numero'] = numero
+    if descricao is not None:
+        produto['descricao'] = descricao.upper()
+    if peso is not None:
+        produto['peso'] = peso
+    if validade_meses is not None:
+        produto['validade_meses'] = validade_meses
+    if cnpj is not None:
+        produto['cnpj'] = cnpj
+    if dun is not None:
+        produto['dun'] = dun
+    produto['dt_atualizacao'] = datetime.now().strftime('%Y-%m-%d')
+
+    return repositorio.salvar(produto)
 
 
 def deletar_produto(produto_id):
     """Deleta um produto"""
-    dados = carregar_dados()
+    produto_removido = repositorio.remover(produto_id)
+    if produto_removido is None:
+        return None, "Produto nao encontrado"
+    return produto_removido, None
+
+
+# ========== ETIQUETAS ==========
+
+def formatar_datas(data_fabricacao, validade_meses):
+    """(fabricacao, validade) em dd/mm/aaaa; a validade e a fabricacao mais validade_meses"""
+    if not data_fabricacao:
+        return '', ''
+    try:
+        data_fab = datetime.strptime(data_fabricacao, '%Y-%m-%d')
+        data_validade = ''
+        if validade_meses:
+            data_validade = (data_fab + relativedelta(months=int(validade_meses))).strftime('%d/%m/%Y')
+        return data_fab.strftime('%d/%m/%Y'), data_validade
+    except (TypeError, ValueError):
+        return data_fabricacao, ''
+
+
+def dados_etiqueta_produto(produto, lote, data_fabricacao):
+    """Dados da etiqueta (os mesmos campos do formulario de /etiqueta/gerar) de um produto"""
+    validade_meses = produto.get('validade_meses') or ''
+    fabricacao, validade = formatar_datas(data_fabricacao, validade_meses)
+    return {
+        'descricao': produto.get('descricao') or '',
+        'produto_id': str(produto['numero']),
+        'codigo_etiqueta': str(produto['numero']),
+        'peso': produto.get('peso') or '',
+        'data_fabricacao': data_fabricacao,
+        'validade_meses': validade_meses,
+        'cnpj': produto.get('cnpj') or '',
+        'codigo_barras': str(produto.get('dun') or ''),
+        'codigo_barras_lote': lote,
+        'lote': lote,
+        'data_fabricacao_formatada': fabricacao,
+        'data_validade_formatada': validade
+    }
 
-    for i, produto in enumerate(dados.get('produtos', [])):
-        if produto['id'] == produto_id:
-            produto_removido = dados['produtos'].pop(i)
-            salvar_dados(dados)
-            return produto_removido, None
 
-    return None, "Produto nao encontrado"
+def montar_etiquetas_producao(itens):
+    """
+    Etiquetas de uma producao. Cada item tem numero do produto, lote,
+    data_fabricacao (aaaa-mm-dd) e copias. Os produtos sao buscados todos de
+    uma vez nos indices do repositorio.
+
+    Retorna (etiquetas, erros): etiquetas como (dados, copias), na ordem dos
+    itens, e erros com a linha (a partir de 1) de cada item invalido.
+    """
+    if not isinstance(itens, list) or not itens:
+        return None, ['Informe ao menos um item']
+
+    linhas = []
+    erros = []
+    for linha, item in enumerate(itens, 1):
+        if not isinstance(item, dict):
+            erros.append((linha, 'item invalido'))
+            continue
+        try:
+            numero = int(str(item.get('numero', '')).strip())
+        except ValueError:
+            erros.append((linha, 'numero do produto invalido'))
+            continue
+        try:
+            copias = int(str(item.get('copias', 1)).strip())
+        except ValueError:
+            copias = 0
+        if not 1 <= copias <= COPIAS_MAXIMO:
+            erros.append((linha, f'copias deve ser de 1 a {COPIAS_MAXIMO}'))
+            continue
+        data_fabricacao = str(item.get('data_fabricacao') or '').strip()
+        try:
+            datetime.strptime(data_fabricacao, '%Y-%m-%d')
+        except ValueError:
+            erros.append((linha, 'data de fabricacao invalida'))
+            continue
+        linhas.append((linha, numero, str(item.get('lote') or '').strip(), data_fabricacao, copias))
+
+    produtos = repositorio.buscar_por_numeros({numero for _, numero, _, _, _ in linhas})
+    etiquetas = []
+    for linha, numero, lote, data_fabricacao, copias in linhas:
+        produto = produtos.get(numero)
+        if produto is None:
+            erros.append((linha, f'produto {numero} nao encontrado'))
+            continue
+        etiquetas.append((dados_etiqueta_produto(produto, lote, data_fabricacao), copias))
+
+    if erros:
+        return None, [f'Linha {linha}: {mensagem}' for linha, mensagem in sorted(erros)]
+    total = sum(copias for _, copias in etiquetas)
+    if total > LIMITE_ETIQUETAS_PRODUCAO:
+        return None, [f'Total de {total} etiquetas passa do limite de {LIMITE_ETIQUETAS_PRODUCAO}']
+    return etiquetas, []
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Codificadores de codigo de barras (sem o python-barcode).
+
+Cada funcao recebe o texto e devolve o padrao de modulos: uma string com '1'
+para barra e '0' para espaco, do inicio ao fim do simbolo (sem as margens).
+- code128: conjuntos A, B e C, com as trocas que dao o menor simbolo;
+- itf14: Interleaved 2 of 5 com 14 digitos (DUN-14; com 13 o digito
+  verificador e calculado). Barra estreita = 2 modulos, larga = 5, como no
+  python-barcode, entao module_width tem o mesmo efeito nas duas bibliotecas.
+
+Texto que o codificador nao aceita levanta ValueError.
+"""
+
+# Padrao de cada valor do Code 128 (0 a 105: dados, trocas e inicios)
+CODE128 = (
+    '11011001100', '11001101100', '11001100110', '10010011000', '10010001100', '10001001100',
+    '10011001000', '10011000100', '10001100100', '11001001000', '11001000100', '11000100100',
+    '10110011100', '10011011100', '10011001110', '10111001100', '10011101100', '10011100110',
+    '11001110010', '11001011100', '11001001110', '11011100100', '11001110100', '11101101110',
+    '11101001100', '11100101100', '11100100110', '11101100100', '11100110100', '11100110010',
+    '11011011000', '11011000110', '11000110110', '10100011000', '10001011000', '10001000110',
+    '10110001000', '10001101000', '10001100010', '11010001000', '11000101000', '11000100010',
+    '10110111000', '10110001110', '10001101110', '10111011000', '10111000110', '10001110110',
+    '11101110110', '11010001110', '11000101110', '11011101000', '11011100010', '11011101110',
+    '11101011000', '11101000110', '11100010110', '11101101000', '11101100010', '11100011010',
+    '11101111010', '11001000010', '11110001010', '10100110000', '10100001100', '10010110000',
+    '10010000110', '10000101100', '10000100110', '10110010000', '10110000100', '10011010000',
+    '10011000010', '10000110100', '10000110010', '11000010010', '11001010000', '11110111010',
+    '11000010100', '10001111010', '10100111100', '10010111100', '10010011110', '10111100100',
+    '10011110100', '10011110010', '11110100100', '11110010100', '11110010010', '11011011110',
+    '11011110110', '11110110110', '10101111000', '10100011110', '10001011110', '10111101000',
+    '10111100010', '11110101000', '11110100010', '10111011110', '10111101110', '11101011110',
+    '11110101110', '11010000100', '11010010000', '11010011100',
+)
+CODE128_STOP = '1100011101011'
+# Trocas de conjunto e inicios
+CODE_C, CODE_B, CODE_A = 99, 100, 101
+INICIO = {'A': 103, 'B': 104, 'C': 105}
+TROCA = {'A': CODE_A, 'B': CODE_B, 'C': CODE_C}
+
+# Interleaved 2 of 5: larguras (e = estreita, l = larga) de cada digito
+ITF_DIGITOS = ('eelle', 'leeel', 'eleel', 'lleee', 'eelel',
+               'lelee', 'ellee', 'eeell', 'leele', 'elele')
+ITF_LARGURA = {'e': 2, 'l': 5}
+
+
+# Conjuntos por indice: 0 = A, 1 = B, 2 = C
+CONJUNTOS = ('A', 'B', 'C')
+INFINITO = float('inf')
+
+
+def _valores_caractere(codigo):
+    """Valor do caractere nos conjuntos A e B (None onde nao existe)"""
+    if codigo < 32:
+        return codigo + 64, None
+    if codigo < 96:
+        return codigo - 32, codigo - 32
+    return None, codigo - 32
+
+
+def _code128_curto(texto):
+    """Casos sem troca de conjunto: so digitos (C) ou texto sem controle nem 4 digitos seguidos (B)"""
+    if texto.isdigit() and len(texto) % 2 == 0:
+        return [INICIO['C']] + [int(texto[i:i + 2]) for i in range(0, len(texto), 2)]
+    seguidos = 0
+    for caractere in texto:
+        if caractere.isdigit():
+            seguidos += 1
+            if seguidos >= 4:
+                return None
+        else:
+            seguidos = 0
+            if not 32 <= ord(caractere) < 128:
+                return None
+    return [INICIO['B']] + [ord(caractere) - 32 for caractere in texto]
+
+
+def _code128_otimo(texto):
+    """
+    Inicio e trocas de conjunto que dao o menor simbolo: programacao dinamica
+    do fim para o inicio (custo[i][c] = simbolos para texto[i:] estando em c).
+    """
+    n = len(texto)
+    codigos = [ord(caractere) for caractere in texto]
+    pares = [texto[i:i + 2].isdigit() if i + 1 < n else False for i in range(n)]
+
+    custo = [None] * (n + 1)
+    custo[n] = (0, 0, 0)
+    for i in range(n - 1, -1, -1):
+        valor_a, valor_b = _valores_caractere(codigos[i])
+        a = 1 + custo[i + 1][0] if valor_a is not None else INFINITO
+        b = 1 + custo[i + 1][1] if valor_b is not None else INFINITO
+        c = 1 + custo[i + 2][2] if pares[i] else INFINITO
+        custo[i] = (min(a, 1 + min(b, c)), min(b, 1 + min(a, c)), min(c, 1 + min(a, b)))
+
+    conjunto = min(range(3), key=lambda c: custo[0][c])
+    valores = [INICIO[CONJUNTOS[conjunto]]]
+    i = 0
+    while i < n:
+        if conjunto == 2:
+            direto = 1 + custo[i + 2][2] if pares[i] else INFINITO
+        else:
+            valor = _valores_caractere(codigos[i])[conjunto]
+            direto = 1 + custo[i + 1][conjunto] if valor is not None else INFINITO
+        if direto > custo[i][conjunto]:
+            # Trocar e mais barato (ou obrigatorio) aqui
+            conjunto = min((outro for outro in range(3) if outro != conjunto), key=lambda c: custo[i][c])
+            valores.append(TROCA[CONJUNTOS[conjunto]])
+        if conjunto == 2:
+            valores.append(int(texto[i:i + 2]))
+            i += 2
+        else:
+            valores.append(_valores_caractere(codigos[i])[conjunto])
+            i += 1
+    return valores
+
+
+def valores_code128(texto):
+    """Valores do simbolo (inicio, dados com as trocas e verificador), sem o stop"""
+    if not texto:
+        raise ValueError('Codigo vazio')
+    if not texto.isascii():
+        raise ValueError(f'Caractere fora do Code 128 em {texto!r}')
+
+    valores = _code128_curto(texto) or _code128_otimo(texto)
+    valores.append((valores[0] + sum(valor * peso for peso, valor in enumerate(valores[1:], 1))) % 103)
+    return valores
+
+
+def code128(texto):
+    """Padrao de modulos do Code 128"""
+    return ''.join(CODE128[valor] for valor in valores_code128(str(texto))) + CODE128_STOP
+
+
+def digito_verificador_gs1(digitos):
+    """Digito verificador GS1 (pesos 3 e 1 a partir da direita)"""
+    soma = sum(int(d) * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(digitos)))
+    return str((10 - soma % 10) % 10)
+
+
+def itf14(texto):
+    """Padrao de modulos do ITF-14 (DUN-14); com 13 digitos calcula o verificador"""
+    digitos = str(texto).strip()
+    if not (digitos.isdigit() and digitos.isascii()):
+        raise ValueError('ITF-14 aceita so digitos')
+    if len(digitos) == 13:
+        digitos += digito_verificador_gs1(digitos)
+    if len(digitos) != 14:
+        raise ValueError('ITF-14 precisa de 13 ou 14 digitos')
+
+    # Inicio: barra/espaco/barra/espaco estreitos; fim: barra larga, espaco e barra estreitos
+    partes = ['11001100']
+    for i in range(0, 14, 2):
+        barras, espacos = ITF_DIGITOS[int(digitos[i])], ITF_DIGITOS[int(digitos[i + 1])]
+        for barra, espaco in zip(barras, espacos):
+            partes.append('1' * ITF_LARGURA[barra] + '0' * ITF_LARGURA[espaco])
+    partes.append('11111' + '00' + '11')
+    return ''.join(partes)
+
+
+CODIFICADORES = {
+    'code128': code128,
+    'itf14': itf14
+}
+
+
+def modulos(simbologia, codigo):
+    """Padrao de modulos do codigo; ValueError se a simbologia nao for suportada"""
+    codificador = CODIFICADORES.get(simbologia)
+    if codificador is None:
+        raise ValueError(f'Simbologia nao suportada: {simbologia}')
+    return codificador(codigo)
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Indice de busca do catalogo de itens.
+
+- Descricao: indice invertido palavra -> ids dos itens e, para tolerar erros de
+  digitacao, trigramas -> palavras do vocabulario. A busca compara palavras
+  sem acento e sem diferenciar maiusculas.
+- Numero: lista ordenada de `numero_item` para autocompletar por prefixo.
+
+O indice e atualizado item a item (adicionar/remover), sem reconstrucao, e
+guarda so ids: as consultas devolvem ids e quem chama monta os itens.
+"""
+import bisect
+import heapq
+import re
+import unicodedata
+
+# Similaridade minima (coeficiente de Dice dos trigramas) para uma palavra do
+# vocabulario ser aceita como variante de uma palavra digitada errada
+SIMILARIDADE_MINIMA = 0.5
+# Quantas palavras do vocabulario um prefixo pode expandir
+MAXIMO_EXPANSOES = 64
+
+_SEPARADORES = re.compile(r'[^0-9A-Z]+')
+
+
+def normalizar(texto):
+    """Remove acentos, passa para maiusculas e troca pontuacao por espaco"""
+    texto = texto or ''
+    if not texto.isascii():
+        texto = unicodedata.normalize('NFKD', texto)
+        texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return _SEPARADORES.sub(' ', texto.upper()).strip()
+
+
+def palavras(texto):
+    """Palavras normalizadas de um texto (sem repeticao, na ordem)"""
+    return list(dict.fromkeys(normalizar(texto).split()))
+
+
+def trigramas(palavra):
+    """Trigramas de uma palavra com marcadores de inicio e fim"""
+    marcada = f' {palavra} '
+    return {marcada[i:i + 3] for i in range(len(marcada) - 2)}
+
+
+class IndiceBusca:
+    """Indice de descricao (palavras + trigramas) e de numero (prefixo)"""
+
+    def __init__(self, itens=()):
+        # palavra -> {id do item}
+        self._postagens = {}
+        # trigrama -> {palavra}
+        self._trigramas = {}
+        # vocabulario ordenado (expansao por prefixo)
+        self._vocabulario = []
+        # (numero normalizado, id) ordenados (autocompletar)
+        self._numeros = []
+        # id -> (palavras, numero normalizado)
+        self._por_id = {}
+        # id -> (tamanho da descricao, id): desempate, descricao curta primeiro
+        self._desempate = {}
+
+        # Carga inicial: acrescenta tudo e ordena uma vez so no final
+        for item in itens:
+            self.adicionar(item, ordenar=False)
+        self._vocabulario.sort()
+        self._numeros.sort()
+
+    def __len__(self):
+        return len(self._por_id)
+
+    # ========== MANUTENCAO ==========
+
+    def adicionar(self, item, ordenar=True):
+        """Indexa um item (ou reindexa, se o id ja existia)"""
+        item_id = item['id']
+        if item_id in self._por_id:
+            self.remover(item_id)
+
+        termos = palavras(item.get('descricao'))
+        numero = normalizar(item.get('numero_item'))
+        self._por_id[item_id] = (termos, numero)
+        self._desempate[item_id] = (len(item.get('descricao') or ''), item_id)
+
+        for termo in termos:
+            ids = self._postagens.get(termo)
+            if ids is None:
+                ids = self._postagens[termo] = set()
+                if ordenar:
+                    bisect.insort(self._vocabulario, termo)
+                else:
+                    self._vocabulario.append(termo)
+                for trigrama in trigramas(termo):
+                    self._trigramas.setdefault(trigrama, set()).add(termo)
+            ids.add(item_id)
+        if ordenar:
+            bisect.insort(self._numeros, (numero, item_id))
+        else:
+            self._numeros.append((numero, item_id))
+
+    def remover(self, item_id):
+        """Retira um item do indice"""
+        registro = self._por_id.pop(item_id, None)
+        if registro is None:
+            return
+        termos, numero = registro
+        del self._desempate[item_id]
+
+        for termo in termos:
+            ids = self._postagens[termo]
+            ids.discard(item_id)
+            if ids:
+                continue
+            # Palavra saiu do vocabulario
+            del self._postagens[termo]
+            del self._vocabulario[bisect.bisect_left(self._vocabulario, termo)]
+            for trigrama in trigramas(termo):
+                palavras_trigrama = self._trigramas[trigrama]
+                palavras_trigrama.discard(termo)
+                if not palavras_trigrama:
+                    del self._trigramas[trigrama]
+
+        i = bisect.bisect_left(self._numeros, (numero, item_id))
+        if i < len(self._numeros) and self._numeros[i] == (numero, item_id):
+            del self._numeros[i]
+
+    # ========== CONSULTAS ==========
+
+    def por_prefixo_numero(self, prefixo, limite=10):
+        """Ids dos itens cujo numero comeca com o prefixo, em ordem de numero"""
+        prefixo = normalizar(prefixo)
+        if not prefixo:
+            return []
+        resultado = []
+        i = bisect.bisect_left(self._numeros, (prefixo,))
+        while i < len(self._numeros) and len(resultado) < limite:
+            numero, item_id = self._numeros[i]
+            if not numero.startswith(prefixo):
+                break
+            resultado.append(item_id)
+            i += 1
+        return resultado
+
+    def _variantes(self, termo):
+        """
+        Palavras do vocabulario que respondem pelo termo digitado e o peso de
+        cada uma: 1.0 igual, 0.9 comeca com o termo, Dice dos trigramas para
+        palavras parecidas (erro de digitacao).
+        """
+        variantes = {}
+
+        # Termo de uma letra so vale como palavra inteira (prefixo traria tudo)
+        i = bisect.bisect_left(self._vocabulario, termo)
+        if len(termo) < 2:
+            if i < len(self._vocabulario) and self._vocabulario[i] == termo:
+                variantes[termo] = 1.0
+            return variantes
+        fim = min(len(self._vocabulario), i + MAXIMO_EXPANSOES)
+        while i < fim and self._vocabulario[i].startswith(termo):
+            palavra = self._vocabulario[i]
+            variantes[palavra] = 1.0 if palavra == termo else 0.9
+            i += 1
+
+        if len(termo) >= 3 and termo not in variantes:
+            grams = trigramas(termo)
+            contagem = {}
+            for trigrama in grams:
+                for palavra in self._trigramas.get(trigrama, ()):
+                    contagem[palavra] = contagem.get(palavra, 0) + 1
+            for palavra, comuns in contagem.items():
+                similaridade = 2.0 * comuns / (len(grams) + len(palavra) + 2)
+                if similaridade >= SIMILARIDADE_MINIMA and palavra not in variantes:
+                    variantes[palavra] = similaridade * 0.8
+
+        return variantes
+
+    def _pontuar_termo(self, variantes):
+        """id do item -> melhor peso entre as variantes do termo"""
+        pesos = {}
+        # Do menor peso para o maior: o update final deixa o melhor peso
+        for palavra, peso in sorted(variantes.items(), key=lambda v: v[1]):
+            pesos.update(dict.fromkeys(self._postagens[palavra], peso))
+        return pesos
+
+    def _melhores(self, niveis, limite):
+        """
+        Escolhe ate `limite` ids percorrendo os niveis de peso do maior para o
+        menor; dentro de um nivel vale o desempate (descricao mais curta)
+        """
+        resultado = []
+        vistos = set()
+        for peso in sorted(niveis, reverse=True):
+            ids = niveis[peso] - vistos
+            resultado.extend(heapq.nsmallest(limite - len(resultado), ids, key=self._desempate.__getitem__))
+            if len(resultado) >= limite:
+                break
+            vistos |= ids
+        return resultado
+
+    def buscar(self, texto, limite=10):
+        """
+        Busca aproximada na descricao; retorna os ids dos itens.
+
+        Cada palavra digitada precisa casar (igual, como prefixo ou parecida)
+        com alguma palavra da descricao. Se nenhum item casa com todas, vale o
+        item que casa com mais palavras. Empates: descricao mais curta primeiro.
+        """
+        termos = palavras(texto)
+        if not termos:
+            return []
+
+        variantes = [self._variantes(termo) for termo in termos]
+
+        if len(termos) == 1:
+            # Um termo so: os niveis saem direto das listas de cada palavra,
+            # sem pontuar item por item
+            niveis = {}
+            for palavra, peso in variantes[0].items():
+                niveis.setdefault(peso, set()).update(self._postagens[palavra])
+            return self._melhores(niveis, limite)
+
+        pesos = sorted((self._pontuar_termo(v) for v in variantes), key=len)
+        candidatos = set(pesos[0])
+        for pesos_termo in pesos[1:]:
+            candidatos.intersection_update(pesos_termo)
+        if not candidatos:
+            # Nenhum item tem todas as palavras: ranking por soma parcial
+            candidatos = set().union(*pesos)
+
+        niveis = {}
+        for item_id in candidatos:
+            soma = round(sum(p.get(item_id, 0) for p in pesos), 6)
+            niveis.setdefault(soma, set()).add(item_id)
+        return self._melhores(niveis, limite)
@@ -0,0 +1,611 @@
+# -*- coding: utf-8 -*-
+"""
+Catalogo de itens em memoria.
+
+Os itens sao lidos do armazenamento uma unica vez por processo e mantidos em
+memoria em formato compacto (ColunasItens: vetores paralelos em vez de um dict
+por item), com indice por `numero_item`; os dicts so sao montados nas
+respostas. Depois da leitura o cache de registros do armazenamento e liberado,
+entao o catalogo e a unica copia em memoria. As alteracoes feitas pelo proprio
+processo atualizam as colunas no lugar; a colecao so e relida quando a
+assinatura do armazenamento muda por fora (ex: `git pull` no deploy.sh troca o
+mtime/tamanho do itens.json).
+
+O indice de busca (descricao aproximada e prefixo de numero) e montado na
+primeira busca e depois acompanha as alteracoes item a item.
+
+Com `caminho_snapshot`, enquanto o processo ainda nao carregou a colecao as
+consultas por numero/id sao respondidas pelo snapshot binario (mmap,
+compartilhado entre os workers), desde que ele seja da versao atual dos dados;
+listagens, buscas e gravacoes carregam o catalogo normalmente.
+
+Com `caminho_mudancas`, cada gravacao tambem entra no registro de mudancas
+(RegistroMudancas), de onde `mudancas_desde(seq)` tira so o que mudou depois de
+uma sequencia; gravacao e registro acontecem sob a mesma trava.
+"""
+import base64
+import json
+import threading
+from array import array
+from contextlib import contextmanager
+
+from lib.backend.armazenamento import versao_de
+from lib.backend.itens.busca import IndiceBusca
+from lib.backend.itens.colunar import ColunasItens
+from lib.backend.itens.mudancas import RegistroMudancas
+from lib.backend.itens.snapshot import SnapshotCompartilhado, gravar_snapshot
+
+# Campos aceitos na ordenacao da consulta paginada
+CAMPOS_ORDENACAO = ('id', 'numero_item', 'descricao', 'unidade_medida')
+# Acima disso, uma gravacao em lote reconstroi os indices em vez de atualiza-los
+LIMITE_ATUALIZACAO_INCREMENTAL = 500
+# Operacoes aceitas em executar_operacoes
+OPERACOES = ('create', 'update', 'upsert', 'delete')
+
+
+def chave_ordenacao(campo, valor):
+    """Chave de ordenacao: numeros antes e em ordem numerica, textos sem caixa"""
+    if campo == 'id':
+        return (0, valor, '')
+    valor = valor or ''
+    if campo == 'numero_item' and valor.isdigit():
+        return (0, int(valor), valor)
+    return (1, 0, valor.upper())
+
+
+def bisect_por_chave(posicoes, alvo, chave, direita=False):
+    """bisect_left/bisect_right em `posicoes` comparando chave(posicao) com alvo"""
+    inicio, fim = 0, len(posicoes)
+    while inicio < fim:
+        meio = (inicio + fim) // 2
+        valor = chave(posicoes[meio])
+        if valor < alvo or (direita and valor == alvo):
+            inicio = meio + 1
+        else:
+            fim = meio
+    return inicio
+
+
+def codificar_cursor(ordenacao, item):
+    """Cursor opaco com a posicao (campo de ordenacao + id) do ultimo item da pagina"""
+    campo = ordenacao.lstrip('-')
+    bruto = json.dumps([ordenacao, item[campo], item['id']], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(bruto).decode('ascii')
+
+
+def _inteiro(valor):
+    return isinstance(valor, int) and not isinstance(valor, bool)
+
+
+def decodificar_cursor(cursor):
+    """Retorna (ordenacao, valor, id) ou levanta ValueError"""
+    try:
+        ordenacao, valor, item_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('Cursor invalido')
+    # Tipos que chave_ordenacao espera: id inteiro; nos outros campos texto ou None
+    valor_valido = _inteiro(valor) if ordenacao in ('id', '-id') else valor is None or isinstance(valor, str)
+    if not (isinstance(ordenacao, str) and valor_valido and _inteiro(item_id)):
+        raise ValueError('Cursor invalido')
+    return ordenacao, valor, item_id
+
+
+class CatalogoItens:
+    """Catalogo de itens com indices em memoria e invalidacao por assinatura"""
+
+    def __init__(self, armazenamento, caminho_snapshot=None, caminho_mudancas=None):
+        self.armazenamento = armazenamento
+        self._snapshot = SnapshotCompartilhado(caminho_snapshot) if caminho_snapshot else None
+        self._mudancas = RegistroMudancas(caminho_mudancas) if caminho_mudancas else None
+        self._lock = threading.RLock()
+        self._assinatura = False
+        self._colunas = ColunasItens()
+        # numero_item -> posicao nas colunas
+        self._por_numero = {}
+        # Incrementada a cada mudanca nos indices (invalida as ordenacoes)
+        self._geracao = 0
+        self._ordenacoes = {}
+        self._busca = None
+
+    # ========== CARGA ==========
+
+    def _recarregar(self, assinatura):
+        """Le a colecao e reconstroi as colunas e os indices"""
+        colunas = ColunasItens(self.armazenamento.listar())
+        por_numero = {}
+        for pos in colunas.posicoes():
+            por_numero.setdefault(colunas.numeros[pos], pos)
+
+        self._colunas = colunas
+        self._por_numero = por_numero
+        self._assinatura = assinatura
+        self._geracao += 1
+        self._busca = None
+        self.armazenamento.liberar_cache()
+        if self._snapshot is not None:
+            self._snapshot.fechar()
+
+    def _garantir_atualizado(self):
+        """Recarrega o catalogo se os dados mudaram desde a ultima leitura"""
+        assinatura = self.armazenamento.assinatura()
+        if assinatura != self._assinatura:
+            with self._lock:
+                if assinatura != self._assinatura:
+                    self._recarregar(assinatura)
+
+    def _apos_gravar(self):
+        """
+        Depois de uma gravacao: se ninguem mais gravou antes dela, basta
+        registrar a assinatura nova; senao os indices sao reconstruidos.
+        """
+        if self.armazenamento.assinatura_antes == self._assinatura:
+            self._assinatura = self.armazenamento.assinatura_depois
+            self.armazenamento.liberar_cache()
+            return True
+        self._recarregar(self.armazenamento.assinatura_depois)
+        return False
+
+    def _leitor_snapshot(self):
+        """Snapshot da versao atual dos dados, se a colecao ainda nao foi carregada (ou None)"""
+        if self._snapshot is None or self._assinatura is not False:
+            return None
+        return self._snapshot.valido(self.armazenamento.assinatura())
+
+    def gerar_snapshot(self):
+        """Grava o snapshot binario com o conteudo atual; retorna a quantidade de itens"""
+        self._garantir_atualizado()
+        with self._lock:
+            colunas = self._colunas
+            itens = [colunas.item(pos) for pos in colunas.posicoes()]
+            gravar_snapshot(self._snapshot.caminho, itens, self._assinatura)
+            return len(itens)
+
+    @contextmanager
+    def _gravacao(self):
+        """Lock do processo e, com registro de mudancas, a trava dele (entre processos)"""
+        with self._lock:
+            if self._mudancas is None:
+                yield
+            else:
+                with self._mudancas.travado():
+                    yield
+
+    def _registrar(self, salvos=(), removidos=()):
+        """Anota a ultima gravacao no registro de mudancas (chamar em _gravacao)"""
+        if self._mudancas is not None:
+            self._mudancas.registrar(self.armazenamento.assinatura_antes,
+                                     self.armazenamento.assinatura_depois, salvos, removidos)
+
+    def _item(self, item_id):
+        """Dict do item pelo id (ou None)"""
+        pos = self._colunas.posicao(item_id)
+        return None if pos is None else self._colunas.item(pos)
+
+    def _item_por_numero(self, numero_item):
+        """Dict do item pelo numero (ou None)"""
+        pos = self._por_numero.get(numero_item)
+        return None if pos is None else self._colunas.item(pos)
+
+    def dados(self):
+        """Retorna o conteudo completo no formato do arquivo JSON"""
+        return self.armazenamento.carregar()
+
+    # ========== CONSULTAS ==========
+
+    # As gravacoes alteram as colunas no lugar: as leituras ficam no lock
+
+    def listar(self):
+        """Lista todos os itens na ordem de cadastro"""
+        self._garantir_atualizado()
+        with self._lock:
+            colunas = self._colunas
+            return [colunas.item(pos) for pos in colunas.posicoes()]
+
+    def buscar_por_id(self, item_id):
+        """Busca um item pelo ID (busca binaria nos ids)"""
+        leitor = self._leitor_snapshot()
+        if leitor is not None:
+            return leitor.buscar_por_id(item_id)
+        self._garantir_atualizado()
+        with self._lock:
+            return self._item(item_id)
+
+    def buscar_por_numero(self, numero_item):
+        """Busca um item pelo numero (O(1))"""
+        leitor = self._leitor_snapshot()
+        if leitor is not None:
+            return leitor.buscar_por_numero(str(numero_item))
+        self._garantir_atualizado()
+        with self._lock:
+            return self._item_por_numero(str(numero_item))
+
+    def buscar_por_numeros(self, numeros):
+        """Busca varios numeros de uma vez: retorna {numero: item} dos encontrados"""
+        leitor = self._leitor_snapshot()
+        if leitor is not None:
+            encontrados = {}
+            for numero in numeros:
+                numero = str(numero)
+                item = leitor.buscar_por_numero(numero)
+                if item is not None:
+                    encontrados[numero] = item
+            return encontrados
+        self._garantir_atualizado()
+        with self._lock:
+            por_numero = self._por_numero
+            colunas = self._colunas
+            encontrados = {}
+            for numero in numeros:
+                numero = str(numero)
+                pos = por_numero.get(numero)
+                if pos is not None:
+                    encontrados[numero] = colunas.item(pos)
+            return encontrados
+
+    def _chave(self, campo):
+        """Funcao posicao -> chave de ordenacao (campo + id)"""
+        colunas = self._colunas
+        return lambda pos: (chave_ordenacao(campo, colunas.valor(campo, pos)), colunas.ids[pos])
+
+    def _ordenacao(self, campo):
+        """Posicoes ordenadas pelo campo (+ id), em cache ate a proxima mudanca (chamar com o lock)"""
+        cache = self._ordenacoes.get(campo)
+        if cache is None or cache[0] != self._geracao:
+            if campo == 'id':
+                posicoes = array('I', self._colunas.posicoes())
+            else:
+                posicoes = array('I', sorted(self._colunas.posicoes(), key=self._chave(campo)))
+            cache = (self._geracao, posicoes)
+            self._ordenacoes[campo] = cache
+        return cache[1]
+
+    def _indice_busca(self):
+        """Indice de busca, montado na primeira utilizacao (chamar com o lock)"""
+        if self._busca is None:
+            colunas = self._colunas
+            self._busca = IndiceBusca(colunas.item(pos) for pos in colunas.posicoes())
+        return self._busca
+
+    def buscar_texto(self, texto, limite=10):
+        """Busca aproximada na descricao (sem acento, tolera erro de digitacao)"""
+        self._garantir_atualizado()
+        with self._lock:
+            return [self._item(item_id) for item_id in self._indice_busca().buscar(texto, limite)]
+
+    def autocompletar_numero(self, prefixo, limite=10):
+        """Itens cujo numero comeca com o prefixo"""
+        self._garantir_atualizado()
+        with self._lock:
+            return [self._item(item_id) for item_id in self._indice_busca().por_prefixo_numero(prefixo, limite)]
+
+    def consultar(self, pagina=1, tamanho_pagina=20, ordenacao='id', q=None, unidade_medida=None, cursor=None):
+        """
+        Consulta paginada com filtro e ordenacao.
+
+        `ordenacao` e um campo de CAMPOS_ORDENACAO, com '-' na frente para ordem
+        decrescente. `q` filtra por trecho do numero ou da descricao (sem
+        diferenciar maiusculas) e `unidade_medida` por igualdade. Com `cursor`
+        (devolvido como `proximo_cursor` na pagina anterior) a pagina comeca
+        logo depois do ultimo item ja visto, por busca binaria, sem percorrer
+        as paginas anteriores.
+
+        Retorna (itens_da_pagina, total_filtrado, proximo_cursor).
+        """
+        self._garantir_atualizado()
+        with self._lock:
+            return self._consultar(pagina, tamanho_pagina, ordenacao, q, unidade_medida, cursor)
+
+    def _consultar(self, pagina, tamanho_pagina, ordenacao, q, unidade_medida, cursor):
+        if cursor:
+            ordenacao_cursor, valor, ultimo_id = decodificar_cursor(cursor)
+            if ordenacao_cursor != ordenacao:
+                raise ValueError('Cursor de outra ordenacao')
+
+        campo = ordenacao.lstrip('-')
+        if campo not in CAMPOS_ORDENACAO:
+            raise ValueError(f'Ordenacao invalida: {ordenacao}')
+        decrescente = ordenacao.startswith('-')
+        itens = self._ordenacao(campo)
+        colunas = self._colunas
+
+        filtro_q = q.strip().upper() if q else None
+        filtro_unidade = unidade_medida.strip().upper() if unidade_medida else None
+        filtrado = bool(filtro_q or filtro_unidade)
+
+        def confere(pos):
+            if filtro_unidade and (colunas.unidade(pos) or '').upper() != filtro_unidade:
+                return False
+            if filtro_q and filtro_q not in colunas.numeros[pos].upper() \
+                    and filtro_q not in (colunas.descricao(pos) or '').upper():
+                return False
+            return True
+
+        # Intervalo [inicio, fim) de posicoes candidatas, no sentido da ordenacao
+        if cursor:
+            chave = (chave_ordenacao(campo, valor), ultimo_id)
+            if decrescente:
+                posicoes = range(bisect_por_chave(itens, chave, self._chave(campo)) - 1, -1, -1)
+            else:
+                posicoes = range(bisect_por_chave(itens, chave, self._chave(campo), direita=True), len(itens))
+            pular = 0
+        else:
+            posicoes = range(len(itens) - 1, -1, -1) if decrescente else range(len(itens))
+            pular = (pagina - 1) * tamanho_pagina
+
+        if not filtrado:
+            total = len(itens)
+            selecionadas = posicoes[pular:pular + tamanho_pagina]
+            pagina_itens = [colunas.item(itens[i]) for i in selecionadas]
+            tem_mais = len(posicoes) > pular + tamanho_pagina
+        else:
+            total = sum(1 for pos in itens if confere(pos))
+            pagina_itens = []
+            tem_mais = False
+            for i in posicoes:
+                pos = itens[i]
+                if not confere(pos):
+                    continue
+                if pular:
+                    pular -= 1
+                    continue
+                if len(pagina_itens) == tamanho_pagina:
+                    tem_mais = True
+                    break
+                pagina_itens.append(colunas.item(pos))
+
+        proximo_cursor = codificar_cursor(ordenacao, pagina_itens[-1]) if tem_mais and pagina_itens else None
+        return pagina_itens, total, proximo_cursor
+
+    def mudancas_desde(self, seq):
+        """
+        Mudancas depois da sequencia `seq` (None = cliente sem copia).
+
+        Retorna (seq_atual, itens, removidos): os itens alterados (estado atual)
+        e os ids removidos; quando o cliente precisa recarregar tudo, `itens` e
+        o catalogo inteiro e `removidos` e None.
+        """
+        with self._gravacao():
+            self._garantir_atualizado()
+            # Assinatura dos dados carregados (os que vao na resposta)
+            seq_atual, ids = self._mudancas.desde(seq, self._assinatura)
+            if ids is None:
+                colunas = self._colunas
+                return seq_atual, [colunas.item(pos) for pos in colunas.posicoes()], None
+            itens, removidos = [], []
+            for item_id in ids:
+                item = self._item(item_id)
+                if item is None:
+                    removidos.append(item_id)
+                else:
+                    itens.append(item)
+            return seq_atual, itens, removidos
+
+    # ========== ALTERACOES ==========
+
+    def _indexar(self, item):
+        self._geracao += 1
+        if self._busca is not None:
+            self._busca.adicionar(item)
+        colunas = self._colunas
+        pos = colunas.posicao(item['id'])
+        if pos is None:
+            pos = colunas.adicionar(item)
+        else:
+            colunas.substituir(pos, item)
+        atual = self._por_numero.get(item['numero_item'])
+        if atual is None or atual == pos:
+            self._por_numero[item['numero_item']] = pos
+
+    def _desindexar_numero(self, item):
+        numero = item['numero_item']
+        colunas = self._colunas
+        pos = self._por_numero.get(numero)
+        if pos is None or colunas.ids[pos] != item['id']:
+            return
+        del self._por_numero[numero]
+        # Se havia outro item com o mesmo numero, ele passa a responder
+        for outro in colunas.posicoes():
+            if outro != pos and colunas.numeros[outro] == numero:
+                self._por_numero[numero] = outro
+                break
+
+    def _desindexar(self, item):
+        """Retira um item removido das colunas e dos indices"""
+        self._geracao += 1
+        pos = self._colunas.posicao(item['id'])
+        self._desindexar_numero(item)
+        self._colunas.remover(pos)
+        if self._busca is not None:
+            self._busca.remover(item['id'])
+
+    def criar(self, numero_item, descricao, unidade_medida):
+        """Cria um novo item"""
+        with self._gravacao():
+            self._garantir_atualizado()
+
+            novo_item = self.armazenamento.inserir({
+                'id': None,
+                'numero_item': numero_item,
+                'descricao': descricao,
+                'unidade_medida': unidade_medida
+            })
+
+            if self._apos_gravar():
+                self._indexar(novo_item)
+            self._registrar(salvos=[novo_item['id']])
+            return novo_item
+
+    def atualizar(self, item_id, numero_item, descricao, unidade_medida, versao=None):
+        """Atualiza um item existente (versao: controle de concorrencia otimista)"""
+        with self._gravacao():
+            self._garantir_atualizado()
+
+            atual = self._item(item_id)
+            if atual is None:
+                return None
+
+            item = self.armazenamento.salvar(dict(
+                atual,
+                numero_item=numero_item,
+                descricao=descricao,
+                unidade_medida=unidade_medida
+            ), versao_esperada=versao)
+            if item is None:
+                self._apos_gravar()
+                return None
+
+            if self._apos_gravar():
+                if atual['numero_item'] != numero_item:
+                    self._desindexar_numero(atual)
+                self._indexar(item)
+            self._registrar(salvos=[item_id])
+            return item
+
+    def deletar(self, item_id):
+        """Deleta um item"""
+        with self._gravacao():
+            self._garantir_atualizado()
+
+            item = self._item(item_id)
+            if item is None:
+                return False
+
+            removido = self.armazenamento.remover(item_id) is not None
+            if self._apos_gravar() and removido:
+                self._desindexar(item)
+            if removido:
+                self._registrar(removidos=[item_id])
+            return removido
+
+    def aplicar(self, inserir=(), salvar=(), remover=()):
+        """
+        Varias alteracoes em uma unica gravacao (ver Armazenamento.aplicar).
+
+        Lotes pequenos atualizam os indices item a item; lotes grandes (ex:
+        importacao da planilha) reconstroem os indices uma vez so.
+        Retorna (inseridos, salvos, removidos).
+        """
+        with self._gravacao():
+            self._garantir_atualizado()
+            anteriores = {registro['id']: self._item(registro['id']) for registro, _ in salvar}
+
+            inseridos, salvos, removidos = self.armazenamento.aplicar(inserir, salvar, remover)
+            self._registrar(
+                salvos=[item['id'] for item in salvos if item is not None] + [item['id'] for item in inseridos],
+                removidos=[item['id'] for item in removidos if item is not None])
+
+            if not self._apos_gravar():
+                return inseridos, salvos, removidos
+            if len(inseridos) + len(salvos) + len(removidos) > LIMITE_ATUALIZACAO_INCREMENTAL:
+                self._recarregar(self._assinatura)
+                return inseridos, salvos, removidos
+
+            for item in salvos:
+                if item is None:
+                    continue
+                atual = anteriores.get(item['id'])
+                if atual is not None and atual['numero_item'] != item['numero_item']:
+                    self._desindexar_numero(atual)
+                self._indexar(item)
+            for item in removidos:
+                if item is not None:
+                    self._desindexar(item)
+            for item in inseridos:
+                self._indexar(item)
+            return inseridos, salvos, removidos
+
+    def _validar_operacao(self, operacao, numeros_lote):
+        """Confere uma operacao do lote; retorna a mensagem de erro ou None"""
+        if not isinstance(operacao, dict):
+            return 'Operacao deve ser um objeto'
+        op = operacao.get('op')
+        if op not in OPERACOES:
+            return f"op deve ser um de: {', '.join(OPERACOES)}"
+        numero = operacao.get('numero_item')
+        if not isinstance(numero, str) or not numero.strip():
+            return 'Numero do item e obrigatorio'
+        numero = numero.strip()
+        if numero in numeros_lote:
+            return 'Numero do item repetido no lote'
+        numeros_lote.add(numero)
+
+        for campo in ('descricao', 'unidade_medida'):
+            if operacao.get(campo) is not None and not isinstance(operacao[campo], str):
+                return f'{campo} deve ser texto'
+
+        atual = self._item_por_numero(numero)
+        if op == 'create' and atual is not None:
+            return 'Item ja existe'
+        if op in ('update', 'delete') and atual is None:
+            return 'Item nao encontrado'
+        versao = operacao.get('versao')
+        if versao is not None and atual is not None and versao_de(atual) != versao:
+            return f'Item alterado por outro usuario (versao atual {versao_de(atual)})'
+        return None
+
+    def executar_operacoes(self, operacoes):
+        """
+        Lote de operacoes por `numero_item`: create, update, upsert e delete.
+
+        Cada operacao e um dict com `op`, `numero_item` e, para create/update/
+        upsert, `descricao` e `unidade_medida` (no update, campo ausente mantem
+        o valor atual). `versao` opcional confere a versao do item.
+
+        Todas as operacoes sao validadas antes; se alguma falhar nada e
+        gravado. As validas vao para o armazenamento em uma unica gravacao.
+        Retorna (sucesso, resultados) com um resultado por operacao, na ordem.
+        """
+        with self._gravacao():
+            self._garantir_atualizado()
+
+            numeros_lote = set()
+            erros = [self._validar_operacao(operacao, numeros_lote) for operacao in operacoes]
+            if any(erros):
+                resultados = []
+                for i, (operacao, erro) in enumerate(zip(operacoes, erros)):
+                    resultado = {
+                        'indice': i,
+                        'numero_item': operacao.get('numero_item') if isinstance(operacao, dict) else None,
+                        'status': 'erro' if erro else 'nao_aplicado'
+                    }
+                    if erro:
+                        resultado['erro'] = erro
+                    resultados.append(resultado)
+                return False, resultados
+
+            inserir, salvar, remover = [], [], []
+            destinos = []
+            for operacao in operacoes:
+                numero = operacao['numero_item'].strip()
+                atual = self._item_por_numero(numero)
+                if operacao['op'] == 'delete':
+                    destinos.append(('excluido', 'remover', len(remover)))
+                    remover.append(atual['id'])
+                elif atual is None:
+                    destinos.append(('criado', 'inserir', len(inserir)))
+                    inserir.append({
+                        'id': None,
+                        'numero_item': numero,
+                        'descricao': (operacao.get('descricao') or '').strip(),
+                        'unidade_medida': (operacao.get('unidade_medida') or '').strip()
+                    })
+                else:
+                    alteracoes = {campo: operacao[campo].strip() for campo in ('descricao', 'unidade_medida')
+                                  if operacao.get(campo) is not None}
+                    destinos.append(('atualizado', 'salvar', len(salvar)))
+                    salvar.append((dict(atual, **alteracoes), operacao.get('versao')))
+
+            gravados = dict(zip(('inserir', 'salvar', 'remover'),
+                                self.aplicar(inserir=inserir, salvar=salvar, remover=remover)))
+
+            resultados = []
+            for i, (status, lista, posicao) in enumerate(destinos):
+                item = gravados[lista][posicao]
+                resultado = {'indice': i, 'numero_item': operacoes[i]['numero_item'].strip(), 'status': status}
+                if item is None:
+                    # Removido por outro processo entre a validacao e a gravacao
+                    resultado.update(status='erro', erro='Item nao encontrado')
+                else:
+                    resultado['item'] = item
+                resultados.append(resultado)
+            return True, resultados
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Representacao compacta (em colunas) dos itens do catalogo.
+
+Cada item ocupa uma posicao em vetores paralelos em vez de ser um dict:
+- id e versao em `array` de inteiros;
+- numero_item em uma lista de str (os mesmos objetos usados como chave no
+  indice por numero, entao nao ha copia);
+- unidade_medida como codigo de 1 byte para uma tabela de valores internados;
+- descricao em um unico buffer UTF-8, com inicio/tamanho de cada item.
+
+Os dicts so sao montados na saida (`item(pos)`). Campos fora desse formato
+(outro tipo ou chave desconhecida) ficam em `extras` para que o registro
+volte exatamente como foi gravado.
+
+Posicoes removidas ficam marcadas como inativas ate a proxima recarga; os
+ids sao crescentes, entao `posicao(id)` e uma busca binaria. Na carga os
+itens sao ordenados por id; linhas sem id inteiro ou com id repetido (edicao
+manual, importacao antiga) sao ignoradas com um aviso no log, ficando a
+primeira ocorrencia de cada id.
+"""
+import bisect
+import logging
+from array import array
+
+CAMPOS = ('id', 'numero_item', 'descricao', 'unidade_medida', 'versao')
+# Sem versao gravada (registros anteriores ao versionamento)
+SEM_VERSAO = 0
+
+logger = logging.getLogger(__name__)
+
+
+class ColunasItens:
+    """Itens em vetores paralelos, na ordem de id"""
+
+    def __init__(self, itens=()):
+        self.ids = array('q')
+        self.versoes = array('I')
+        self.numeros = []
+        self.unidades = array('B')
+        self.ativos = bytearray()
+        # Codigo 0 e reservado para item sem unidade
+        self._valores_unidade = [None]
+        self._codigo_unidade = {None: 0}
+        self._texto = bytearray()
+        self._inicio = array('I')
+        self._tamanho = array('I')
+        self._desperdicio = 0
+        self.extras = {}
+        self._quantidade = 0
+
+        validos = []
+        for item in itens:
+            item_id = item.get('id')
+            if isinstance(item_id, int) and not isinstance(item_id, bool):
+                validos.append(item)
+            else:
+                logger.warning('Item sem id inteiro ignorado no catalogo: %r', item_id)
+        # sort estavel: entre ids repetidos a primeira ocorrencia vem antes
+        if any(validos[i]['id'] >= validos[i + 1]['id'] for i in range(len(validos) - 1)):
+            validos.sort(key=lambda item: item['id'])
+        for item in validos:
+            if self.ids and item['id'] == self.ids[-1]:
+                logger.warning('Item %s repetido no catalogo: mantida a primeira ocorrencia', item['id'])
+                continue
+            self.adicionar(item)
+
+    def __len__(self):
+        return self._quantidade
+
+    # ========== LEITURA ==========
+
+    def posicao(self, item_id):
+        """Posicao do item ativo com esse id (ou None)"""
+        i = bisect.bisect_left(self.ids, item_id)
+        if i < len(self.ids) and self.ids[i] == item_id and self.ativos[i]:
+            return i
+        return None
+
+    def posicoes(self):
+        """Posicoes ativas, em ordem de id"""
+        ativos = self.ativos
+        return (i for i in range(len(ativos)) if ativos[i])
+
+    def descricao(self, pos):
+        extras = self.extras.get(pos)
+        if extras is not None and 'descricao' in extras:
+            return extras['descricao']
+        inicio = self._inicio[pos]
+        return self._texto[inicio:inicio + self._tamanho[pos]].decode('utf-8')
+
+    def unidade(self, pos):
+        return self._valores_unidade[self.unidades[pos]]
+
+    def valor(self, campo, pos):
+        """Valor de um campo sem montar o dict"""
+        if campo == 'id':
+            return self.ids[pos]
+        if campo == 'numero_item':
+            return self.numeros[pos]
+        if campo == 'descricao':
+            return self.descricao(pos)
+        if campo == 'unidade_medida':
+            return self.unidade(pos)
+        return self.item(pos).get(campo)
+
+    def item(self, pos):
+        """Monta o dict do item (formato do armazenamento)"""
+        item = {
+            'id': self.ids[pos],
+            'numero_item': self.numeros[pos],
+            'descricao': self.descricao(pos),
+            'unidade_medida': self.unidade(pos)
+        }
+        if self.versoes[pos] != SEM_VERSAO:
+            item['versao'] = self.versoes[pos]
+        extras = self.extras.get(pos)
+        if extras is not None:
+            item.update(extras)
+        return item
+
+    # ========== ALTERACOES ==========
+
+    def _codigo(self, unidade):
+        codigo = self._codigo_unidade.get(unidade)
+        if codigo is None:
+            if len(self._valores_unidade) > 255:
+                return None
+            codigo = self._codigo_unidade[unidade] = len(self._valores_unidade)
+            self._valores_unidade.append(unidade)
+        return codigo
+
+    def _separar(self, item):
+        """(numero, descricao em bytes, codigo da unidade, versao, extras)"""
+        extras = {chave: valor for chave, valor in item.items() if chave not in CAMPOS}
+
+        numero = item.get('numero_item')
+        if not isinstance(numero, str):
+            extras['numero_item'] = numero
+            numero = ''
+
+        descricao = item.get('descricao')
+        if isinstance(descricao, str):
+            descricao = descricao.encode('utf-8')
+        else:
+            extras['descricao'] = descricao
+            descricao = b''
+
+        unidade = item.get('unidade_medida')
+        codigo = self._codigo(unidade) if unidade is None or isinstance(unidade, str) else None
+        if codigo is None:
+            extras['unidade_medida'] = unidade
+            codigo = 0
+
+        versao = item.get('versao', SEM_VERSAO)
+        if not isinstance(versao, int) or isinstance(versao, bool) or not 0 < versao < 2 ** 32:
+            if 'versao' in item:
+                extras['versao'] = versao
+            versao = SEM_VERSAO
+
+        return numero, descricao, codigo, versao, extras or None
+
+    def adicionar(self, item):
+        """Acrescenta um item com id maior que todos os atuais; retorna a posicao"""
+        if self.ids and item['id'] <= self.ids[-1]:
+            raise ValueError(f"Item {item['id']} fora da ordem de id")
+        numero, descricao, codigo, versao, extras = self._separar(item)
+        pos = len(self.ids)
+        self.ids.append(item['id'])
+        self.versoes.append(versao)
+        self.numeros.append(numero)
+        self.unidades.append(codigo)
+        self.ativos.append(1)
+        self._inicio.append(len(self._texto))
+        self._tamanho.append(len(descricao))
+        self._texto += descricao
+        if extras:
+            self.extras[pos] = extras
+        self._quantidade += 1
+        return pos
+
+    def substituir(self, pos, item):
+        """Troca o conteudo da posicao pelo novo registro do mesmo id"""
+        numero, descricao, codigo, versao, extras = self._separar(item)
+        self.versoes[pos] = versao
+        self.numeros[pos] = numero
+        self.unidades[pos] = codigo
+        self._desperdicio += self._tamanho[pos]
+        self._inicio[pos] = len(self._texto)
+        self._tamanho[pos] = len(descricao)
+        self._texto += descricao
+        if extras:
+            self.extras[pos] = extras
+        else:
+            self.extras.pop(pos, None)
+        self._compactar_se_preciso()
+
+    def remover(self, pos):
+        """Marca a posicao como inativa"""
+        self.ativos[pos] = 0
+        self.numeros[pos] = ''
+        self.extras.pop(pos, None)
+        self._desperdicio += self._tamanho[pos]
+        self._tamanho[pos] = 0
+        self._quantidade -= 1
+        self._compactar_se_preciso()
+
+    def _compactar_se_preciso(self):
+        """Regrava o buffer de descricoes quando metade dele ja nao e usada"""
+        if self._desperdicio < 65536 or self._desperdicio * 2 < len(self._texto):
+            return
+        texto = bytearray()
+        for pos in range(len(self.ids)):
+            inicio = self._inicio[pos]
+            self._inicio[pos] = len(texto)
+            texto += self._texto[inicio:inicio + self._tamanho[pos]]
+        self._texto = texto
+        self._desperdicio = 0
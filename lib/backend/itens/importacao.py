@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Importacao da planilha de itens (itens.xlsx) para o catalogo.
+
+A planilha e lida em modo somente leitura, linha a linha (a planilha inteira
+nunca fica em memoria). Cada linha vira um hash de numero/descricao/unidade que
+e comparado com o hash do item atual de mesmo numero: numero novo e inserido,
+hash diferente e atualizado, hash igual e ignorado. Todas as alteracoes vao
+para o armazenamento em uma unica gravacao.
+
+Uso pela linha de comando:
+    python -m lib.backend.itens.importacao [caminho/itens.xlsx]
+"""
+import hashlib
+import os
+import sys
+import time
+
+from openpyxl import load_workbook
+
+from lib.backend.armazenamento import versao_de
+from lib.backend.itens.busca import normalizar
+
+PLANILHA_PADRAO = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), 'itens.xlsx'
+)
+
+# Cabecalhos aceitos para cada campo (comparados sem acento/pontuacao)
+CABECALHOS = {
+    'numero_item': ('NO DO ITEM', 'N DO ITEM', 'NUMERO DO ITEM', 'NUMERO ITEM', 'N ITEM', 'ITEM'),
+    'descricao': ('DESCRICAO DO ITEM', 'DESCRICAO'),
+    'unidade_medida': ('UNIDADE DE MEDIDA DE ESTOQUE', 'UNIDADE DE MEDIDA', 'UNIDADE MEDIDA', 'UNIDADE'),
+}
+
+
+def texto_celula(valor):
+    """Valor da celula como texto (numeros inteiros sem '.0')"""
+    if valor is None:
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    return str(valor).strip()
+
+
+def hash_item(numero_item, descricao, unidade_medida):
+    """Hash do conteudo importado de um item"""
+    conteudo = '\x1f'.join((numero_item, descricao or '', unidade_medida or ''))
+    return hashlib.blake2b(conteudo.encode('utf-8'), digest_size=16).digest()
+
+
+def localizar_colunas(cabecalho):
+    """Indice da coluna de cada campo a partir da linha de cabecalho"""
+    nomes = [normalizar(texto_celula(valor)) for valor in cabecalho]
+    colunas = {}
+    for campo, aceitos in CABECALHOS.items():
+        for aceito in aceitos:
+            if aceito in nomes:
+                colunas[campo] = nomes.index(aceito)
+                break
+    if 'numero_item' not in colunas or 'descricao' not in colunas:
+        raise ValueError('Planilha sem as colunas de numero e descricao do item')
+    return colunas
+
+
+def ler_planilha(origem):
+    """
+    Gera (numero_item, descricao, unidade_medida) para cada linha da primeira
+    aba. `origem` e um caminho ou um arquivo binario (upload).
+    """
+    livro = load_workbook(origem, read_only=True, data_only=True)
+    try:
+        aba = livro.worksheets[0]
+        colunas = localizar_colunas(next(aba.iter_rows(max_row=1, values_only=True), ()))
+        # So monta as celulas ate a ultima coluna usada (a planilha tem dezenas
+        # de colunas de preco)
+        ultima = max(colunas.values())
+        linhas = aba.iter_rows(min_row=2, max_col=ultima + 1, values_only=True)
+        col_numero = colunas['numero_item']
+        col_descricao = colunas['descricao']
+        col_unidade = colunas.get('unidade_medida')
+
+        for linha in linhas:
+            if len(linha) <= ultima:
+                linha = tuple(linha) + (None,) * (ultima + 1 - len(linha))
+            yield (
+                texto_celula(linha[col_numero]),
+                texto_celula(linha[col_descricao]),
+                texto_celula(linha[col_unidade]) if col_unidade is not None else ''
+            )
+    finally:
+        livro.close()
+
+
+def importar_planilha(origem, catalogo):
+    """
+    Importa a planilha para o catalogo e retorna o resumo:
+    inseridos, atualizados, ignorados (sem alteracao) e invalidos (sem numero
+    ou numero repetido na planilha).
+
+    Levanta ConflitoVersao se outro processo alterar um dos itens no meio da
+    importacao (nada e gravado nesse caso).
+    """
+    inicio = time.perf_counter()
+
+    # numero -> (hash atual, item); com numero repetido no catalogo vale o
+    # mesmo item que buscar_por_numero devolve (o primeiro)
+    atuais = {}
+    for item in catalogo.listar():
+        numero = item['numero_item']
+        if numero not in atuais:
+            atuais[numero] = (hash_item(numero, item.get('descricao'), item.get('unidade_medida')), item)
+
+    inserir = []
+    salvar = []
+    ignorados = 0
+    invalidos = 0
+    vistos = set()
+
+    for numero_item, descricao, unidade_medida in ler_planilha(origem):
+        if not numero_item or numero_item in vistos:
+            invalidos += 1
+            continue
+        vistos.add(numero_item)
+
+        atual = atuais.get(numero_item)
+        if atual is None:
+            inserir.append({
+                'id': None,
+                'numero_item': numero_item,
+                'descricao': descricao,
+                'unidade_medida': unidade_medida
+            })
+        elif atual[0] != hash_item(numero_item, descricao, unidade_medida):
+            item = atual[1]
+            salvar.append((dict(item, descricao=descricao, unidade_medida=unidade_medida), versao_de(item)))
+        else:
+            ignorados += 1
+
+    if inserir or salvar:
+        catalogo.aplicar(inserir=inserir, salvar=salvar)
+
+    return {
+        'inseridos': len(inserir),
+        'atualizados': len(salvar),
+        'ignorados': ignorados,
+        'invalidos': invalidos,
+        'segundos': round(time.perf_counter() - inicio, 3)
+    }
+
+
+if __name__ == '__main__':
+    from lib.backend.itens.service import importar_itens
+
+    caminho = sys.argv[1] if len(sys.argv) > 1 else PLANILHA_PADRAO
+    resumo = importar_itens(caminho)
+    print(f"Importacao de {caminho}")
+    print(f"  inseridos:   {resumo['inseridos']}")
+    print(f"  atualizados: {resumo['atualizados']}")
+    print(f"  ignorados:   {resumo['ignorados']}")
+    print(f"  invalidos:   {resumo['invalidos']}")
+    print(f"  tempo:       {resumo['segundos']}s")
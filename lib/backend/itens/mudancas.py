@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Registro de mudancas do catalogo de itens (sequencia de alteracoes).
+
+Cada gravacao feita pelo catalogo anexa ao arquivo (itens.mudancas) uma linha
+JSON por item alterado, com um numero de sequencia crescente:
+    {"seq": 1718000000123, "op": "salvar", "id": 12}
+    {"seq": 1718000000124, "op": "remover", "id": 40, "assinatura": [...]}
+A ultima linha de cada gravacao leva a assinatura do armazenamento depois
+dela. Quem guarda uma copia do catalogo (a tela de itens, no IndexedDB)
+pede so o que mudou depois da ultima sequencia que viu.
+
+Se a assinatura atual nao for a ultima registrada, os dados mudaram por fora
+do registro (deploy trocando o itens.json, compactacao do journal, processo
+que caiu entre a gravacao e o registro): entra um marcador `inicio` e quem
+esta antes dele recarrega tudo. Um registro novo (arquivo apagado) comeca a
+sequencia no horario atual em milissegundos, entao fica sempre acima das
+sequencias de um registro anterior.
+
+Gravacao e registro rodam sob a mesma trava de arquivo (<arquivo>.lock),
+entao a ordem das sequencias e a ordem das gravacoes entre os processos. O
+arquivo nao precisa de fsync: uma linha perdida so provoca uma recarga.
+"""
+import bisect
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from lib.backend.armazenamento.base import gravar_atomico, trava_arquivo
+from lib.backend.itens.snapshot import texto_assinatura
+
+# Linhas no arquivo antes de compactar (fica so a ultima mudanca de cada id)
+LIMITE_MUDANCAS = 20000
+
+
+class RegistroMudancas:
+    """Sequencia de mudancas do catalogo, compartilhada entre os processos"""
+
+    def __init__(self, caminho, limite=LIMITE_MUDANCAS):
+        self.caminho = caminho
+        self.caminho_trava = caminho + '.lock'
+        self.limite = limite
+        self._profundidade = 0
+        self._limpar()
+        self._inode = None
+
+    def _limpar(self):
+        # Sequencias (crescentes) e ids das mudancas desde o ultimo marcador
+        self._seqs = []
+        self._ids = []
+        self.seq = 0
+        # Clientes com sequencia menor que esta precisam recarregar tudo
+        self.inicio = 0
+        self.assinatura = None
+        self._offset = 0
+
+    # ========== LEITURA ==========
+
+    def _aplicar(self, registro):
+        seq = registro['seq']
+        if registro['op'] == 'inicio':
+            self._seqs = []
+            self._ids = []
+            self.inicio = seq
+        else:
+            self._seqs.append(seq)
+            self._ids.append(registro['id'])
+        self.seq = max(self.seq, seq)
+        if 'assinatura' in registro:
+            self.assinatura = texto_assinatura(registro['assinatura'])
+
+    def _ler(self):
+        """Acompanha o arquivo: le so as linhas novas, ou tudo se ele foi trocado"""
+        try:
+            st = os.stat(self.caminho)
+        except FileNotFoundError:
+            self._limpar()
+            self._inode = None
+            return
+        if st.st_ino != self._inode or st.st_size < self._offset:
+            self._limpar()
+            self._inode = st.st_ino
+        if st.st_size == self._offset:
+            return
+
+        with open(self.caminho, 'rb') as f:
+            f.seek(self._offset)
+            conteudo = f.read()
+        for linha in conteudo.splitlines(keepends=True):
+            if not linha.endswith(b'\n'):
+                break
+            try:
+                registro = json.loads(linha)
+            except ValueError:
+                break
+            self._aplicar(registro)
+            self._offset += len(linha)
+
+        # Resto de uma gravacao interrompida: descartado para nao emendar na proxima
+        if st.st_size > self._offset:
+            with open(self.caminho, 'r+b') as f:
+                f.truncate(self._offset)
+
+    @contextmanager
+    def travado(self):
+        """Trava entre processos com o registro atualizado (reentrante na mesma thread do catalogo)"""
+        if self._profundidade:
+            self._profundidade += 1
+            try:
+                yield self
+            finally:
+                self._profundidade -= 1
+            return
+        with trava_arquivo(self.caminho_trava):
+            self._profundidade = 1
+            try:
+                self._ler()
+                yield self
+            finally:
+                self._profundidade = 0
+
+    # ========== GRAVACAO (chamar em travado) ==========
+
+    def _proxima_seq(self):
+        return self.seq + 1 if self.seq else int(time.time() * 1000)
+
+    def _anexar(self, registros):
+        conteudo = b''.join(
+            (json.dumps(registro, separators=(',', ':')) + '\n').encode('utf-8') for registro in registros)
+        fd = os.open(self.caminho, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            escrito = 0
+            while escrito < len(conteudo):
+                escrito += os.write(fd, conteudo[escrito:])
+            self._inode = os.fstat(fd).st_ino
+        finally:
+            os.close(fd)
+        for registro in registros:
+            self._aplicar(registro)
+        self._offset += len(conteudo)
+
+    def _marcar_inicio(self, assinatura):
+        self._anexar([{'seq': self._proxima_seq(), 'op': 'inicio', 'assinatura': assinatura}])
+
+    def registrar(self, assinatura_antes, assinatura_depois, salvos=(), removidos=()):
+        """Registra os ids gravados/removidos por uma gravacao do catalogo"""
+        if not salvos and not removidos:
+            return
+        registros = []
+        if texto_assinatura(assinatura_antes) != self.assinatura:
+            # Alguem alterou os dados antes sem passar pelo registro
+            registros.append({'seq': self._proxima_seq(), 'op': 'inicio'})
+        seq = registros[0]['seq'] if registros else self._proxima_seq() - 1
+        for op, ids in (('salvar', salvos), ('remover', removidos)):
+            for registro_id in ids:
+                seq += 1
+                registros.append({'seq': seq, 'op': op, 'id': registro_id})
+        registros[-1]['assinatura'] = assinatura_depois
+        self._anexar(registros)
+
+        if len(self._seqs) > self.limite:
+            self._compactar()
+
+    def _compactar(self):
+        """Regrava o arquivo so com a ultima mudanca de cada id (e, se preciso, so as mais recentes)"""
+        ultimas = {}
+        for seq, registro_id in zip(self._seqs, self._ids):
+            ultimas.pop(registro_id, None)
+            ultimas[registro_id] = seq
+        mudancas = sorted((seq, registro_id) for registro_id, seq in ultimas.items())
+        inicio = self.inicio
+        if len(mudancas) > self.limite // 2:
+            corte = len(mudancas) - self.limite // 2
+            inicio = mudancas[corte - 1][0]
+            mudancas = mudancas[corte:]
+
+        assinatura = json.loads(self.assinatura) if self.assinatura is not None else None
+        registros = [{'seq': inicio, 'op': 'inicio', 'assinatura': assinatura}]
+        registros += [{'seq': s, 'op': 'salvar', 'id': registro_id} for s, registro_id in mudancas]
+        conteudo = b''.join(
+            (json.dumps(registro, separators=(',', ':')) + '\n').encode('utf-8') for registro in registros)
+        gravar_atomico(self.caminho, conteudo)
+
+        self._limpar()
+        for registro in registros:
+            self._aplicar(registro)
+        self._offset = len(conteudo)
+        self._inode = os.stat(self.caminho).st_ino
+
+    # ========== CONSULTA (chamar em travado) ==========
+
+    def desde(self, seq, assinatura):
+        """
+        Ids alterados depois da sequencia `seq`, na ordem das mudancas.
+
+        `assinatura` e a dos dados que o chamador vai devolver. Retorna
+        (sequencia_atual, ids) ou (sequencia_atual, None) quando o cliente
+        precisa recarregar tudo (sem sequencia, sequencia anterior a um
+        marcador ou desconhecida).
+        """
+        if texto_assinatura(assinatura) != self.assinatura:
+            self._marcar_inicio(assinatura)
+        if seq is None or seq < self.inicio or seq > self.seq:
+            return self.seq, None
+        i = bisect.bisect_right(self._seqs, seq)
+        return self.seq, list(dict.fromkeys(reversed(self._ids[i:])))[::-1]
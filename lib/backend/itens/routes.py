@@ -1,17 +1,33 @@
 # -*- coding: utf-8 -*-
 from flask import Blueprint, render_template, request, jsonify
 
+from lib.backend.armazenamento import ConflitoVersao
+from lib.backend.http_utils import com_etag, respostas, versao_if_match
 from lib.backend.itens.service import (
+    versao_itens,
     listar_itens,
+    consultar_itens,
+    mudancas_itens,
+    buscar_itens,
     buscar_item_por_id,
     buscar_item_por_numero,
+    buscar_itens_por_numeros,
     criar_item,
     atualizar_item,
-    deletar_item
+    deletar_item,
+    executar_lote_itens,
+    importar_itens
 )
 
 itens_bp = Blueprint('itens', __name__, url_prefix='/itens')
 
+TAMANHO_PAGINA_PADRAO = 20
+TAMANHO_PAGINA_MAXIMO = 500
+PARAMETROS_CONSULTA = ('page', 'page_size', 'sort', 'q', 'unidade_medida', 'cursor')
+LIMITE_BUSCA_MAXIMO = 50
+LIMITE_OPERACOES_LOTE = 10000
+LIMITE_NUMEROS_CONSULTA = 5000
+
 
 # ========== PAGINAS ==========
 
@@ -25,8 +41,101 @@ def home():
 
 @itens_bp.route('/api/itens', methods=['GET'])
 def api_listar_itens():
-    """Lista todos os itens"""
-    itens = listar_itens()
+    """
+    Lista os itens.
+
+    Sem parametros devolve o catalogo inteiro. Com qualquer um de page,
+    page_size, sort, q, unidade_medida ou cursor devolve so uma pagina:
+    - page / page_size: pagina (a partir de 1) e tamanho (max 500)
+    - sort: id, numero_item, descricao ou unidade_medida ('-' = decrescente)
+    - q: trecho do numero ou da descricao; unidade_medida: filtro exato
+    - cursor: valor de `proximo_cursor` da pagina anterior (paginas profundas)
+
+    Responde 304 quando o ETag/Last-Modified do cliente ainda vale.
+    """
+    return respostas.responder('itens', versao_itens(), _listar_itens)
+
+
+def _listar_itens():
+    if not any(parametro in request.args for parametro in PARAMETROS_CONSULTA):
+        itens = listar_itens()
+        return jsonify({
+            'dados': itens,
+            'total_registros': len(itens)
+        })
+
+    try:
+        pagina = max(1, int(request.args.get('page', 1)))
+        tamanho_pagina = int(request.args.get('page_size', TAMANHO_PAGINA_PADRAO))
+        tamanho_pagina = min(max(1, tamanho_pagina), TAMANHO_PAGINA_MAXIMO)
+    except ValueError:
+        return jsonify({'error': 'page e page_size devem ser numeros inteiros'}), 400
+
+    try:
+        itens, total, proximo_cursor = consultar_itens(
+            pagina=pagina,
+            tamanho_pagina=tamanho_pagina,
+            ordenacao=request.args.get('sort', 'id'),
+            q=request.args.get('q'),
+            unidade_medida=request.args.get('unidade_medida'),
+            cursor=request.args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'dados': itens,
+        'total_registros': total,
+        'pagina': pagina,
+        'tamanho_pagina': tamanho_pagina,
+        'total_paginas': (total + tamanho_pagina - 1) // tamanho_pagina,
+        'proximo_cursor': proximo_cursor
+    })
+
+
+@itens_bp.route('/api/itens/changes', methods=['GET'])
+def api_mudancas_itens():
+    """
+    Mudancas no catalogo depois de uma sequencia (?since=<seq>), para quem
+    guarda uma copia local (a tela de itens, no IndexedDB).
+
+    Retorna `seq` (guardar para a proxima chamada), `itens` (alterados, no
+    estado atual) e `removidos` (ids). Com `completo: true` (sem since, ou
+    sequencia antiga/desconhecida) `itens` e o catalogo inteiro e a copia
+    local deve ser substituida.
+    """
+    return respostas.responder('itens', versao_itens(), _mudancas_itens)
+
+
+def _mudancas_itens():
+    since = request.args.get('since', '').strip()
+    try:
+        seq = int(since) if since else None
+    except ValueError:
+        return jsonify({'error': 'since deve ser um numero inteiro'}), 400
+
+    seq_atual, itens, removidos = mudancas_itens(seq)
+    return jsonify({
+        'seq': seq_atual,
+        'completo': removidos is None,
+        'itens': itens,
+        'removidos': removidos or []
+    })
+
+
+@itens_bp.route('/api/itens/busca', methods=['GET'])
+def api_buscar_itens():
+    """
+    Busca para autocompletar (?q=texto&limite=10): itens cujo numero comeca
+    com o texto e, em seguida, itens com descricao parecida
+    """
+    texto = request.args.get('q', '').strip()
+    try:
+        limite = min(max(1, int(request.args.get('limite', 10))), LIMITE_BUSCA_MAXIMO)
+    except ValueError:
+        return jsonify({'error': 'limite deve ser um numero inteiro'}), 400
+
+    itens = buscar_itens(texto, limite) if texto else []
     return jsonify({
         'dados': itens,
         'total_registros': len(itens)
@@ -38,7 +147,7 @@ def api_buscar_item(item_id):
     """Busca um item pelo ID"""
     item = buscar_item_por_id(item_id)
     if item:
-        return jsonify(item)
+        return com_etag(jsonify(item), item)
     return jsonify({'error': 'Item nao encontrado'}), 404
 
 
@@ -47,10 +156,43 @@ def api_buscar_item_por_numero(numero_item):
     """Busca um item pelo numero"""
     item = buscar_item_por_numero(numero_item)
     if item:
-        return jsonify(item)
+        return com_etag(jsonify(item), item)
     return jsonify({'error': 'Item nao encontrado'}), 404
 
 
+@itens_bp.route('/api/itens/numero', methods=['GET', 'POST'])
+def api_buscar_itens_por_numeros():
+    """
+    Busca varios itens pelo numero em uma requisicao.
+
+    GET: ?numeros=1001,1002 (ou ?numero=1001&numero=1002). POST: lista JSON de
+    numeros ou {"numeros": [...]}. Retorna os encontrados em `itens`
+    (numero -> item) e os demais em `nao_encontrados`.
+    """
+    if request.method == 'POST':
+        dados = request.get_json(silent=True)
+        numeros = dados.get('numeros') if isinstance(dados, dict) else dados
+        if not isinstance(numeros, list):
+            return jsonify({'error': 'Envie uma lista de numeros ou {"numeros": [...]}'}), 400
+    else:
+        numeros = request.args.getlist('numero')
+        for valor in request.args.getlist('numeros'):
+            numeros.extend(valor.split(','))
+
+    # Sem repetidos, na ordem recebida
+    numeros = list(dict.fromkeys(str(numero).strip() for numero in numeros if numero is not None))
+    numeros = [numero for numero in numeros if numero]
+    if len(numeros) > LIMITE_NUMEROS_CONSULTA:
+        return jsonify({'error': f'Maximo de {LIMITE_NUMEROS_CONSULTA} numeros por consulta'}), 400
+
+    itens = buscar_itens_por_numeros(numeros)
+    return jsonify({
+        'itens': itens,
+        'nao_encontrados': [numero for numero in numeros if numero not in itens],
+        'total_encontrados': len(itens)
+    })
+
+
 @itens_bp.route('/api/itens', methods=['POST'])
 def api_criar_item():
     """Cria um novo item"""
@@ -71,6 +213,52 @@ def api_criar_item():
     })
 
 
+@itens_bp.route('/api/itens/batch', methods=['POST'])
+def api_lote_itens():
+    """
+    Cria, atualiza e exclui varios itens em uma unica gravacao.
+
+    Corpo: lista de operacoes (ou {"operacoes": [...]}), cada uma com
+    `op` (create, update, upsert ou delete), `numero_item`, `descricao`,
+    `unidade_medida` e `versao` opcional. Se alguma operacao for invalida,
+    nada e gravado e a resposta traz o erro de cada uma.
+    """
+    dados = request.get_json(silent=True)
+    operacoes = dados.get('operacoes') if isinstance(dados, dict) else dados
+    if not isinstance(operacoes, list) or not operacoes:
+        return jsonify({'error': 'Envie uma lista de operacoes'}), 400
+    if len(operacoes) > LIMITE_OPERACOES_LOTE:
+        return jsonify({'error': f'Maximo de {LIMITE_OPERACOES_LOTE} operacoes por lote'}), 400
+
+    try:
+        sucesso, resultados = executar_lote_itens(operacoes)
+    except ConflitoVersao as e:
+        return jsonify({
+            'error': 'Item alterado por outro usuario durante o lote. Nada foi gravado.',
+            'item': e.registro
+        }), 409
+
+    if not sucesso:
+        invalidas = sum(1 for resultado in resultados if resultado['status'] == 'erro')
+        return jsonify({
+            'success': False,
+            'error': f'{invalidas} operacao(oes) invalida(s). Nada foi gravado.',
+            'resultados': resultados
+        }), 400
+
+    resumo = {'criados': 0, 'atualizados': 0, 'excluidos': 0, 'erros': 0}
+    chaves = {'criado': 'criados', 'atualizado': 'atualizados', 'excluido': 'excluidos', 'erro': 'erros'}
+    for resultado in resultados:
+        resumo[chaves[resultado['status']]] += 1
+
+    return jsonify({
+        'success': True,
+        'message': 'Lote aplicado com sucesso',
+        'resumo': resumo,
+        'resultados': resultados
+    })
+
+
 @itens_bp.route('/api/itens/<int:item_id>', methods=['PUT'])
 def api_atualizar_item(item_id):
     """Atualiza um item"""
@@ -83,13 +271,20 @@ def api_atualizar_item(item_id):
     if not numero_item:
         return jsonify({'error': 'Numero do item e obrigatorio'}), 400
 
-    item = atualizar_item(item_id, numero_item, descricao, unidade_medida)
+    try:
+        item = atualizar_item(item_id, numero_item, descricao, unidade_medida, versao_if_match())
+    except ConflitoVersao as e:
+        return com_etag(jsonify({
+            'error': 'Item alterado por outro usuario. Recarregue e tente novamente.',
+            'item': e.registro
+        }), e.registro), 409
+
     if item:
-        return jsonify({
+        return com_etag(jsonify({
             'success': True,
             'message': 'Item atualizado com sucesso',
             'item': item
-        })
+        }), item)
     return jsonify({'error': 'Item nao encontrado'}), 404
 
 
@@ -102,3 +297,32 @@ def api_deletar_item(item_id):
             'message': 'Item excluido com sucesso'
         })
     return jsonify({'error': 'Item nao encontrado'}), 404
+
+
+@itens_bp.route('/api/itens/importar', methods=['POST'])
+def api_importar_itens():
+    """
+    Importa uma planilha .xlsx (campo `arquivo`): insere numeros novos,
+    atualiza os que mudaram e retorna o resumo da importacao
+    """
+    arquivo = request.files.get('arquivo')
+    if arquivo is None or not arquivo.filename:
+        return jsonify({'error': 'Envie a planilha no campo arquivo'}), 400
+    if not arquivo.filename.lower().endswith('.xlsx'):
+        return jsonify({'error': 'A planilha deve estar no formato .xlsx'}), 400
+
+    try:
+        resumo = importar_itens(arquivo.stream)
+    except ConflitoVersao:
+        return jsonify({'error': 'Itens alterados durante a importacao. Tente novamente.'}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Erro ao ler a planilha: {e}'}), 400
+
+    return jsonify({
+        'success': True,
+        'message': (f"Importacao concluida: {resumo['inseridos']} inseridos, "
+                    f"{resumo['atualizados']} atualizados, {resumo['ignorados']} sem alteracao"),
+        'resumo': resumo
+    })
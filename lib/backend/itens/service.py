@@ -1,89 +1,109 @@
 # -*- coding: utf-8 -*-
-import json
 import os
 
+from lib.backend.armazenamento import criar_armazenamento
+from lib.backend.itens.catalogo import CatalogoItens
+from lib.backend.itens.importacao import importar_planilha
+
 ITENS_FILE = os.path.join(os.path.dirname(__file__), 'data', 'itens.json')
+# Snapshot binario (mmap) compartilhado pelos workers; gerado no deploy
+ITENS_SNAPSHOT = os.path.join(os.path.dirname(__file__), 'data', 'itens.snap')
+# Registro de mudancas (sequencia de alteracoes para as copias dos clientes)
+ITENS_MUDANCAS = os.path.join(os.path.dirname(__file__), 'data', 'itens.mudancas')
+
+armazenamento = criar_armazenamento('itens', ITENS_FILE, 'proximo_id')
+
+# Catalogo compartilhado pelo processo (carregado sob demanda)
+catalogo = CatalogoItens(armazenamento, caminho_snapshot=ITENS_SNAPSHOT, caminho_mudancas=ITENS_MUDANCAS)
 
 
 def carregar_itens():
-    """Carrega os itens do arquivo JSON"""
-    if os.path.exists(ITENS_FILE):
-        with open(ITENS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {'itens': [], 'proximo_id': 1}
+    """Carrega os itens do armazenamento"""
+    return armazenamento.carregar()
 
 
 def salvar_itens(dados):
-    """Salva os itens no arquivo JSON"""
-    with open(ITENS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(dados, f, ensure_ascii=False, indent=2)
+    """Salva os itens no armazenamento"""
+    armazenamento.substituir(dados)
+
+
+def versao_itens():
+    """Versao dos dados de itens (muda a cada gravacao)"""
+    return armazenamento.assinatura()
 
 
 def listar_itens():
     """Lista todos os itens"""
-    dados = carregar_itens()
-    return dados['itens']
+    return catalogo.listar()
+
+
+def consultar_itens(pagina=1, tamanho_pagina=20, ordenacao='id', q=None, unidade_medida=None, cursor=None):
+    """Consulta paginada: retorna (itens_da_pagina, total_filtrado, proximo_cursor)"""
+    return catalogo.consultar(pagina, tamanho_pagina, ordenacao, q, unidade_medida, cursor)
+
+
+def mudancas_itens(seq):
+    """
+    Itens alterados/removidos depois da sequencia `seq`:
+    (seq_atual, itens, removidos), com removidos None se for a carga completa
+    """
+    return catalogo.mudancas_desde(seq)
+
+
+def buscar_itens(texto, limite=10):
+    """
+    Busca para autocompletar: primeiro os itens cujo numero comeca com o texto,
+    depois os de descricao parecida (sem repetir)
+    """
+    itens = catalogo.autocompletar_numero(texto, limite)
+    if len(itens) < limite:
+        vistos = {item['id'] for item in itens}
+        for item in catalogo.buscar_texto(texto, limite):
+            if item['id'] not in vistos and len(itens) < limite:
+                itens.append(item)
+    return itens
 
 
 def buscar_item_por_id(item_id):
     """Busca um item pelo ID"""
-    dados = carregar_itens()
-    for item in dados['itens']:
-        if item['id'] == item_id:
-            return item
-    return None
+    return catalogo.buscar_por_id(item_id)
 
 
 def buscar_item_por_numero(numero_item):
     """Busca um item pelo número"""
-    dados = carregar_itens()
-    for item in dados['itens']:
-        if item['numero_item'] == str(numero_item):
-            return item
-    return None
-
-
-def criar_item(numero_item, descricao, unidade_medida):
-    """Cria um novo item"""
-    dados = carregar_itens()
+    return catalogo.buscar_por_numero(numero_item)
 
-    novo_item = {
-        'id': dados['proximo_id'],
-        'numero_item': numero_item,
-        'descricao': descricao,
-        'unidade_medida': unidade_medida
-    }
 
-    dados['itens'].append(novo_item)
-    dados['proximo_id'] += 1
-    salvar_itens(dados)
+def buscar_itens_por_numeros(numeros):
+    """Busca varios itens pelo numero: retorna {numero: item} dos encontrados"""
+    return catalogo.buscar_por_numeros(numeros)
 
-    return novo_item
 
+def criar_item(numero_item, descricao, unidade_medida):
+    """Cria um novo item"""
+    return catalogo.criar(numero_item, descricao, unidade_medida)
 
-def atualizar_item(item_id, numero_item, descricao, unidade_medida):
-    """Atualiza um item existente"""
-    dados = carregar_itens()
-
-    for item in dados['itens']:
-        if item['id'] == item_id:
-            item['numero_item'] = numero_item
-            item['descricao'] = descricao
-            item['unidade_medida'] = unidade_medida
-            salvar_itens(dados)
-            return item
 
-    return None
+def atualizar_item(item_id, numero_item, descricao, unidade_medida, versao=None):
+    """Atualiza um item existente (levanta ConflitoVersao se a versao nao bater)"""
+    return catalogo.atualizar(item_id, numero_item, descricao, unidade_medida, versao)
 
 
 def deletar_item(item_id):
     """Deleta um item"""
-    dados = carregar_itens()
+    return catalogo.deletar(item_id)
+
+
+def executar_lote_itens(operacoes):
+    """
+    Aplica um lote de operacoes (create/update/upsert/delete por numero_item)
+    em uma unica gravacao. Retorna (sucesso, resultados por operacao).
+    """
+    return catalogo.executar_operacoes(operacoes)
 
-    for i, item in enumerate(dados['itens']):
-        if item['id'] == item_id:
-            dados['itens'].pop(i)
-            salvar_itens(dados)
-            return True
 
-    return False
+def importar_itens(origem):
+    """Importa a planilha de itens (caminho ou arquivo) e retorna o resumo"""
+    resumo = importar_planilha(origem, catalogo)
+    catalogo.gerar_snapshot()
+    return resumo
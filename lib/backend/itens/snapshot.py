@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Snapshot binario do catalogo de itens, lido por mmap.
+
+O arquivo (itens.snap) e gerado a partir do armazenamento e guarda a
+assinatura dos dados de onde saiu. Cada worker abre o arquivo com mmap: as
+paginas ficam no cache do sistema operacional e sao compartilhadas por todos
+os processos, e as consultas leem direto do buffer mapeado, sem parse.
+
+Enquanto a assinatura do armazenamento for a do snapshot, o catalogo responde
+as consultas por numero/id pelo snapshot sem carregar a colecao; depois de
+qualquer gravacao o snapshot deixa de valer ate ser gerado de novo.
+
+Formato (little-endian):
+- cabecalho (CABECALHO) seguido da assinatura em JSON;
+- registros de tamanho fixo (REGISTRO) em ordem de id;
+- tabela hash numero_item -> indice + 1 (0 = vazio), enderecamento aberto;
+- heap com os textos em UTF-8 (unidades repetidas sao gravadas uma vez).
+
+Gerado por `CatalogoItens.gerar_snapshot()`, no deploy (deploy.sh) e apos a
+importacao da planilha; pela linha de comando:
+    python -m lib.backend.itens.snapshot
+"""
+import json
+import mmap
+import struct
+import zlib
+
+from lib.backend.armazenamento.base import assinatura_arquivo, gravar_atomico
+
+MAGICO = b'ITENSNAP'
+FORMATO = 1
+# magico, formato, quantidade, slots da tabela, inicio dos registros,
+# inicio da tabela, inicio do heap, tamanho da assinatura
+CABECALHO = struct.Struct('<8sIIIQQQI')
+# id, versao, e (inicio, tamanho) no heap de numero, descricao, unidade e extras
+REGISTRO = struct.Struct('<qIIIIIIIII')
+SLOT = struct.Struct('<I')
+# Tamanho que representa None
+NULO = 0xFFFFFFFF
+CAMPOS = ('id', 'numero_item', 'descricao', 'unidade_medida', 'versao')
+
+
+def texto_assinatura(assinatura):
+    """Assinatura do armazenamento em forma comparavel entre processos"""
+    return json.dumps(assinatura)
+
+
+def hash_numero(numero):
+    """Hash estavel entre processos (o hash() do Python muda a cada processo)"""
+    return zlib.crc32(numero)
+
+
+# ========== GRAVACAO ==========
+
+def montar_snapshot(itens, assinatura):
+    """Conteudo binario do snapshot para os itens (dicts) e a assinatura"""
+    itens = sorted(itens, key=lambda item: item['id'])
+    heap = bytearray()
+    textos = {}
+
+    def guardar(texto, repetido=False):
+        if texto is None:
+            return 0, NULO
+        dados = texto.encode('utf-8')
+        if repetido and dados in textos:
+            return textos[dados]
+        posicao = (len(heap), len(dados))
+        heap.extend(dados)
+        if repetido:
+            textos[dados] = posicao
+        return posicao
+
+    slots = 16
+    while slots < len(itens) * 2:
+        slots *= 2
+    tabela = [0] * slots
+
+    registros = bytearray()
+    for indice, item in enumerate(itens):
+        extras = {chave: valor for chave, valor in item.items() if chave not in CAMPOS}
+        valores = {}
+        for campo in ('numero_item', 'descricao', 'unidade_medida'):
+            valor = item.get(campo)
+            if valor is not None and not isinstance(valor, str):
+                extras[campo] = valor
+                valor = None
+            valores[campo] = valor
+        versao = item.get('versao', 0)
+        if not isinstance(versao, int) or isinstance(versao, bool) or not 0 < versao < NULO:
+            if 'versao' in item:
+                extras['versao'] = versao
+            versao = 0
+
+        numero = guardar(valores['numero_item'])
+        descricao = guardar(valores['descricao'])
+        unidade = guardar(valores['unidade_medida'], repetido=True)
+        extra = guardar(json.dumps(extras, ensure_ascii=False)) if extras else (0, NULO)
+        registros += REGISTRO.pack(item['id'], versao, *numero, *descricao, *unidade, *extra)
+
+        # Numero repetido: vale o primeiro (menor id), como no catalogo
+        if valores['numero_item'] is not None:
+            dados = valores['numero_item'].encode('utf-8')
+            slot = hash_numero(dados) & (slots - 1)
+            while tabela[slot]:
+                outro = tabela[slot] - 1
+                if itens[outro]['numero_item'] == valores['numero_item']:
+                    break
+                slot = (slot + 1) & (slots - 1)
+            else:
+                tabela[slot] = indice + 1
+
+    assinatura = texto_assinatura(assinatura).encode('utf-8')
+    inicio_registros = CABECALHO.size + len(assinatura)
+    inicio_tabela = inicio_registros + len(registros)
+    inicio_heap = inicio_tabela + slots * SLOT.size
+    cabecalho = CABECALHO.pack(MAGICO, FORMATO, len(itens), slots,
+                               inicio_registros, inicio_tabela, inicio_heap, len(assinatura))
+    return b''.join((cabecalho, assinatura, registros, struct.pack(f'<{slots}I', *tabela), heap))
+
+
+def gravar_snapshot(caminho, itens, assinatura):
+    """Grava (troca atomica) o snapshot dos itens com a assinatura dos dados de origem"""
+    gravar_atomico(caminho, montar_snapshot(itens, assinatura))
+
+
+# ========== LEITURA ==========
+
+class SnapshotItens:
+    """Leitor do snapshot mapeado em memoria (somente leitura)"""
+
+    def __init__(self, caminho):
+        with open(caminho, 'rb') as f:
+            self._mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magico, formato, self._quantidade, self._slots, self._inicio_registros,
+             self._inicio_tabela, self._inicio_heap, tamanho_assinatura) = CABECALHO.unpack_from(self._mapa, 0)
+        except struct.error:
+            raise ValueError('Snapshot de itens invalido')
+        if magico != MAGICO or formato != FORMATO:
+            raise ValueError('Snapshot de itens invalido')
+        self.assinatura = self._mapa[CABECALHO.size:CABECALHO.size + tamanho_assinatura].decode('utf-8')
+
+    def __len__(self):
+        return self._quantidade
+
+    def _registro(self, indice):
+        return REGISTRO.unpack_from(self._mapa, self._inicio_registros + indice * REGISTRO.size)
+
+    def _texto(self, inicio, tamanho):
+        if tamanho == NULO:
+            return None
+        inicio += self._inicio_heap
+        return self._mapa[inicio:inicio + tamanho].decode('utf-8')
+
+    def item(self, indice):
+        """Monta o dict do item da posicao `indice`"""
+        (item_id, versao, numero, tam_numero, descricao, tam_descricao,
+         unidade, tam_unidade, extra, tam_extra) = self._registro(indice)
+        item = {
+            'id': item_id,
+            'numero_item': self._texto(numero, tam_numero),
+            'descricao': self._texto(descricao, tam_descricao),
+            'unidade_medida': self._texto(unidade, tam_unidade)
+        }
+        if versao:
+            item['versao'] = versao
+        if tam_extra != NULO:
+            item.update(json.loads(self._texto(extra, tam_extra)))
+        return item
+
+    def _indice_numero(self, numero):
+        dados = numero.encode('utf-8')
+        mascara = self._slots - 1
+        slot = hash_numero(dados) & mascara
+        while True:
+            valor = SLOT.unpack_from(self._mapa, self._inicio_tabela + slot * SLOT.size)[0]
+            if not valor:
+                return None
+            indice = valor - 1
+            _, _, inicio, tamanho = struct.unpack_from(
+                '<qIII', self._mapa, self._inicio_registros + indice * REGISTRO.size)
+            if tamanho == len(dados):
+                inicio += self._inicio_heap
+                if self._mapa[inicio:inicio + tamanho] == dados:
+                    return indice
+            slot = (slot + 1) & mascara
+
+    def buscar_por_numero(self, numero_item):
+        """Item pelo numero (tabela hash) ou None"""
+        indice = self._indice_numero(numero_item)
+        return None if indice is None else self.item(indice)
+
+    def buscar_por_id(self, item_id):
+        """Item pelo id (busca binaria nos registros, que estao em ordem de id) ou None"""
+        inicio, fim = 0, self._quantidade
+        while inicio < fim:
+            meio = (inicio + fim) // 2
+            atual = struct.unpack_from('<q', self._mapa, self._inicio_registros + meio * REGISTRO.size)[0]
+            if atual < item_id:
+                inicio = meio + 1
+            elif atual > item_id:
+                fim = meio
+            else:
+                return self.item(meio)
+        return None
+
+
+def abrir_snapshot(caminho):
+    """Abre o snapshot; None se o arquivo nao existir ou nao for valido"""
+    try:
+        return SnapshotItens(caminho)
+    except (OSError, ValueError):
+        return None
+
+
+class SnapshotCompartilhado:
+    """
+    Snapshot aberto sob demanda e reaberto quando o arquivo e trocado.
+    `valido(assinatura)` devolve o leitor se ele e da versao informada.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._leitor = None
+        self._arquivo = False
+
+    def valido(self, assinatura):
+        arquivo = assinatura_arquivo(self.caminho)
+        if arquivo != self._arquivo:
+            self._leitor = abrir_snapshot(self.caminho) if arquivo is not None else None
+            self._arquivo = arquivo
+        leitor = self._leitor
+        if leitor is not None and leitor.assinatura == texto_assinatura(assinatura):
+            return leitor
+        return None
+
+    def fechar(self):
+        """Solta o mapeamento (o catalogo ja tem os dados carregados)"""
+        self._leitor = None
+        self._arquivo = False
+
+
+if __name__ == '__main__':
+    from lib.backend.itens.service import ITENS_SNAPSHOT, catalogo
+
+    quantidade = catalogo.gerar_snapshot()
+    print(f"Snapshot com {quantidade} itens gravado em {ITENS_SNAPSHOT}")
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Provedor JSON da aplicacao usando orjson.
+
+O `jsonify` padrao do Flask ordena as chaves e codifica em Python puro; com
+o catalogo inteiro (milhares de itens) isso domina o tempo da resposta. O
+orjson codifica direto para bytes, sem ordenar. Se o pacote nao estiver
+instalado a aplicacao continua com o provedor padrao.
+"""
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # opcional
+    orjson = None
+
+
+class JsonRapido(DefaultJSONProvider):
+    """DefaultJSONProvider com dumps/loads/response feitos pelo orjson"""
+
+    def _opcoes(self):
+        opcoes = orjson.OPT_NON_STR_KEYS
+        if self.compact is False or (self.compact is None and self._app.debug):
+            opcoes |= orjson.OPT_INDENT_2
+        return opcoes
+
+    def _codificar(self, obj):
+        # Tipos que o orjson nao conhece (Decimal, date, ...) caem no default do Flask
+        return orjson.dumps(obj, default=self.default, option=self._opcoes())
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._codificar(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._codificar(obj), mimetype=self.mimetype)
+
+
+def configurar_json(app):
+    """Troca o provedor JSON da aplicacao pelo orjson quando disponivel"""
+    if orjson is not None:
+        app.json = JsonRapido(app)
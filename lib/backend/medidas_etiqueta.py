@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""Tamanho da etiqueta e da fonte aceitos pelos PDFs (industria e recebimento)"""
+import math
+
+LARGURA_PADRAO = 100
+ALTURA_PADRAO = 75
+TAMANHO_FONTE_PADRAO = 8
+# Faixas dos formularios (mm / pt); fora delas a pagina nao e uma etiqueta
+LARGURA_LIMITES = (50, 200)
+ALTURA_LIMITES = (40, 150)
+TAMANHO_FONTE_LIMITES = (4, 40)
+
+
+def _ler(valor, padrao, limites, mensagem):
+    """Valor do campo (vazio usa o padrao); ValueError se nao for finito ou estiver fora dos limites"""
+    if valor is None or str(valor).strip() == '':
+        return padrao
+    try:
+        numero = float(str(valor).replace(',', '.'))
+    except ValueError:
+        numero = math.nan
+    minimo, maximo = limites
+    if not (math.isfinite(numero) and minimo <= numero <= maximo):
+        raise ValueError(f'{mensagem} deve ser de {minimo} a {maximo}')
+    return numero
+
+
+def ler_medidas(configuracoes):
+    """
+    (largura, altura) em mm dos campos `largura`/`altura`. Levanta ValueError
+    com a mensagem para o usuario se algum estiver fora das faixas.
+    """
+    return (_ler(configuracoes.get('largura'), LARGURA_PADRAO, LARGURA_LIMITES, 'Largura (mm)'),
+            _ler(configuracoes.get('altura'), ALTURA_PADRAO, ALTURA_LIMITES, 'Altura (mm)'))
+
+
+def ler_tamanho_fonte(valor):
+    """Tamanho da fonte em pt; ValueError fora de TAMANHO_FONTE_LIMITES"""
+    return _ler(valor, TAMANHO_FONTE_PADRAO, TAMANHO_FONTE_LIMITES, 'Tamanho da fonte (pt)')
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Analises de estoque e validade dos lotes (painel do recebimento).
+
+Os lotes sao carregados em arrays NumPy, uma posicao por lote:
+- codigo do item (int32, posicao em `itens`) e quantidade (float64);
+- datas de validade e de recebimento em dias desde 1970-01-01 (int64,
+  SEM_DATA quando o lote nao tem a data).
+
+As agregacoes sao group-bys vetorizados (np.bincount pelo codigo do item ou
+pelo dia/semana): estoque por item, quantidade que vence por semana (visao
+FEFO) e volume recebido por dia. O resultado fica em cache ate a proxima
+gravacao de lotes (assinatura do armazenamento).
+"""
+import math
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+
+# Dias de um lote sem a data (NaT convertido para inteiro)
+SEM_DATA = np.iinfo(np.int64).min
+EPOCA = date(1970, 1, 1)
+# Acima disso (datas muito espalhadas) o agrupamento por dia usa np.unique
+LIMITE_FAIXAS = 200000
+
+
+def _quantidade(valor):
+    """Quantidade do lote como float (ausente ou invalida conta 0)"""
+    try:
+        valor = float(valor)
+    except (TypeError, ValueError):
+        return 0.0
+    return valor if math.isfinite(valor) else 0.0
+
+
+def _data_ou_nat(texto):
+    try:
+        return np.datetime64(texto, 'D')
+    except ValueError:
+        return np.datetime64('NaT', 'D')
+
+
+def dias_desde_epoca(valores):
+    """Datas AAAA-MM-DD (ou None/vazio) -> array de dias desde 1970-01-01 (SEM_DATA sem data)"""
+    textos = [valor[:10] if isinstance(valor, str) and valor else 'NaT' for valor in valores]
+    try:
+        datas = np.array(textos, dtype='datetime64[D]')
+    except ValueError:
+        # Alguma data fora do formato: converte uma a uma
+        datas = np.array([_data_ou_nat(texto) for texto in textos], dtype='datetime64[D]')
+    return datas.astype(np.int64)
+
+
+class ArraysLotes:
+    """Colunas dos lotes em arrays NumPy"""
+
+    def __init__(self, lotes):
+        n = len(lotes)
+        codigos = {}
+        self.item = np.fromiter((codigos.setdefault(lote.get('id_item'), len(codigos)) for lote in lotes),
+                                np.int32, n)
+        # codigo -> id_item
+        self.itens = list(codigos)
+        self.quantidade = np.fromiter((_quantidade(lote.get('quantidade')) for lote in lotes), np.float64, n)
+        self.validade = dias_desde_epoca([lote.get('data_validade') for lote in lotes])
+        # Sem data de recebimento vale o dia do cadastro
+        self.recebimento = dias_desde_epoca([lote.get('data_recebimento') or lote.get('dt_cadastro')
+                                             for lote in lotes])
+
+    def __len__(self):
+        return len(self.item)
+
+
+# ========== AGREGACOES ==========
+
+def estoque_por_item(arrays):
+    """Quantidade total e numero de lotes por item, do maior estoque para o menor"""
+    total = np.bincount(arrays.item, weights=arrays.quantidade, minlength=len(arrays.itens))
+    lotes = np.bincount(arrays.item, minlength=len(arrays.itens))
+    ordem = np.argsort(-total, kind='stable')
+    itens = arrays.itens
+    return [{'id_item': itens[i], 'quantidade': float(total[i]), 'lotes': int(lotes[i])} for i in ordem.tolist()]
+
+
+def _por_dia(dias, quantidade, semana=False):
+    """Soma da quantidade e contagem de lotes por dia (ou por semana, a partir da segunda)"""
+    validos = dias != SEM_DATA
+    dias = dias[validos]
+    quantidade = quantidade[validos]
+    if not len(dias):
+        return []
+
+    largura = 7 if semana else 1
+    if semana:
+        # 1970-01-01 foi uma quinta: a segunda da semana fica (dia + 3) % 7 dias antes
+        dias = dias - (dias + 3) % 7
+    menor = int(dias.min())
+    faixas = (dias - menor) // largura
+    inicios = None
+    if int(faixas.max()) > LIMITE_FAIXAS:
+        inicios, faixas = np.unique(faixas, return_inverse=True)
+
+    total = np.bincount(faixas, weights=quantidade)
+    lotes = np.bincount(faixas)
+    usadas = np.flatnonzero(lotes)
+    faixa_de = inicios.tolist() if inicios is not None else None
+    resultado = []
+    for i in usadas.tolist():
+        inicio = menor + (faixa_de[i] if faixa_de is not None else i) * largura
+        resultado.append({
+            'data': (EPOCA + timedelta(days=inicio)).isoformat(),
+            'quantidade': float(total[i]),
+            'lotes': int(lotes[i])
+        })
+    return resultado
+
+
+def vencimento_por_semana(arrays):
+    """Quantidade que vence em cada semana (segunda-feira em `data`), em ordem de data"""
+    return _por_dia(arrays.validade, arrays.quantidade, semana=True)
+
+
+def recebimento_por_dia(arrays):
+    """Quantidade e lotes recebidos por dia, em ordem de data"""
+    return _por_dia(arrays.recebimento, arrays.quantidade)
+
+
+def analisar(arrays):
+    """Todas as agregacoes do painel"""
+    return {
+        'total_lotes': len(arrays),
+        'quantidade_total': float(arrays.quantidade.sum()),
+        'estoque_por_item': estoque_por_item(arrays),
+        'vencimento_por_semana': vencimento_por_semana(arrays),
+        'recebimento_por_dia': recebimento_por_dia(arrays)
+    }
+
+
+class AnaliseLotes:
+    """Resultado das analises em cache pela assinatura do armazenamento de lotes"""
+
+    def __init__(self, indice):
+        self.indice = indice
+        self._lock = threading.Lock()
+        self._assinatura = False
+        self._resultado = None
+
+    def resultado(self):
+        assinatura = self.indice.armazenamento.assinatura()
+        with self._lock:
+            if assinatura != self._assinatura:
+                self._resultado = analisar(ArraysLotes(self.indice.listar()))
+                self._assinatura = assinatura
+            return self._resultado
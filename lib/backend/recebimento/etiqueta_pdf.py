@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+PDF das etiquetas de lote (controle de lote com QR Code do ID do item).
+
+Usado pela etiqueta avulsa do formulario e pelo recebimento de uma nota fiscal
+inteira, que imprime as etiquetas de todos os lotes em um unico documento.
+"""
+import io
+from datetime import datetime, timedelta
+
+
+def formatar_data(data):
+    """AAAA-MM-DD -> DD/MM/AAAA (o que nao estiver nesse formato fica igual)"""
+    try:
+        return datetime.strptime(data, '%Y-%m-%d').strftime('%d/%m/%Y')
+    except (TypeError, ValueError):
+        return data or ''
+
+
+def gerar_pdf_etiquetas(etiquetas, largura_mm=100, altura_mm=75, tamanho_fonte_base=8):
+    """
+    Gera um PDF com uma pagina por etiqueta.
+
+    `etiquetas` e uma lista de (dados, quantidade): `dados` tem os campos da
+    etiqueta (numero_lote, id_item, descricao_item, datas ja formatadas,
+    quantidade, numero_nota_fiscal, observacao) e `quantidade` e o numero de
+    copias. Retorna (buffer, data de geracao).
+    """
+    import qrcode
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.units import mm
+
+    # Converter mm para pontos
+    largura = largura_mm * mm
+    altura = altura_mm * mm
+
+    # Criar buffer para o PDF
+    buffer = io.BytesIO()
+
+    # Criar o canvas PDF
+    c = canvas.Canvas(buffer, pagesize=(largura, altura))
+
+    # Sistema adaptativo de fonte
+    if largura <= 60 * mm or altura <= 50 * mm:
+        x_margin = 1.5 * mm
+        y_margin = 1.5 * mm
+        tamanho_fonte = max(4, tamanho_fonte_base - 2)
+        titulo_fonte = tamanho_fonte + 1
+        lote_fonte = tamanho_fonte + 1
+        rodape_fonte = tamanho_fonte - 1
+        line_height = tamanho_fonte * 1.0
+        section_space = line_height * 0.2
+    elif largura <= 90 * mm or altura <= 70 * mm:
+        x_margin = 2 * mm
+        y_margin = 2 * mm
+        tamanho_fonte = max(5, tamanho_fonte_base - 1)
+        titulo_fonte = tamanho_fonte + 2
+        lote_fonte = tamanho_fonte + 2
+        rodape_fonte = tamanho_fonte - 1
+        line_height = tamanho_fonte * 1.05
+        section_space = line_height * 0.3
+    else:
+        x_margin = 3 * mm
+        y_margin = 3 * mm
+        tamanho_fonte = tamanho_fonte_base
+        titulo_fonte = tamanho_fonte + 3
+        lote_fonte = tamanho_fonte + 2
+        rodape_fonte = tamanho_fonte - 2
+        line_height = tamanho_fonte * 1.1
+        section_space = line_height * 0.4
+
+    area_util_largura = largura - (2 * x_margin)
+    area_util_altura = altura - (2 * y_margin)
+    y_start = altura - y_margin - (titulo_fonte + 2)
+
+    agora_brasilia = datetime.now() - timedelta(hours=3)
+    data_geracao = agora_brasilia.strftime('%d/%m/%Y %H:%M')
+
+    primeira_pagina = True
+    for dados, quantidade_etiquetas in etiquetas:
+        # Gerar codigo para QR Code - somente ID do Item
+        numero_lote = dados.get('numero_lote', '').strip()
+        id_item_qr = dados.get('id_item', '').strip()
+
+        # QR Code contem apenas o ID do Item
+        codigo_qr = id_item_qr if id_item_qr else 'SEM_ID'
+        # Garantir que e ASCII puro
+        codigo_qr = codigo_qr.encode('ascii', 'replace').decode('ascii')
+
+        # Gerar QR Code
+        qr = qrcode.QRCode(
+            version=1,
+            error_correction=qrcode.constants.ERROR_CORRECT_M,
+            box_size=4,
+            border=2,
+        )
+        qr.add_data(codigo_qr)
+        qr.make(fit=True)
+        qr_img = qr.make_image(fill_color="black", back_color="white")
+
+        for _ in range(max(1, quantidade_etiquetas)):
+            # Nova pagina a partir da segunda etiqueta
+            if not primeira_pagina:
+                c.showPage()
+            primeira_pagina = False
+
+            texto_largura = area_util_largura
+            y = y_start
+
+            # TITULO PRINCIPAL
+            c.setFont("Helvetica-Bold", titulo_fonte)
+            titulo = "CONTROLE DE LOTE"
+            titulo_largura = c.stringWidth(titulo, "Helvetica-Bold", titulo_fonte)
+            titulo_x = (largura - titulo_largura) / 2
+            c.drawString(titulo_x, y, titulo)
+            y -= titulo_fonte * 1.0
+
+            # NUMERO DO LOTE
+            if numero_lote:
+                c.setFont("Helvetica-Bold", lote_fonte)
+                lote_texto = f"LOTE: {numero_lote}"
+                lote_largura = c.stringWidth(lote_texto, "Helvetica-Bold", lote_fonte)
+                lote_x = (largura - lote_largura) / 2
+                c.drawString(lote_x, y, lote_texto)
+                y -= line_height * 1.0
+
+            # ID DO ITEM
+            id_item = dados.get('id_item', '')
+            if id_item:
+                c.setFont("Helvetica-Bold", tamanho_fonte)
+                item_texto = f"ID Item: {id_item}"
+                item_largura = c.stringWidth(item_texto, "Helvetica-Bold", tamanho_fonte)
+                item_x = (largura - item_largura) / 2
+                c.drawString(item_x, y, item_texto)
+                y -= line_height
+
+            # DESCRICAO DO ITEM
+            descricao_item = dados.get('descricao_item', '')
+            if descricao_item:
+                c.setFont("Helvetica", tamanho_fonte)
+                # Limitar descricao para caber na etiqueta
+                desc_max = max(40, int(texto_largura / (tamanho_fonte * 0.5)))
+                desc_texto = descricao_item[:desc_max] + "..." if len(descricao_item) > desc_max else descricao_item
+                desc_largura = c.stringWidth(desc_texto, "Helvetica", tamanho_fonte)
+                desc_x = (largura - desc_largura) / 2
+                c.drawString(desc_x, y, desc_texto)
+                y -= line_height
+
+            # INFORMACOES
+            c.setFont("Helvetica", tamanho_fonte)
+
+            data_recebimento = dados.get('data_recebimento', '')
+            data_fabricacao = dados.get('data_fabricacao', '')
+            data_validade = dados.get('data_validade', '')
+
+            if data_recebimento:
+                rec_texto = f"Recebimento: {data_recebimento}"
+                rec_largura = c.stringWidth(rec_texto, "Helvetica", tamanho_fonte)
+                rec_x = (largura - rec_largura) / 2
+                c.drawString(rec_x, y, rec_texto)
+                y -= line_height
+
+            if data_fabricacao:
+                fab_texto = f"Fabricacao: {data_fabricacao}"
+                fab_largura = c.stringWidth(fab_texto, "Helvetica", tamanho_fonte)
+                fab_x = (largura - fab_largura) / 2
+                c.drawString(fab_x, y, fab_texto)
+                y -= line_height
+
+            if data_validade:
+                c.setFont("Helvetica-Bold", tamanho_fonte)
+                val_texto = f"Validade: {data_validade}"
+                val_largura = c.stringWidth(val_texto, "Helvetica-Bold", tamanho_fonte)
+                val_x = (largura - val_largura) / 2
+                c.drawString(val_x, y, val_texto)
+                c.setFont("Helvetica", tamanho_fonte)
+                y -= line_height
+
+            # Nota Fiscal
+            numero_nota_fiscal = dados.get('numero_nota_fiscal', '')
+            if numero_nota_fiscal:
+                nf_texto = f"Nota Fiscal: {numero_nota_fiscal}"
+                nf_largura = c.stringWidth(nf_texto, "Helvetica", tamanho_fonte)
+                nf_x = (largura - nf_largura) / 2
+                c.drawString(nf_x, y, nf_texto)
+                y -= line_height
+
+            # Quantidade
+            quantidade_prod = dados.get('quantidade', '')
+            if quantidade_prod:
+                qtd_texto = f"Quantidade: {quantidade_prod}"
+                qtd_largura = c.stringWidth(qtd_texto, "Helvetica", tamanho_fonte)
+                qtd_x = (largura - qtd_largura) / 2
+                c.drawString(qtd_x, y, qtd_texto)
+                y -= line_height
+
+            # Observacao
+            observacao = dados.get('observacao', '')
+            if observacao and len(observacao) > 0 and y > (y_margin + line_height * 3):
+                y -= section_space * 0.5
+                obs_fonte = max(3, tamanho_fonte - 1)
+                c.setFont("Helvetica", obs_fonte)
+                obs_max = max(30, int(texto_largura / (obs_fonte * 0.5)))
+                obs_texto = observacao[:obs_max] + "..." if len(observacao) > obs_max else observacao
+                obs_completo = f"Obs: {obs_texto}"
+                obs_largura = c.stringWidth(obs_completo, "Helvetica", obs_fonte)
+                obs_x = (largura - obs_largura) / 2
+                c.drawString(obs_x, y, obs_completo)
+                y -= line_height * 1.2
+
+            # QR CODE
+            rodape_altura = rodape_fonte + (2 * y_margin)
+            area_qr_inicio = y_margin + rodape_altura + (3 * mm)
+            area_qr_fim = y - (2 * mm)
+            area_qr_altura = area_qr_fim - area_qr_inicio
+
+            if largura <= 60 * mm or altura <= 50 * mm:
+                qr_size_largura = largura * 0.25
+                qr_size_altura = area_qr_altura * 0.60
+            elif largura <= 90 * mm or altura <= 70 * mm:
+                qr_size_largura = largura * 0.30
+                qr_size_altura = area_qr_altura * 0.70
+            else:
+                qr_size_largura = largura * 0.35
+                qr_size_altura = area_qr_altura * 0.85
+
+            qr_size = min(qr_size_largura, qr_size_altura)
+
+            if largura <= 60 * mm or altura <= 50 * mm:
+                qr_size = max(8 * mm, min(qr_size, 18 * mm))
+            elif largura <= 90 * mm or altura <= 70 * mm:
+                qr_size = max(10 * mm, min(qr_size, 25 * mm))
+            else:
+                qr_size = max(12 * mm, min(qr_size, 40 * mm))
+
+            qr_x = (largura - qr_size) / 2
+            qr_y = area_qr_inicio + ((area_qr_altura - qr_size) / 2)
+
+            c.drawInlineImage(qr_img, qr_x, qr_y, qr_size, qr_size)
+
+            # RODAPE
+            rodape_y = y_margin + rodape_fonte
+
+            c.setFont("Helvetica", rodape_fonte)
+            rodape_texto = f"ID: {codigo_qr}  |  Gerado: {data_geracao}"
+            rodape_largura = c.stringWidth(rodape_texto, "Helvetica", rodape_fonte)
+            rodape_x = (largura - rodape_largura) / 2
+            c.drawString(rodape_x, rodape_y, rodape_texto)
+
+    # Finalizar
+    c.save()
+    buffer.seek(0)
+    return buffer, agora_brasilia
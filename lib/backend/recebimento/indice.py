@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+"""
+Indice de lotes em memoria.
+
+Mantem os lotes ordenados por `dt_cadastro` (+ id) e atualiza essa ordem a
+cada gravacao feita pelo proprio processo, entao a listagem nunca precisa
+reordenar a colecao. Se outro processo gravar, a assinatura do armazenamento
+muda e o indice e reconstruido na proxima leitura.
+
+Alem da ordem de cadastro ha indices secundarios, atualizados junto:
+- `data_validade` ordenado (busca binaria: intervalo em O(log n + k));
+- `id_item`, `numero_nota_fiscal` e `numero_lote` por hash (valor exato).
+
+As gravacoes passam por aqui (inserir/salvar/remover/aplicar repassam para o
+armazenamento) para que a gravacao e a atualizacao do indice fiquem sob o
+mesmo lock.
+"""
+import base64
+import bisect
+import json
+import threading
+
+
+def chave_lote(lote):
+    """Posicao do lote na ordem de cadastro"""
+    return (lote.get('dt_cadastro') or '', lote['id'])
+
+
+def codificar_cursor(lote):
+    """Cursor opaco com a posicao do ultimo lote da pagina"""
+    bruto = json.dumps(list(chave_lote(lote)), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(bruto).decode('ascii')
+
+
+def decodificar_cursor(cursor):
+    """Retorna a chave (dt_cadastro, id) ou levanta ValueError"""
+    try:
+        dt_cadastro, lote_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('Cursor invalido')
+    # Mesmos tipos de chave_lote: senao a comparacao com as chaves do indice falha
+    if not (isinstance(dt_cadastro, str) and isinstance(lote_id, int) and not isinstance(lote_id, bool)):
+        raise ValueError('Cursor invalido')
+    return (dt_cadastro, lote_id)
+
+
+class IndiceValor:
+    """Hash valor exato -> ids dos lotes com esse valor"""
+
+    def __init__(self, campo):
+        self.campo = campo
+        # valor -> {id: None} (conjunto que preserva a ordem de insercao)
+        self._ids = {}
+
+    def reconstruir(self, lotes):
+        self._ids = {}
+        for lote in lotes:
+            self.adicionar(lote)
+
+    def adicionar(self, lote):
+        valor = lote.get(self.campo)
+        if valor is not None:
+            self._ids.setdefault(valor, {})[lote['id']] = None
+
+    def remover(self, lote):
+        valor = lote.get(self.campo)
+        ids = self._ids.get(valor)
+        if ids is not None:
+            ids.pop(lote['id'], None)
+            if not ids:
+                del self._ids[valor]
+
+    def ids(self, valor):
+        return list(self._ids.get(valor, ()))
+
+
+class IndiceIntervalo:
+    """Chaves (valor, id) em ordem para consultas por intervalo de valor (texto)"""
+
+    def __init__(self, campo):
+        self.campo = campo
+        self._chaves = []
+
+    def _chave(self, lote):
+        valor = lote.get(self.campo)
+        # So textos (datas AAAA-MM-DD): outros tipos nao comparam com eles
+        return (valor, lote['id']) if isinstance(valor, str) and valor else None
+
+    def reconstruir(self, lotes):
+        self._chaves = sorted(chave for chave in map(self._chave, lotes) if chave is not None)
+
+    def adicionar(self, lote):
+        chave = self._chave(lote)
+        if chave is not None:
+            bisect.insort(self._chaves, chave)
+
+    def remover(self, lote):
+        chave = self._chave(lote)
+        if chave is not None:
+            i = bisect.bisect_left(self._chaves, chave)
+            if i < len(self._chaves) and self._chaves[i] == chave:
+                del self._chaves[i]
+
+    def ids(self, inicio=None, fim=None):
+        """Ids com inicio <= valor <= fim (limites opcionais), em ordem de valor"""
+        chaves = self._chaves
+        i = bisect.bisect_left(chaves, (inicio,)) if inicio else 0
+        # (fim, infinito): todas as chaves com valor == fim ficam antes
+        j = bisect.bisect_right(chaves, (fim, float('inf'))) if fim else len(chaves)
+        return [lote_id for _, lote_id in chaves[i:j]]
+
+
+class IndiceLotes:
+    """Lotes em ordem de cadastro com atualizacao incremental"""
+
+    def __init__(self, armazenamento):
+        self.armazenamento = armazenamento
+        self._lock = threading.RLock()
+        self._assinatura = False
+        # Ordem crescente; a listagem percorre do fim para o inicio
+        self._chaves = []
+        self._lotes = []
+        self._por_id = {}
+        self._por_validade = IndiceIntervalo('data_validade')
+        self._por_campo = {campo: IndiceValor(campo)
+                           for campo in ('id_item', 'numero_nota_fiscal', 'numero_lote')}
+
+    # ========== CARGA ==========
+
+    def _recarregar(self, assinatura):
+        """Le a colecao e reconstroi a ordem (unico ponto que ordena tudo)"""
+        ordenados = sorted((chave_lote(lote), lote) for lote in self.armazenamento.listar())
+        self._chaves = [chave for chave, _ in ordenados]
+        self._lotes = [lote for _, lote in ordenados]
+        self._por_id = {lote['id']: lote for lote in self._lotes}
+        self._por_validade.reconstruir(self._lotes)
+        for indice in self._por_campo.values():
+            indice.reconstruir(self._lotes)
+        self._assinatura = assinatura
+
+    def _garantir_atualizado(self):
+        assinatura = self.armazenamento.assinatura()
+        if assinatura != self._assinatura:
+            with self._lock:
+                if assinatura != self._assinatura:
+                    self._recarregar(assinatura)
+
+    def _apos_gravar(self):
+        """True se so esta gravacao mudou os dados (basta ajustar o indice)"""
+        if self.armazenamento.assinatura_antes == self._assinatura:
+            self._assinatura = self.armazenamento.assinatura_depois
+            return True
+        self._recarregar(self.armazenamento.assinatura_depois)
+        return False
+
+    def _indexar(self, lote):
+        """Inclui o lote nos indices secundarios"""
+        self._por_validade.adicionar(lote)
+        for indice in self._por_campo.values():
+            indice.adicionar(lote)
+
+    def _desindexar(self, lote):
+        self._por_validade.remover(lote)
+        for indice in self._por_campo.values():
+            indice.remover(lote)
+
+    def _posicionar(self, lote):
+        chave = chave_lote(lote)
+        i = bisect.bisect_left(self._chaves, chave)
+        self._chaves.insert(i, chave)
+        self._lotes.insert(i, lote)
+        self._por_id[lote['id']] = lote
+        self._indexar(lote)
+
+    def _posicao(self, lote):
+        """Posicao do lote na ordem, ou None se a chave indexada nao confere"""
+        chave = chave_lote(lote)
+        i = bisect.bisect_left(self._chaves, chave)
+        if i < len(self._chaves) and self._chaves[i] == chave:
+            return i
+        return None
+
+    def _retirar(self, lote):
+        """
+        Tira o lote da ordem e dos indices. Retorna False (sem mexer em nada)
+        se o lote nao esta onde a chave dele diz, por exemplo um dict alterado
+        fora do indice: nesse caso o indice precisa ser reconstruido.
+        """
+        i = self._posicao(lote)
+        if i is None:
+            return False
+        del self._chaves[i]
+        del self._lotes[i]
+        del self._por_id[lote['id']]
+        self._desindexar(lote)
+        return True
+
+    def _reconstruir(self):
+        """Reconstroi o indice a partir do armazenamento (chave fora do lugar)"""
+        self._recarregar(self.armazenamento.assinatura())
+
+    # ========== GRAVACAO ==========
+
+    def inserir(self, lote):
+        with self._lock:
+            self._garantir_atualizado()
+            lote = self.armazenamento.inserir(lote)
+            if self._apos_gravar():
+                self._posicionar(lote)
+            return lote
+
+    def salvar(self, lote, versao_esperada=None):
+        with self._lock:
+            self._garantir_atualizado()
+            atual = self._por_id.get(lote['id'])
+            salvo = self.armazenamento.salvar(lote, versao_esperada=versao_esperada)
+            if self._apos_gravar() and salvo is not None:
+                i = self._posicao(atual)
+                if i is None:
+                    self._reconstruir()
+                elif chave_lote(atual) == chave_lote(salvo):
+                    # Mesma posicao: troca o registro no lugar
+                    self._lotes[i] = salvo
+                    self._por_id[salvo['id']] = salvo
+                    self._desindexar(atual)
+                    self._indexar(salvo)
+                else:
+                    self._retirar(atual)
+                    self._posicionar(salvo)
+            return salvo
+
+    def remover(self, lote_id):
+        with self._lock:
+            self._garantir_atualizado()
+            removido = self.armazenamento.remover(lote_id)
+            if self._apos_gravar() and removido is not None:
+                if not self._retirar(self._por_id[lote_id]):
+                    self._reconstruir()
+            return removido
+
+    def aplicar(self, inserir=(), salvar=(), remover=()):
+        """
+        Varias alteracoes em uma unica gravacao (ver Armazenamento.aplicar).
+        Retorna (inseridos, salvos, removidos).
+        """
+        with self._lock:
+            self._garantir_atualizado()
+            inseridos, salvos, removidos = self.armazenamento.aplicar(inserir, salvar, remover)
+
+            if self._apos_gravar() and not self._aplicar_no_indice(inseridos, salvos, removidos):
+                self._reconstruir()
+            return inseridos, salvos, removidos
+
+    def _aplicar_no_indice(self, inseridos, salvos, removidos):
+        """Ajusta o indice a um lote de alteracoes; False se alguma chave nao conferiu"""
+        for lote in salvos:
+            if lote is not None:
+                if not self._retirar(self._por_id[lote['id']]):
+                    return False
+                self._posicionar(lote)
+        for lote in removidos:
+            if lote is not None and not self._retirar(self._por_id[lote['id']]):
+                return False
+        for lote in inseridos:
+            self._posicionar(lote)
+        return True
+
+    # ========== CONSULTAS ==========
+
+    def listar(self):
+        """Todos os lotes, mais recente primeiro"""
+        self._garantir_atualizado()
+        return self._lotes[::-1]
+
+    def buscar_por(self, campo, valor):
+        """Lotes com campo == valor (id_item, numero_nota_fiscal ou numero_lote), mais recente primeiro"""
+        self._garantir_atualizado()
+        with self._lock:
+            lotes = [self._por_id[lote_id] for lote_id in self._por_campo[campo].ids(valor)]
+        lotes.sort(key=chave_lote, reverse=True)
+        return lotes
+
+    def por_validade(self, inicio=None, fim=None):
+        """Lotes com data_validade entre inicio e fim (AAAA-MM-DD, inclusive), o que vence antes primeiro"""
+        self._garantir_atualizado()
+        with self._lock:
+            return [self._por_id[lote_id] for lote_id in self._por_validade.ids(inicio, fim)]
+
+    def consultar(self, limite=20, pagina=1, cursor=None, data_inicio=None, data_fim=None,
+                  numero_lote=None, id_item=None, numero_nota_fiscal=None):
+        """
+        Janela da listagem (mais recente primeiro) com filtros.
+
+        `data_inicio`/`data_fim` (AAAA-MM-DD) limitam a data de recebimento,
+        `numero_lote` e `numero_nota_fiscal` filtram por trecho e `id_item` por
+        igualdade. Com `cursor` (o `proximo_cursor` da pagina anterior) a
+        janela comeca logo depois do ultimo lote visto, por busca binaria.
+
+        Retorna (lotes, total_filtrado, proximo_cursor).
+        """
+        self._garantir_atualizado()
+        # As gravacoes alteram as listas no lugar: a consulta fica no lock
+        with self._lock:
+            return self._consultar(limite, pagina, cursor, data_inicio, data_fim,
+                                   numero_lote, id_item, numero_nota_fiscal)
+
+    def _consultar(self, limite, pagina, cursor, data_inicio, data_fim,
+                   numero_lote, id_item, numero_nota_fiscal):
+        chaves, lotes = self._chaves, self._lotes
+
+        if cursor:
+            chave_cursor = decodificar_cursor(cursor)
+            inicio = bisect.bisect_left(chaves, chave_cursor) - 1
+            pular = 0
+        else:
+            inicio = len(lotes) - 1
+            pular = (pagina - 1) * limite
+        posicoes = range(inicio, -1, -1)
+
+        filtro_lote = numero_lote.strip().upper() if numero_lote else None
+        filtro_item = id_item.strip() if id_item else None
+        filtro_nf = numero_nota_fiscal.strip() if numero_nota_fiscal else None
+
+        def confere(lote):
+            if data_inicio and (lote.get('data_recebimento') or '') < data_inicio:
+                return False
+            if data_fim and (lote.get('data_recebimento') or '9999') > data_fim:
+                return False
+            if filtro_lote and filtro_lote not in (lote.get('numero_lote') or ''):
+                return False
+            if filtro_item and (lote.get('id_item') or '') != filtro_item:
+                return False
+            if filtro_nf and filtro_nf not in (lote.get('numero_nota_fiscal') or ''):
+                return False
+            return True
+
+        if not (data_inicio or data_fim or filtro_lote or filtro_item or filtro_nf):
+            total = len(lotes)
+            selecionadas = posicoes[pular:pular + limite]
+            janela = [lotes[i] for i in selecionadas]
+            tem_mais = len(posicoes) > pular + limite
+        else:
+            if filtro_item:
+                # Igualdade de item: so os lotes do indice, nao a colecao toda
+                candidatos = sorted((self._por_id[lote_id] for lote_id in self._por_campo['id_item'].ids(filtro_item)),
+                                    key=chave_lote, reverse=True)
+                sequencia = [lote for lote in candidatos if chave_lote(lote) < chave_cursor] if cursor else candidatos
+            else:
+                candidatos = lotes
+                sequencia = (lotes[i] for i in posicoes)
+            total = sum(1 for lote in candidatos if confere(lote))
+            janela = []
+            tem_mais = False
+            for lote in sequencia:
+                if not confere(lote):
+                    continue
+                if pular:
+                    pular -= 1
+                    continue
+                if len(janela) == limite:
+                    tem_mais = True
+                    break
+                janela.append(lote)
+
+        proximo_cursor = codificar_cursor(janela[-1]) if tem_mais and janela else None
+        return janela, total, proximo_cursor
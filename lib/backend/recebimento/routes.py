@@ -1,22 +1,37 @@
 # -*- coding: utf-8 -*-
 from flask import Blueprint, render_template, request, jsonify, send_file
-from datetime import datetime
-import io
-import qrcode
-from PIL import Image
-import random
-import string
-
+from datetime import date, datetime, timedelta
+import base64
+
+from lib.backend.armazenamento import ConflitoVersao
+from lib.backend.http_utils import com_etag, respostas, versao_if_match
+from lib.backend.itens.service import buscar_itens_por_numeros
+from lib.backend.medidas_etiqueta import ler_medidas, ler_tamanho_fonte
+from lib.backend.recebimento.etiqueta_pdf import gerar_pdf_etiquetas, formatar_data
 from lib.backend.recebimento.service import (
+    versao_lotes,
     listar_lotes,
+    consultar_lotes,
+    lotes_por_validade,
+    lotes_por_item,
+    lotes_por_nota_fiscal,
+    lotes_por_numero,
+    analisar_lotes,
     buscar_lote_por_id,
     criar_lote,
     atualizar_lote,
-    deletar_lote
+    deletar_lote,
+    receber_nota_fiscal
 )
 
 recebimento_bp = Blueprint('recebimento', __name__, url_prefix='/recebimento')
 
+LIMITE_PADRAO = 20
+LIMITE_MAXIMO = 500
+LIMITE_LINHAS_NOTA_FISCAL = 1000
+PARAMETROS_CONSULTA = ('page', 'cursor', 'limit', 'data_inicio', 'data_fim',
+                       'numero_lote', 'id_item', 'numero_nota_fiscal')
+
 
 # ========== PAGINAS PRINCIPAIS ==========
 
@@ -33,21 +48,148 @@ def formulario_lote():
     return render_template('recebimento/formulario.html')
 
 
+@recebimento_bp.route('/analise')
+def analise_lotes():
+    """Painel de estoque e validade dos lotes"""
+    return render_template('recebimento/analise.html')
+
+
 # ========== APIs ==========
 
 @recebimento_bp.route('/api/lotes')
 def api_listar_lotes():
-    """API para listar todos os lotes"""
+    """
+    API para listar lotes (mais recente primeiro).
+
+    Sem parametros devolve todos. Com page/cursor/limit ou algum filtro
+    (data_inicio, data_fim, numero_lote, id_item, numero_nota_fiscal) devolve
+    so a janela pedida e o `proximo_cursor` para continuar. Responde 304
+    quando o ETag/Last-Modified do cliente ainda vale.
+    """
+    return respostas.responder('lotes', versao_lotes(), _listar_lotes)
+
+
+def _listar_lotes():
     try:
-        lotes = listar_lotes()
+        if not any(parametro in request.args for parametro in PARAMETROS_CONSULTA):
+            lotes = listar_lotes()
+            return jsonify({
+                'dados': lotes,
+                'total_registros': len(lotes)
+            })
+
+        try:
+            pagina = max(1, int(request.args.get('page', 1)))
+            limite = min(max(1, int(request.args.get('limit', LIMITE_PADRAO))), LIMITE_MAXIMO)
+        except ValueError:
+            return jsonify({'error': 'page e limit devem ser numeros inteiros'}), 400
+
+        for campo in ('data_inicio', 'data_fim'):
+            valor = request.args.get(campo)
+            if valor:
+                try:
+                    datetime.strptime(valor, '%Y-%m-%d')
+                except ValueError:
+                    return jsonify({'error': f'{campo} deve estar no formato AAAA-MM-DD'}), 400
+
+        try:
+            lotes, total, proximo_cursor = consultar_lotes(
+                limite=limite,
+                pagina=pagina,
+                cursor=request.args.get('cursor'),
+                data_inicio=request.args.get('data_inicio') or None,
+                data_fim=request.args.get('data_fim') or None,
+                numero_lote=request.args.get('numero_lote'),
+                id_item=request.args.get('id_item'),
+                numero_nota_fiscal=request.args.get('numero_nota_fiscal')
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
         return jsonify({
             'dados': lotes,
-            'total_registros': len(lotes)
+            'total_registros': total,
+            'pagina': pagina,
+            'limite': limite,
+            'total_paginas': (total + limite - 1) // limite,
+            'proximo_cursor': proximo_cursor
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+def _lista_lotes(lotes):
+    return jsonify({
+        'dados': lotes,
+        'total_registros': len(lotes)
+    })
+
+
+@recebimento_bp.route('/api/lotes/validade')
+def api_lotes_por_validade():
+    """
+    Lotes por data de validade (indice ordenado), o que vence antes primeiro.
+
+    ?data_inicio=AAAA-MM-DD&data_fim=AAAA-MM-DD (limites opcionais e
+    inclusivos) ou ?dias=30 para os que vencem de hoje ate daqui a 30 dias.
+    """
+    # A data de hoje entra na versao: com ?dias a janela muda todo dia
+    return respostas.responder('lotes-validade', (versao_lotes(), date.today().isoformat()), _lotes_por_validade)
+
+
+def _lotes_por_validade():
+    try:
+        dias = request.args.get('dias')
+        if dias:
+            try:
+                dias = int(dias)
+            except ValueError:
+                return jsonify({'error': 'dias deve ser um numero inteiro'}), 400
+            hoje = date.today()
+            data_inicio, data_fim = hoje.isoformat(), (hoje + timedelta(days=dias)).isoformat()
+        else:
+            data_inicio = request.args.get('data_inicio') or None
+            data_fim = request.args.get('data_fim') or None
+            for campo, valor in (('data_inicio', data_inicio), ('data_fim', data_fim)):
+                if valor:
+                    try:
+                        datetime.strptime(valor, '%Y-%m-%d')
+                    except ValueError:
+                        return jsonify({'error': f'{campo} deve estar no formato AAAA-MM-DD'}), 400
+
+        return _lista_lotes(lotes_por_validade(data_inicio, data_fim))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@recebimento_bp.route('/api/lotes/item/<id_item>')
+def api_lotes_por_item(id_item):
+    """Lotes de um item (indice por id_item), mais recente primeiro"""
+    return respostas.responder('lotes', versao_lotes(), lambda: _lista_lotes(lotes_por_item(id_item.strip())))
+
+
+@recebimento_bp.route('/api/lotes/nota-fiscal/<numero_nota_fiscal>')
+def api_lotes_por_nota_fiscal(numero_nota_fiscal):
+    """Lotes de uma nota fiscal (indice por numero_nota_fiscal), mais recente primeiro"""
+    return respostas.responder('lotes', versao_lotes(),
+                               lambda: _lista_lotes(lotes_por_nota_fiscal(numero_nota_fiscal.strip())))
+
+
+@recebimento_bp.route('/api/lotes/numero/<numero_lote>')
+def api_lotes_por_numero(numero_lote):
+    """Lotes com esse numero de lote (indice por numero_lote), mais recente primeiro"""
+    return respostas.responder('lotes', versao_lotes(), lambda: _lista_lotes(lotes_por_numero(numero_lote.strip())))
+
+
+@recebimento_bp.route('/api/analise')
+def api_analise_lotes():
+    """
+    Dados do painel: estoque por item, quantidade que vence por semana (FEFO,
+    semana a partir da segunda) e volume recebido por dia.
+    """
+    return respostas.responder('lotes', versao_lotes(), lambda: jsonify(analisar_lotes()))
+
+
 @recebimento_bp.route('/api/lotes/<int:lote_id>')
 def api_buscar_lote(lote_id):
     """API para buscar lote pelo ID"""
@@ -55,7 +197,7 @@ def api_buscar_lote(lote_id):
         lote = buscar_lote_por_id(lote_id)
         if not lote:
             return jsonify({'error': 'Lote nao encontrado'}), 404
-        return jsonify(lote)
+        return com_etag(jsonify(lote), lote)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -105,6 +247,87 @@ def api_criar_lote():
         return jsonify({'error': str(e)}), 500
 
 
+@recebimento_bp.route('/api/lotes/nota-fiscal', methods=['POST'])
+def api_receber_nota_fiscal():
+    """
+    API para receber todos os lotes de uma nota fiscal de uma vez.
+
+    Corpo: {numero_nota_fiscal, data_recebimento, observacao, linhas: [{numero_lote,
+    id_item, quantidade, data_fabricacao, data_validade, quantidade_etiquetas}]}.
+    Com `gerar_etiquetas` a resposta traz tambem o PDF com as etiquetas de
+    todos os lotes em `etiquetas_pdf` (base64), usando largura/altura/tamanho_fonte.
+    """
+    try:
+        dados = request.get_json(silent=True)
+        if not isinstance(dados, dict):
+            return jsonify({'error': 'Envie um objeto JSON com o cabecalho e as linhas'}), 400
+
+        linhas = dados.get('linhas') or []
+        if not isinstance(linhas, list):
+            return jsonify({'error': 'linhas deve ser uma lista'}), 400
+        if len(linhas) > LIMITE_LINHAS_NOTA_FISCAL:
+            return jsonify({'error': f'Maximo de {LIMITE_LINHAS_NOTA_FISCAL} lotes por nota fiscal'}), 400
+
+        gerar_etiquetas = bool(dados.get('gerar_etiquetas'))
+        if gerar_etiquetas:
+            # Conferido antes de salvar: um erro no PDF depois faria o cliente
+            # repetir o envio e gravar a nota fiscal duas vezes
+            try:
+                largura_mm, altura_mm = ler_medidas(dados)
+                tamanho_fonte_base = int(ler_tamanho_fonte(dados.get('tamanho_fonte')))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            try:
+                copias = [max(1, int(linha.get('quantidade_etiquetas', 1)))
+                          if isinstance(linha, dict) else 1 for linha in linhas]
+            except (TypeError, ValueError):
+                return jsonify({'error': 'Quantidade de etiquetas deve ser um numero'}), 400
+
+        lotes, erros = receber_nota_fiscal(
+            numero_nota_fiscal=dados.get('numero_nota_fiscal'),
+            linhas=linhas,
+            data_recebimento=dados.get('data_recebimento'),
+            observacao=dados.get('observacao')
+        )
+
+        if erros:
+            return jsonify({'error': 'Nota fiscal com erros; nenhum lote foi salvo', 'erros': erros}), 400
+
+        resposta = {
+            'success': True,
+            'message': f'{len(lotes)} lote(s) da nota fiscal salvos com sucesso!',
+            'lotes': lotes
+        }
+
+        if gerar_etiquetas:
+            itens = buscar_itens_por_numeros({lote['id_item'] for lote in lotes if lote['id_item']})
+            etiquetas = []
+            for lote, quantidade_etiquetas in zip(lotes, copias):
+                item = itens.get(lote['id_item']) or {}
+                etiquetas.append(({
+                    'numero_lote': lote['numero_lote'],
+                    'id_item': lote['id_item'] or '',
+                    'descricao_item': item.get('descricao') or '',
+                    'data_recebimento': formatar_data(lote['data_recebimento']),
+                    'data_fabricacao': formatar_data(lote['data_fabricacao']),
+                    'data_validade': formatar_data(lote['data_validade']),
+                    'quantidade': lote['quantidade'] if lote['quantidade'] is not None else '',
+                    'numero_nota_fiscal': lote['numero_nota_fiscal'],
+                    'observacao': lote['observacao'] or ''
+                }, quantidade_etiquetas))
+
+            buffer, agora_brasilia = gerar_pdf_etiquetas(etiquetas, largura_mm, altura_mm, tamanho_fonte_base)
+            resposta['etiquetas_pdf'] = base64.b64encode(buffer.getvalue()).decode('ascii')
+            resposta['etiquetas_nome_arquivo'] = (
+                f"etiquetas_nf_{lotes[0]['numero_nota_fiscal']}_{agora_brasilia.strftime('%Y%m%d_%H%M%S')}.pdf"
+            )
+
+        return jsonify(resposta)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @recebimento_bp.route('/api/lotes/<int:lote_id>', methods=['PUT'])
 def api_atualizar_lote(lote_id):
     """API para atualizar lote existente"""
@@ -135,17 +358,24 @@ def api_atualizar_lote(lote_id):
             data_validade=dados.get('data_validade', '').strip() or None,
             quantidade=quantidade_valor,
             numero_nota_fiscal=dados.get('numero_nota_fiscal', '').strip() or None,
-            observacao=dados.get('observacao', '').strip() or None
+            observacao=dados.get('observacao', '').strip() or None,
+            versao=versao_if_match()
         )
 
         if erro:
             return jsonify({'error': erro}), 400
 
-        return jsonify({
+        return com_etag(jsonify({
             'success': True,
             'message': 'Lote atualizado com sucesso!',
             'lote': lote
-        })
+        }), lote)
+
+    except ConflitoVersao as e:
+        return com_etag(jsonify({
+            'error': 'Lote alterado por outro usuario. Recarregue e tente novamente.',
+            'lote': e.registro
+        }), e.registro), 409
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -161,238 +391,22 @@ def api_deletar_lote(lote_id):
 def api_gerar_etiqueta():
     """API para gerar etiqueta em PDF com QR Code"""
     try:
-        from reportlab.pdfgen import canvas
-        from reportlab.lib.units import mm
-        from datetime import timedelta
-
         dados = request.json
 
         # Configuracoes da etiqueta
-        largura_mm = float(dados.get('largura', 100))
-        altura_mm = float(dados.get('altura', 75))
-        tamanho_fonte_base = int(dados.get('tamanho_fonte', 8))
+        try:
+            largura_mm, altura_mm = ler_medidas(dados)
+            tamanho_fonte_base = int(ler_tamanho_fonte(dados.get('tamanho_fonte')))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         quantidade_etiquetas = int(dados.get('quantidade_etiquetas', 1))
         quantidade_etiquetas = max(1, quantidade_etiquetas)
 
-        # Converter mm para pontos
-        largura = largura_mm * mm
-        altura = altura_mm * mm
-
-        # Criar buffer para o PDF
-        buffer = io.BytesIO()
-
-        # Criar o canvas PDF
-        c = canvas.Canvas(buffer, pagesize=(largura, altura))
-
-        # Sistema adaptativo de fonte
-        if largura <= 60 * mm or altura <= 50 * mm:
-            x_margin = 1.5 * mm
-            y_margin = 1.5 * mm
-            tamanho_fonte = max(4, tamanho_fonte_base - 2)
-            titulo_fonte = tamanho_fonte + 1
-            lote_fonte = tamanho_fonte + 1
-            rodape_fonte = tamanho_fonte - 1
-            line_height = tamanho_fonte * 1.0
-            section_space = line_height * 0.2
-        elif largura <= 90 * mm or altura <= 70 * mm:
-            x_margin = 2 * mm
-            y_margin = 2 * mm
-            tamanho_fonte = max(5, tamanho_fonte_base - 1)
-            titulo_fonte = tamanho_fonte + 2
-            lote_fonte = tamanho_fonte + 2
-            rodape_fonte = tamanho_fonte - 1
-            line_height = tamanho_fonte * 1.05
-            section_space = line_height * 0.3
-        else:
-            x_margin = 3 * mm
-            y_margin = 3 * mm
-            tamanho_fonte = tamanho_fonte_base
-            titulo_fonte = tamanho_fonte + 3
-            lote_fonte = tamanho_fonte + 2
-            rodape_fonte = tamanho_fonte - 2
-            line_height = tamanho_fonte * 1.1
-            section_space = line_height * 0.4
-
-        area_util_largura = largura - (2 * x_margin)
-        area_util_altura = altura - (2 * y_margin)
-        y_start = altura - y_margin - (titulo_fonte + 2)
-
-        # Gerar codigo para QR Code - somente ID do Item
-        numero_lote = dados.get('numero_lote', '').strip()
-        id_item_qr = dados.get('id_item', '').strip()
-
-        # QR Code contem apenas o ID do Item
-        codigo_qr = id_item_qr if id_item_qr else 'SEM_ID'
-        # Garantir que e ASCII puro
-        codigo_qr = codigo_qr.encode('ascii', 'replace').decode('ascii')
-
-        # Gerar QR Code
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_M,
-            box_size=4,
-            border=2,
+        buffer, agora_brasilia = gerar_pdf_etiquetas(
+            [(dados, quantidade_etiquetas)], largura_mm, altura_mm, tamanho_fonte_base
         )
-        qr.add_data(codigo_qr)
-        qr.make(fit=True)
-        qr_img = qr.make_image(fill_color="black", back_color="white")
-
-        # Loop para gerar multiplas etiquetas
-        for etiqueta_num in range(quantidade_etiquetas):
-            texto_largura = area_util_largura
-            y = y_start
-
-            # TITULO PRINCIPAL
-            c.setFont("Helvetica-Bold", titulo_fonte)
-            titulo = "CONTROLE DE LOTE"
-            titulo_largura = c.stringWidth(titulo, "Helvetica-Bold", titulo_fonte)
-            titulo_x = (largura - titulo_largura) / 2
-            c.drawString(titulo_x, y, titulo)
-            y -= titulo_fonte * 1.0
-
-            # NUMERO DO LOTE
-            if numero_lote:
-                c.setFont("Helvetica-Bold", lote_fonte)
-                lote_texto = f"LOTE: {numero_lote}"
-                lote_largura = c.stringWidth(lote_texto, "Helvetica-Bold", lote_fonte)
-                lote_x = (largura - lote_largura) / 2
-                c.drawString(lote_x, y, lote_texto)
-                y -= line_height * 1.0
-
-            # ID DO ITEM
-            id_item = dados.get('id_item', '')
-            if id_item:
-                c.setFont("Helvetica-Bold", tamanho_fonte)
-                item_texto = f"ID Item: {id_item}"
-                item_largura = c.stringWidth(item_texto, "Helvetica-Bold", tamanho_fonte)
-                item_x = (largura - item_largura) / 2
-                c.drawString(item_x, y, item_texto)
-                y -= line_height
-
-            # DESCRICAO DO ITEM
-            descricao_item = dados.get('descricao_item', '')
-            if descricao_item:
-                c.setFont("Helvetica", tamanho_fonte)
-                # Limitar descricao para caber na etiqueta
-                desc_max = max(40, int(texto_largura / (tamanho_fonte * 0.5)))
-                desc_texto = descricao_item[:desc_max] + "..." if len(descricao_item) > desc_max else descricao_item
-                desc_largura = c.stringWidth(desc_texto, "Helvetica", tamanho_fonte)
-                desc_x = (largura - desc_largura) / 2
-                c.drawString(desc_x, y, desc_texto)
-                y -= line_height
-
-            # INFORMACOES
-            c.setFont("Helvetica", tamanho_fonte)
-
-            data_recebimento = dados.get('data_recebimento', '')
-            data_fabricacao = dados.get('data_fabricacao', '')
-            data_validade = dados.get('data_validade', '')
-
-            if data_recebimento:
-                rec_texto = f"Recebimento: {data_recebimento}"
-                rec_largura = c.stringWidth(rec_texto, "Helvetica", tamanho_fonte)
-                rec_x = (largura - rec_largura) / 2
-                c.drawString(rec_x, y, rec_texto)
-                y -= line_height
-
-            if data_fabricacao:
-                fab_texto = f"Fabricacao: {data_fabricacao}"
-                fab_largura = c.stringWidth(fab_texto, "Helvetica", tamanho_fonte)
-                fab_x = (largura - fab_largura) / 2
-                c.drawString(fab_x, y, fab_texto)
-                y -= line_height
-
-            if data_validade:
-                c.setFont("Helvetica-Bold", tamanho_fonte)
-                val_texto = f"Validade: {data_validade}"
-                val_largura = c.stringWidth(val_texto, "Helvetica-Bold", tamanho_fonte)
-                val_x = (largura - val_largura) / 2
-                c.drawString(val_x, y, val_texto)
-                c.setFont("Helvetica", tamanho_fonte)
-                y -= line_height
-
-            # Nota Fiscal
-            numero_nota_fiscal = dados.get('numero_nota_fiscal', '')
-            if numero_nota_fiscal:
-                nf_texto = f"Nota Fiscal: {numero_nota_fiscal}"
-                nf_largura = c.stringWidth(nf_texto, "Helvetica", tamanho_fonte)
-                nf_x = (largura - nf_largura) / 2
-                c.drawString(nf_x, y, nf_texto)
-                y -= line_height
-
-            # Quantidade
-            quantidade_prod = dados.get('quantidade', '')
-            if quantidade_prod:
-                qtd_texto = f"Quantidade: {quantidade_prod}"
-                qtd_largura = c.stringWidth(qtd_texto, "Helvetica", tamanho_fonte)
-                qtd_x = (largura - qtd_largura) / 2
-                c.drawString(qtd_x, y, qtd_texto)
-                y -= line_height
-
-            # Observacao
-            observacao = dados.get('observacao', '')
-            if observacao and len(observacao) > 0 and y > (y_margin + line_height * 3):
-                y -= section_space * 0.5
-                obs_fonte = max(3, tamanho_fonte - 1)
-                c.setFont("Helvetica", obs_fonte)
-                obs_max = max(30, int(texto_largura / (obs_fonte * 0.5)))
-                obs_texto = observacao[:obs_max] + "..." if len(observacao) > obs_max else observacao
-                obs_completo = f"Obs: {obs_texto}"
-                obs_largura = c.stringWidth(obs_completo, "Helvetica", obs_fonte)
-                obs_x = (largura - obs_largura) / 2
-                c.drawString(obs_x, y, obs_completo)
-                y -= line_height * 1.2
-
-            # QR CODE
-            rodape_altura = rodape_fonte + (2 * y_margin)
-            area_qr_inicio = y_margin + rodape_altura + (3 * mm)
-            area_qr_fim = y - (2 * mm)
-            area_qr_altura = area_qr_fim - area_qr_inicio
-
-            if largura <= 60 * mm or altura <= 50 * mm:
-                qr_size_largura = largura * 0.25
-                qr_size_altura = area_qr_altura * 0.60
-            elif largura <= 90 * mm or altura <= 70 * mm:
-                qr_size_largura = largura * 0.30
-                qr_size_altura = area_qr_altura * 0.70
-            else:
-                qr_size_largura = largura * 0.35
-                qr_size_altura = area_qr_altura * 0.85
-
-            qr_size = min(qr_size_largura, qr_size_altura)
-
-            if largura <= 60 * mm or altura <= 50 * mm:
-                qr_size = max(8 * mm, min(qr_size, 18 * mm))
-            elif largura <= 90 * mm or altura <= 70 * mm:
-                qr_size = max(10 * mm, min(qr_size, 25 * mm))
-            else:
-                qr_size = max(12 * mm, min(qr_size, 40 * mm))
-
-            qr_x = (largura - qr_size) / 2
-            qr_y = area_qr_inicio + ((area_qr_altura - qr_size) / 2)
-
-            c.drawInlineImage(qr_img, qr_x, qr_y, qr_size, qr_size)
-
-            # RODAPE
-            agora_brasilia = datetime.now() - timedelta(hours=3)
-            data_geracao = agora_brasilia.strftime('%d/%m/%Y %H:%M')
-
-            rodape_y = y_margin + rodape_fonte
-
-            c.setFont("Helvetica", rodape_fonte)
-            rodape_texto = f"ID: {codigo_qr}  |  Gerado: {data_geracao}"
-            rodape_largura = c.stringWidth(rodape_texto, "Helvetica", rodape_fonte)
-            rodape_x = (largura - rodape_largura) / 2
-            c.drawString(rodape_x, rodape_y, rodape_texto)
-
-            # Criar nova pagina se nao for a ultima etiqueta
-            if etiqueta_num < quantidade_etiquetas - 1:
-                c.showPage()
-
-        # Finalizar
-        c.save()
-        buffer.seek(0)
 
+        numero_lote = dados.get('numero_lote', '').strip()
         nome_arquivo = f'etiqueta_{numero_lote or "sem_lote"}_{agora_brasilia.strftime("%Y%m%d_%H%M%S")}.pdf'
 
         return send_file(
@@ -1,51 +1,90 @@
-import json
 import os
 from datetime import datetime
 
+from lib.backend.armazenamento import criar_armazenamento
+from lib.backend.itens.service import buscar_itens_por_numeros
+from lib.backend.recebimento.analise import AnaliseLotes
+from lib.backend.recebimento.indice import IndiceLotes
+
 DATA_PATH = os.path.join(os.path.dirname(__file__), 'data', 'lotes.json')
 
+# Os lotes podem usar um backend proprio ('journal' grava cada lote como uma
+# linha em lotes.journal em vez de reescrever o lotes.json)
+ARMAZENAMENTO = os.environ.get('RECEBIMENTO_ARMAZENAMENTO')
+CAMPOS_DATA = ('data_recebimento', 'data_fabricacao', 'data_validade')
+LIMITE_COMPACTACAO = int(os.environ.get('RECEBIMENTO_JOURNAL_LIMITE', '1000'))
+
+armazenamento = criar_armazenamento('lotes', DATA_PATH, 'ultimo_id',
+                                    tipo=ARMAZENAMENTO, limite_compactacao=LIMITE_COMPACTACAO)
+indice = IndiceLotes(armazenamento)
+analise = AnaliseLotes(indice)
+
 
 def carregar_lotes():
-    """Carrega dados do arquivo JSON"""
-    try:
-        with open(DATA_PATH, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {"lotes": [], "ultimo_id": 0}
+    """Carrega dados do armazenamento"""
+    return armazenamento.carregar()
 
 
 def salvar_lotes(dados):
-    """Salva dados no arquivo JSON"""
-    with open(DATA_PATH, 'w', encoding='utf-8') as f:
-        json.dump(dados, f, ensure_ascii=False, indent=2)
+    """Salva dados no armazenamento"""
+    armazenamento.substituir(dados)
+
+
+def versao_lotes():
+    """Versao dos dados de lotes (muda a cada gravacao)"""
+    return armazenamento.assinatura()
 
 
 def listar_lotes():
-    """Lista todos os lotes"""
-    dados = carregar_lotes()
-    # Retornar ordenado por data de cadastro (mais recente primeiro)
-    lotes = dados.get('lotes', [])
-    return sorted(lotes, key=lambda x: x.get('dt_cadastro', ''), reverse=True)
+    """Lista todos os lotes (mais recente primeiro)"""
+    return indice.listar()
+
+
+def consultar_lotes(limite=20, pagina=1, cursor=None, data_inicio=None, data_fim=None,
+                    numero_lote=None, id_item=None, numero_nota_fiscal=None):
+    """Consulta paginada: retorna (lotes, total_filtrado, proximo_cursor)"""
+    return indice.consultar(limite, pagina, cursor, data_inicio, data_fim,
+                            numero_lote, id_item, numero_nota_fiscal)
+
+
+def lotes_por_validade(data_inicio=None, data_fim=None):
+    """Lotes com validade no intervalo (AAAA-MM-DD, inclusive), o que vence antes primeiro"""
+    return indice.por_validade(data_inicio, data_fim)
+
+
+def lotes_por_item(id_item):
+    """Lotes de um item (mais recente primeiro)"""
+    return indice.buscar_por('id_item', id_item)
+
+
+def lotes_por_nota_fiscal(numero_nota_fiscal):
+    """Lotes recebidos em uma nota fiscal (mais recente primeiro)"""
+    return indice.buscar_por('numero_nota_fiscal', numero_nota_fiscal)
+
+
+def lotes_por_numero(numero_lote):
+    """Lotes com esse numero de lote (mais recente primeiro)"""
+    return indice.buscar_por('numero_lote', numero_lote.upper())
+
+
+def analisar_lotes():
+    """
+    Painel dos lotes: estoque por item, quantidade que vence por semana e
+    volume recebido por dia (em cache ate a proxima gravacao de lotes)
+    """
+    return analise.resultado()
 
 
 def buscar_lote_por_id(lote_id):
     """Busca lote pelo ID"""
-    dados = carregar_lotes()
-    for lote in dados.get('lotes', []):
-        if lote['id'] == lote_id:
-            return lote
-    return None
+    return armazenamento.buscar(lote_id)
 
 
 def criar_lote(numero_lote, id_item=None, data_recebimento=None, data_fabricacao=None, data_validade=None,
                quantidade=None, numero_nota_fiscal=None, observacao=None):
     """Cria um novo lote"""
-    dados = carregar_lotes()
-
-    novo_id = dados.get('ultimo_id', 0) + 1
-
-    novo_lote = {
-        'id': novo_id,
+    novo_lote = indice.inserir({
+        'id': None,
         'numero_lote': numero_lote.upper(),
         'id_item': id_item,
         'data_recebimento': data_recebimento,
@@ -55,54 +94,152 @@ def criar_lote(numero_lote, id_item=None, data_recebimento=None, data_fabricacao
         'numero_nota_fiscal': numero_nota_fiscal,
         'observacao': observacao,
         'dt_cadastro': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    }
+    })
 
-    dados['lotes'].append(novo_lote)
-    dados['ultimo_id'] = novo_id
-
-    salvar_lotes(dados)
     return novo_lote, None
 
 
 def atualizar_lote(lote_id, numero_lote=None, id_item=None, data_recebimento=None, data_fabricacao=None,
-                  data_validade=None, quantidade=None, numero_nota_fiscal=None, observacao=None):
-    """Atualiza um lote existente"""
-    dados = carregar_lotes()
-
-    for i, lote in enumerate(dados.get('lotes', [])):
-        if lote['id'] == lote_id:
-            if numero_lote is not None:
-                dados['lotes'][i]['numero_lote'] = numero_lote.upper()
-            if id_item is not None:
-                dados['lotes'][i]['id_item'] = id_item
-            if data_recebimento is not None:
-                dados['lotes'][i]['data_recebimento'] = data_recebimento
-            if data_fabricacao is not None:
-                dados['lotes'][i]['data_fabricacao'] = data_fabricacao
-            if data_validade is not None:
-                dados['lotes'][i]['data_validade'] = data_validade
-            if quantidade is not None:
-                dados['lotes'][i]['quantidade'] = quantidade
-            if numero_nota_fiscal is not None:
-                dados['lotes'][i]['numero_nota_fiscal'] = numero_nota_fiscal
-            if observacao is not None:
-                dados['lotes'][i]['observacao'] = observacao
-            dados['lotes'][i]['dt_atualizacao'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-            salvar_lotes(dados)
-            return dados['lotes'][i], None
-
-    return None, "Lote nao encontrado"
+                  data_validade=None, quantidade=None, numero_nota_fiscal=None, observacao=None, versao=None):
+    """Atualiza um lote existente (levanta ConflitoVersao se a versao nao bater)"""
+    lote = armazenamento.buscar(lote_id)
+    if lote is None:
+        return None, "Lote nao encontrado"
+
+    lote = dict(lote)
+    if numero_lote is not None:
+        lote['numero_lote'] = numero_lote.upper()
+    if id_item is not None:
+        lote['id_item'] = id_item
+    if data_recebimento is not None:
+        lote['data_recebimento'] = data_recebimento
+    if data_fabricacao is not None:
+        lote['data_fabricacao'] = data_fabricacao
+    if data_validade is not None:
+        lote['data_validade'] = data_validade
+    if quantidade is not None:
+        lote['quantidade'] = quantidade
+    if numero_nota_fiscal is not None:
+        lote['numero_nota_fiscal'] = numero_nota_fiscal
+    if observacao is not None:
+        lote['observacao'] = observacao
+    lote['dt_atualizacao'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    lote = indice.salvar(lote, versao_esperada=versao)
+    if lote is None:
+        return None, "Lote nao encontrado"
+    return lote, None
 
 
 def deletar_lote(lote_id):
     """Deleta um lote"""
-    dados = carregar_lotes()
+    lote_removido = indice.remover(lote_id)
+    if lote_removido is None:
+        return None, "Lote nao encontrado"
+    return lote_removido, None
+
+
+def _texto(valor):
+    """Campo de texto opcional (None/vazio -> None)"""
+    if valor is None:
+        return None
+    return str(valor).strip() or None
+
+
+def _validar_data(valor):
+    """Data opcional no formato AAAA-MM-DD; retorna a mensagem de erro ou None"""
+    if valor is None:
+        return None
+    try:
+        datetime.strptime(valor, '%Y-%m-%d')
+    except ValueError:
+        return 'deve estar no formato AAAA-MM-DD'
+    return None
 
-    for i, lote in enumerate(dados.get('lotes', [])):
-        if lote['id'] == lote_id:
-            lote_removido = dados['lotes'].pop(i)
-            salvar_lotes(dados)
-            return lote_removido, None
 
-    return None, "Lote nao encontrado"
+def receber_nota_fiscal(numero_nota_fiscal, linhas, data_recebimento=None, observacao=None):
+    """
+    Recebe todos os lotes de uma nota fiscal.
+
+    O cabecalho (numero da nota, data de recebimento, observacao) vale para
+    todas as linhas; cada linha tem numero_lote, id_item, quantidade e as
+    datas (a linha pode sobrescrever data_recebimento e observacao). Os
+    id_item sao conferidos no catalogo de itens de uma vez e, se tudo estiver
+    valido, os lotes sao gravados em uma unica gravacao.
+
+    Retorna (lotes, erros): `erros` e uma lista de {'linha', 'erro'} (linha
+    comeca em 1; 0 e o cabecalho) e, com erro, nada e gravado.
+    """
+    erros = []
+    numero_nota_fiscal = _texto(numero_nota_fiscal)
+    data_recebimento = _texto(data_recebimento)
+    observacao = _texto(observacao)
+
+    if not numero_nota_fiscal:
+        erros.append({'linha': 0, 'erro': 'Numero da nota fiscal e obrigatorio'})
+    erro_data = _validar_data(data_recebimento)
+    if erro_data:
+        erros.append({'linha': 0, 'erro': f'data_recebimento {erro_data}'})
+    if not linhas:
+        erros.append({'linha': 0, 'erro': 'Informe ao menos um lote'})
+    if erros:
+        return [], erros
+
+    agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    novos = []
+    numeros_linha = []
+    for numero_linha, linha in enumerate(linhas, start=1):
+        if not isinstance(linha, dict):
+            erros.append({'linha': numero_linha, 'erro': 'Linha invalida'})
+            continue
+
+        numero_lote = _texto(linha.get('numero_lote'))
+        if not numero_lote:
+            erros.append({'linha': numero_linha, 'erro': 'Numero do lote e obrigatorio'})
+
+        quantidade = linha.get('quantidade')
+        if isinstance(quantidade, str):
+            quantidade = quantidade.strip() or None
+        if quantidade is not None:
+            try:
+                quantidade = float(quantidade)
+            except (TypeError, ValueError):
+                erros.append({'linha': numero_linha, 'erro': 'Quantidade deve ser um numero valido'})
+
+        datas = {}
+        for campo in CAMPOS_DATA:
+            valor = _texto(linha.get(campo))
+            if campo == 'data_recebimento' and valor is None:
+                valor = data_recebimento
+            erro_data = _validar_data(valor)
+            if erro_data:
+                erros.append({'linha': numero_linha, 'erro': f'{campo} {erro_data}'})
+            datas[campo] = valor
+
+        numeros_linha.append(numero_linha)
+        novos.append({
+            'id': None,
+            'numero_lote': (numero_lote or '').upper(),
+            'id_item': _texto(linha.get('id_item')),
+            'data_recebimento': datas['data_recebimento'],
+            'data_fabricacao': datas['data_fabricacao'],
+            'data_validade': datas['data_validade'],
+            'quantidade': quantidade,
+            'numero_nota_fiscal': numero_nota_fiscal,
+            'observacao': _texto(linha.get('observacao')) or observacao,
+            'dt_cadastro': agora
+        })
+
+    # Uma consulta ao catalogo para todos os itens da nota
+    numeros = {lote['id_item'] for lote in novos if lote['id_item']}
+    encontrados = buscar_itens_por_numeros(numeros)
+    for numero_linha, lote in zip(numeros_linha, novos):
+        if lote['id_item'] and lote['id_item'] not in encontrados:
+            erros.append({'linha': numero_linha, 'erro': f"Item {lote['id_item']} nao encontrado"})
+
+    if erros:
+        erros.sort(key=lambda erro: erro['linha'])
+        return [], erros
+
+    inseridos, _, _ = indice.aplicar(inserir=novos)
+    return inseridos, []